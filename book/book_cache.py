@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from redis.exceptions import RedisError
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+LIST_VERSION_KEY = "book:list:version"
+STATS_KEYS = {"hits": "book:cache:hits", "misses": "book:cache:misses"}
+
+
+def _cache():
+    return caches[settings.BOOK_CACHE_ALIAS]
+
+
+def _book_version_key(book_id: int) -> str:
+    return f"book:{book_id}:version"
+
+
+class _CacheStats:
+    """Hit/miss counters shared by all workers through the cache.
+
+    Counts are accumulated in-process and flushed with one INCR per counter
+    every BOOK_CACHE_STATS_FLUSH_EVERY events, so the hot path does not pay
+    an extra round trip per request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = dict.fromkeys(STATS_KEYS, 0)
+
+    def record(self, name: str) -> None:
+        with self._lock:
+            self._pending[name] += 1
+            if sum(self._pending.values()) < settings.BOOK_CACHE_STATS_FLUSH_EVERY:
+                return
+            pending, self._pending = self._pending, dict.fromkeys(STATS_KEYS, 0)
+        self._flush(pending)
+
+    def _flush(self, pending: dict) -> None:
+        cache = _cache()
+        try:
+            for name, count in pending.items():
+                if not count:
+                    continue
+                if not cache.add(STATS_KEYS[name], count, timeout=None):
+                    cache.incr(STATS_KEYS[name], count)
+        except (RedisError, ValueError) as exc:
+            logger.warning("Book cache stats were not flushed: %s", exc)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pending, self._pending = self._pending, dict.fromkeys(STATS_KEYS, 0)
+        self._flush(pending)
+        try:
+            stored = _cache().get_many(list(STATS_KEYS.values()))
+        except RedisError as exc:
+            logger.warning("Book cache stats are unavailable: %s", exc)
+            stored = {}
+        stats = {name: stored.get(key, 0) for name, key in STATS_KEYS.items()}
+        requests = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / requests, 4) if requests else None
+        return stats
+
+
+stats = _CacheStats()
+
+
+def _get_version(key: str) -> int:
+    cache = _cache()
+    version = cache.get(key)
+    if version is None:
+        # A nanosecond timestamp keeps versions increasing even after the
+        # version key expired or was evicted before its payloads.
+        cache.add(key, time.time_ns(), settings.BOOK_CACHE_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key: str) -> None:
+    try:
+        _cache().incr(key)
+    except ValueError:
+        pass
+
+
+def _request_digest(request: Request) -> str:
+    return hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+
+
+def list_cache_key(request: Request) -> str:
+    version = _get_version(LIST_VERSION_KEY)
+    return f"book:list:v{version}:{_request_digest(request)}"
+
+
+def detail_cache_key(request: Request, book_id: int) -> str:
+    version = _get_version(_book_version_key(book_id))
+    return f"book:{book_id}:v{version}:{_request_digest(request)}"
+
+
+def cached_response(
+    get_key: Callable[[], str], build_response: Callable[[], Response]
+) -> Response:
+    """Serve a serialized payload from the cache or build and store it.
+
+    Cache failures never fail the request; the response is built from the
+    database instead.
+    """
+    try:
+        key = get_key()
+        data = _cache().get(key)
+    except RedisError as exc:
+        logger.warning("Book cache is unavailable: %s", exc)
+        return build_response()
+
+    if data is not None:
+        stats.record("hits")
+        return Response(data)
+
+    stats.record("misses")
+    response = build_response()
+    if response.status_code == status.HTTP_200_OK:
+        try:
+            _cache().set(key, response.data, settings.BOOK_CACHE_TIMEOUT)
+        except RedisError as exc:
+            logger.warning("Book cache is unavailable: %s", exc)
+    return response
+
+
+def _invalidate(book_id: int) -> None:
+    try:
+        _bump_version(_book_version_key(book_id))
+        _bump_version(LIST_VERSION_KEY)
+    except RedisError as exc:
+        logger.warning("Book cache was not invalidated: %s", exc)
+
+
+def invalidate_book(book_id: int) -> None:
+    """Make cached list pages and the detail payload of a book stale.
+
+    Versions are bumped once the surrounding transaction commits, so no
+    cache round trip happens while the caller holds the book's row lock.
+    """
+    transaction.on_commit(lambda: _invalidate(book_id))
+
+
+def _invalidate_many(book_ids: list) -> None:
+    try:
+        _cache().delete_many([_book_version_key(book_id) for book_id in book_ids])
+        _bump_version(LIST_VERSION_KEY)
+    except RedisError as exc:
+        logger.warning("Book cache was not invalidated: %s", exc)
+
+
+def invalidate_books(book_ids: list) -> None:
+    """Bulk variant of invalidate_book for batch writes.
+
+    Dropping a version key is enough to make the payloads under it
+    unreachable, and it takes one round trip for the whole batch, once the
+    surrounding transaction commits.
+    """
+    book_ids = list(book_ids)
+    transaction.on_commit(lambda: _invalidate_many(book_ids))
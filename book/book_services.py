@@ -0,0 +1,288 @@
+import csv
+import json
+from datetime import date, timedelta
+from itertools import islice
+from typing import IO, Iterable, Iterator
+
+from django.conf import settings
+from django.db import DataError, connection, transaction
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+
+from book.book_cache import invalidate_book, invalidate_books
+from book.models import Book, BookInventoryShard
+from book.serializers import BookImportSerializer
+
+IMPORT_FORMATS = ("csv", "ndjson")
+IMPORT_UNIQUE_FIELDS = ("title", "author", "cover")
+
+
+def enable_inventory_sharding(book: Book, shards: int = None) -> None:
+    shards = shards or settings.BOOK_INVENTORY_SHARDS
+    with transaction.atomic():
+        BookInventoryShard.objects.bulk_create(
+            [BookInventoryShard(book=book, shard=number) for number in range(shards)],
+            ignore_conflicts=True,
+        )
+        Book.objects.filter(pk=book.pk).update(is_sharded=True)
+        book.is_sharded = True
+        compact_book_inventory(book.pk)
+
+
+def disable_inventory_sharding(book: Book) -> None:
+    with transaction.atomic():
+        Book.objects.filter(pk=book.pk).update(is_sharded=False)
+        book.is_sharded = False
+        compact_book_inventory(book.pk)
+
+
+def compact_book_inventory(book_id: int) -> None:
+    """Fold the shards of a book back together.
+
+    A sharded book gets its whole stock spread evenly over its shards again,
+    so reservations stop missing on drained shards. A book that is no longer
+    sharded gets its stock moved back to the book row and the shards removed.
+    """
+    invalidate_book(book_id)
+    with transaction.atomic():
+        book = Book.objects.select_for_update().get(pk=book_id)
+        shards = list(
+            BookInventoryShard.objects.select_for_update()
+            .filter(book_id=book_id)
+            .order_by("shard")
+        )
+        total = book.inventory + sum(shard.count for shard in shards)
+
+        if not book.is_sharded or not shards:
+            Book.objects.filter(pk=book_id).update(inventory=total, is_sharded=False)
+            BookInventoryShard.objects.filter(book_id=book_id).delete()
+            return
+
+        per_shard, remainder = divmod(total, len(shards))
+        for number, shard in enumerate(shards):
+            shard.count = per_shard + (1 if number < remainder else 0)
+        BookInventoryShard.objects.bulk_update(shards, ["count"])
+        Book.objects.filter(pk=book_id).update(inventory=0)
+
+
+def compact_inventory_shards() -> None:
+    """Periodic task: switch hot books to sharded inventory and compact shards.
+
+    A book is sharded while it was borrowed at least
+    BOOK_INVENTORY_SHARDING_THRESHOLD times per day over the last
+    BOOK_INVENTORY_SHARDING_WINDOW_DAYS days.
+    """
+    window_days = settings.BOOK_INVENTORY_SHARDING_WINDOW_DAYS
+    threshold = settings.BOOK_INVENTORY_SHARDING_THRESHOLD * window_days
+    since = date.today() - timedelta(days=window_days)
+
+    books = Book.objects.annotate(
+        recent_borrows=Count(
+            "borrows_books",
+            filter=Q(borrows_books__borrow_date__gte=since),
+            distinct=True,
+        ),
+        shards_count=Count("inventory_shards", distinct=True),
+    ).filter(
+        Q(is_sharded=True) | Q(recent_borrows__gte=threshold) | Q(shards_count__gt=0)
+    )
+
+    for book in books.iterator():
+        is_hot = book.recent_borrows >= threshold
+        if is_hot and not book.is_sharded:
+            enable_inventory_sharding(book)
+        elif not is_hot and book.is_sharded:
+            disable_inventory_sharding(book)
+        else:
+            compact_book_inventory(book.pk)
+
+
+class UndecodableLine(str):
+    """A line that is not valid text, decoded with replacement characters."""
+
+
+def iter_text_lines(stream: IO[bytes], encoding: str = "utf-8") -> Iterator[str]:
+    for line in iter(stream.readline, b""):
+        try:
+            yield line.decode(encoding)
+        except UnicodeDecodeError:
+            yield UndecodableLine(line.decode(encoding, errors="replace"))
+
+
+def _undecodable_row_error() -> ValidationError:
+    return ValidationError({"non_field_errors": ["Invalid text encoding."]})
+
+
+def _read_csv_rows(lines: Iterable[str]) -> Iterator:
+    # A row may span several lines, so remember whether any of them failed.
+    undecodable = False
+
+    def tracked_lines():
+        nonlocal undecodable
+        for line in lines:
+            undecodable = undecodable or isinstance(line, UndecodableLine)
+            yield line
+
+    reader = csv.DictReader(tracked_lines())
+    # A broken header already fails every row on its missing columns.
+    reader.fieldnames
+    undecodable = False
+    for row in reader:
+        if undecodable:
+            undecodable = False
+            yield _undecodable_row_error()
+            continue
+        yield row
+
+
+def _read_ndjson_rows(lines: Iterable[str]) -> Iterator:
+    for line in lines:
+        if isinstance(line, UndecodableLine):
+            yield _undecodable_row_error()
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield ValidationError({"non_field_errors": ["Invalid JSON."]})
+            continue
+        if not isinstance(row, dict):
+            yield ValidationError({"non_field_errors": ["Expected a JSON object."]})
+            continue
+        yield row
+
+
+def _import_batch(batch: list, report: dict) -> None:
+    validator = BookImportSerializer()
+    books = {}
+    for number, row in batch:
+        try:
+            if isinstance(row, ValidationError):
+                raise row
+            data = validator.run_validation(row)
+        except ValidationError as exc:
+            report["failed"] += 1
+            report["errors"].append({"row": number, "errors": exc.detail})
+            continue
+        key = tuple(data[field] for field in IMPORT_UNIQUE_FIELDS)
+        books[key] = Book(**data)
+
+    if not books:
+        return
+
+    with transaction.atomic():
+        imported = Book.objects.bulk_create(
+            books.values(),
+            update_conflicts=True,
+            unique_fields=IMPORT_UNIQUE_FIELDS,
+            update_fields=("inventory", "daily_fee"),
+        )
+        book_ids = [book.pk for book in imported]
+        BookInventoryShard.objects.filter(book_id__in=book_ids).update(count=0)
+        invalidate_books(book_ids)
+    report["imported"] += len(imported)
+
+
+def import_books(
+    lines: Iterable[str], file_format: str, batch_size: int = None
+) -> dict:
+    """Upsert books from a CSV or NDJSON stream.
+
+    Rows are read lazily and written in batches of BOOK_IMPORT_BATCH_SIZE
+    with INSERT ... ON CONFLICT (title, author, cover) DO UPDATE, so memory
+    stays flat regardless of the input size. Invalid rows are skipped and
+    reported by their 1-based number; the last duplicate of a book within a
+    batch wins.
+    """
+    batch_size = batch_size or settings.BOOK_IMPORT_BATCH_SIZE
+    if file_format == "csv":
+        rows = _read_csv_rows(lines)
+    else:
+        rows = _read_ndjson_rows(lines)
+
+    report = {"imported": 0, "failed": 0, "errors": []}
+    numbered_rows = enumerate(rows, start=1)
+    while batch := list(islice(numbered_rows, batch_size)):
+        _import_batch(batch, report)
+    return report
+
+
+ADJUST_INVENTORY_SQL = """
+    WITH adjustment AS (
+        SELECT *
+        FROM unnest(%s::bigint[], %s::integer[], %s::integer[])
+            AS adjustment(book_id, delta, absolute)
+    ),
+    locked_shard AS (
+        SELECT book_id, count
+        FROM book_bookinventoryshard
+        WHERE book_id IN (SELECT book_id FROM adjustment)
+        FOR UPDATE
+    ),
+    shard_total AS (
+        SELECT book_id, SUM(count) AS total
+        FROM locked_shard
+        GROUP BY book_id
+    )
+    -- Read inventory from the target row, not from a CTE: a reservation
+    -- committed while this UPDATE waits for the row lock is then kept.
+    UPDATE book_book
+    SET inventory = COALESCE(
+        adjustment.absolute,
+        book_book.inventory + COALESCE(shard_total.total, 0) + adjustment.delta
+    )
+    FROM adjustment
+    LEFT JOIN shard_total ON shard_total.book_id = adjustment.book_id
+    WHERE book_book.id = adjustment.book_id AND COALESCE(
+        adjustment.absolute,
+        book_book.inventory + COALESCE(shard_total.total, 0) + adjustment.delta
+    ) >= 0
+    RETURNING book_book.id, book_book.inventory, shard_total.book_id IS NOT NULL
+"""
+
+
+def adjust_inventory(adjustments: list) -> list:
+    """Apply stocktaking results to many books in one UPDATE statement.
+
+    Each adjustment is ``{"id", "delta"}`` or ``{"id", "absolute"}``. Stock
+    held in inventory shards is folded into the book row. Nothing is changed
+    and ValidationError is raised when a book is missing or would end up
+    with a negative inventory.
+    """
+    book_ids = [adjustment["id"] for adjustment in adjustments]
+    deltas = [adjustment.get("delta") for adjustment in adjustments]
+    absolutes = [adjustment.get("absolute") for adjustment in adjustments]
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute(ADJUST_INVENTORY_SQL, [book_ids, deltas, absolutes])
+            except DataError:
+                # A delta pushed an inventory past the integer column.
+                raise ValidationError({"inventory": ["Inventory is out of range."]})
+            updated = cursor.fetchall()
+
+        updated_ids = {book_id for book_id, _, _ in updated}
+        if len(updated_ids) != len(book_ids):
+            missing = [book_id for book_id in book_ids if book_id not in updated_ids]
+            existing = set(
+                Book.objects.filter(pk__in=missing).values_list("pk", flat=True)
+            )
+            errors = {}
+            not_found = [book_id for book_id in missing if book_id not in existing]
+            if not_found:
+                errors["not_found"] = not_found
+            negative = [book_id for book_id in missing if book_id in existing]
+            if negative:
+                errors["negative_inventory"] = negative
+            raise ValidationError(errors)
+
+        with_shards = [book_id for book_id, _, has_shards in updated if has_shards]
+        if with_shards:
+            BookInventoryShard.objects.filter(book_id__in=with_shards).update(count=0)
+        invalidate_books(updated_ids)
+
+    return [
+        {"id": book_id, "inventory": inventory} for book_id, inventory, _ in updated
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:16
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("book", "0002_alter_book_inventory"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="is_sharded",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name="BookInventoryShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField()),
+                (
+                    "count",
+                    models.IntegerField(
+                        default=0,
+                        validators=[django.core.validators.MinValueValidator(0)],
+                    ),
+                ),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="inventory_shards",
+                        to="book.book",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("book", "shard"), name="unique_book_shard"
+                    )
+                ],
+            },
+        ),
+    ]
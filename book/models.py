@@ -1,7 +1,98 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    SearchVectorField,
+    TrigramWordSimilarity,
+)
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models import F, Q, Subquery
+from django.db.models.functions import Greatest
 from rest_framework.exceptions import ValidationError
 
+from book.book_cache import invalidate_book
+
+
+class BookQuerySet(models.QuerySet):
+    def _has_rows(self) -> bool:
+        """Like exists(), but planned without a LIMIT.
+
+        With LIMIT 1 the planner scans the table sequentially for search
+        terms its statistics do not know, typos above all. The materialized
+        CTE keeps the GIN bitmap scan and still stops at the first row.
+        """
+        sql, params = self.values("id").query.sql_with_params()
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"WITH found AS MATERIALIZED ({sql}) "
+                "SELECT EXISTS (SELECT 1 FROM found)",
+                params,
+            )
+            return cursor.fetchone()[0]
+
+    def search(self, text: str) -> "BookQuerySet":
+        """Full-text search over title and author, ranked by relevance.
+
+        When the full-text query matches nothing (usually a typo) the search
+        falls back to trigram similarity. Both branches are served by GIN
+        indexes; the trigram one is kept as a fallback because it rechecks
+        far more candidate rows.
+        """
+        query = SearchQuery(text, search_type="websearch", config="english")
+        matches = self.filter(search_vector=query)
+        # Only whether anything matches decides the branch, the paginator
+        # counts the chosen one anyway.
+        if matches._has_rows():
+            return matches.annotate(
+                rank=SearchRank(F("search_vector"), query)
+            ).order_by("-rank", "-id")
+
+        return (
+            self.annotate(
+                similarity=Greatest(
+                    TrigramWordSimilarity(text, "title"),
+                    TrigramWordSimilarity(text, "author"),
+                )
+            )
+            .filter(
+                Q(title__trigram_word_similar=text)
+                | Q(author__trigram_word_similar=text)
+            )
+            .order_by("-similarity", "-id")
+        )
+
+
+class BookManager(models.Manager.from_queryset(BookQuerySet)):
+    def reserve(self, book_id: int) -> bool:
+        """Take one copy of the book in a single conditional UPDATE.
+
+        Returns False when there is no copy left, so concurrent borrows
+        can never push the inventory below zero. Sharded books keep their
+        stock in BookInventoryShard rows and are served from there.
+        """
+        updated = self.filter(pk=book_id, inventory__gt=0).update(
+            inventory=F("inventory") - 1
+        )
+        reserved = bool(updated) or BookInventoryShard.objects.reserve(book_id)
+        if reserved:
+            invalidate_book(book_id)
+        return reserved
+
+    def release(self, book_id: int) -> bool:
+        """Put one copy of the book back in a single UPDATE."""
+        updated = self.filter(pk=book_id, is_sharded=False).update(
+            inventory=F("inventory") + 1
+        )
+        released = bool(updated) or BookInventoryShard.objects.release(book_id)
+        if not released:
+            updated = self.filter(pk=book_id).update(inventory=F("inventory") + 1)
+            released = bool(updated)
+        if released:
+            invalidate_book(book_id)
+        return released
+
 
 class Book(models.Model):
     class CoverChoices(models.TextChoices):
@@ -13,16 +104,44 @@ class Book(models.Model):
     cover = models.CharField(max_length=255, choices=CoverChoices.choices)
     inventory = models.IntegerField(validators=[MinValueValidator(0)])
     daily_fee = models.DecimalField(max_digits=6, decimal_places=3)
+    is_sharded = models.BooleanField(default=False)
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector("title", weight="A", config="english")
+            + SearchVector("author", weight="B", config="english")
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = BookManager()
+
+    @property
+    def total_inventory(self) -> int:
+        """Inventory of the book including the copies held in its shards."""
+        if not self.is_sharded:
+            return self.inventory
+        shard_inventory = getattr(self, "shard_inventory", None)
+        if shard_inventory is None:
+            shard_inventory = (
+                self.inventory_shards.aggregate(total=models.Sum("count"))["total"] or 0
+            )
+        return self.inventory + shard_inventory
+
+    def _refresh_inventory(self) -> None:
+        # A sharded book may have been served from a shard, leaving the
+        # row's inventory unchanged, so read back what was written.
+        self.refresh_from_db(fields=["inventory"])
+        self.__dict__.pop("shard_inventory", None)
 
     def decrease_on_1_for_inventory(self):
-        if self.inventory == 0:
+        if not Book.objects.reserve(self.pk):
             raise ValidationError("The inventory of this book is 0")
-        self.inventory -= 1
-        self.save()
+        self._refresh_inventory()
 
     def increase_on_1_for_inventory(self):
-        self.inventory += 1
-        self.save()
+        Book.objects.release(self.pk)
+        self._refresh_inventory()
 
     class Meta:
         constraints = [
@@ -31,6 +150,15 @@ class Book(models.Model):
                 name="unique_title_author_cover",
             ),
         ]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="book_search_vector_gin"),
+            GinIndex(
+                fields=["title"], name="book_title_trgm", opclasses=["gin_trgm_ops"]
+            ),
+            GinIndex(
+                fields=["author"], name="book_author_trgm", opclasses=["gin_trgm_ops"]
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         self.full_clean()
@@ -38,3 +166,54 @@ class Book(models.Model):
 
     def __str__(self):
         return f"{self.title} by {self.author}"
+
+
+class BookInventoryShardManager(models.Manager):
+    def _random_shard(self, book_id: int, **filters) -> Subquery:
+        return Subquery(
+            self.filter(book_id=book_id, **filters).order_by("?").values("pk")[:1]
+        )
+
+    def reserve(self, book_id: int) -> bool:
+        """Take one copy from a random shard that still has stock.
+
+        A shard picked by the subquery can be emptied by a concurrent borrow
+        before our UPDATE runs, so a miss is retried while any shard of the
+        book still has stock.
+        """
+        while True:
+            updated = self.filter(
+                pk=self._random_shard(book_id, count__gt=0), count__gt=0
+            ).update(count=F("count") - 1)
+            if updated:
+                return True
+            if not self.filter(book_id=book_id, count__gt=0).exists():
+                return False
+
+    def release(self, book_id: int) -> bool:
+        """Put one copy back to a random shard of the book."""
+        updated = self.filter(pk=self._random_shard(book_id)).update(
+            count=F("count") + 1
+        )
+        return updated == 1
+
+
+class BookInventoryShard(models.Model):
+    book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, related_name="inventory_shards"
+    )
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+
+    objects = BookInventoryShardManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["book", "shard"],
+                name="unique_book_shard",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Shard {self.shard} of book {self.book_id}: {self.count}"
@@ -1,8 +1,60 @@
+from django.db import transaction
 from rest_framework import serializers
 from book.models import Book
 
+# Inventory is a 32-bit integer column.
+INVENTORY_MAX = 2**31 - 1
+
 
 class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = ("id", "title", "author", "cover", "inventory", "daily_fee")
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data["inventory"] = instance.total_inventory
+        return data
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if instance.is_sharded and "inventory" in validated_data:
+                instance.inventory_shards.update(count=0)
+        return instance
+
+
+class BookImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Book
+        fields = ("title", "author", "cover", "inventory", "daily_fee")
+        # Rows are upserted on unique_title_author_cover, so the
+        # per-row uniqueness query of the default validator is not needed.
+        validators = []
+
+
+class InventoryAdjustmentSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    delta = serializers.IntegerField(
+        required=False, min_value=-INVENTORY_MAX, max_value=INVENTORY_MAX
+    )
+    absolute = serializers.IntegerField(
+        required=False, min_value=0, max_value=INVENTORY_MAX
+    )
+
+    def validate(self, attrs):
+        if ("delta" in attrs) == ("absolute" in attrs):
+            raise serializers.ValidationError(
+                "Provide either 'delta' or 'absolute' for each book"
+            )
+        return attrs
+
+
+class InventoryAdjustmentListSerializer(serializers.ListSerializer):
+    child = InventoryAdjustmentSerializer()
+
+    def validate(self, attrs):
+        book_ids = [adjustment["id"] for adjustment in attrs]
+        if len(book_ids) != len(set(book_ids)):
+            raise serializers.ValidationError("Each book can be adjusted only once")
+        return attrs
@@ -1,13 +1,41 @@
+import csv
+import gzip
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from redis.exceptions import ConnectionError as RedisConnectionError
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIClient, APITestCase
 from django.urls import reverse
 
-from book.models import Book
-from book.serializers import BookSerializer
+from book import book_cache
+from book.book_services import (
+    adjust_inventory,
+    compact_book_inventory,
+    disable_inventory_sharding,
+    enable_inventory_sharding,
+    import_books,
+)
+from book.models import Book, BookInventoryShard
+from book.serializers import BookSerializer, InventoryAdjustmentSerializer
 
 
 BOOK_URL = reverse("book:book-list")
+BOOK_CACHE_STATS_URL = reverse("book:book-cache-stats")
+BOOK_IMPORT_URL = reverse("book:book-bulk-import")
+BOOK_INVENTORY_URL = reverse("book:book-adjust-inventory")
+BOOK_EXPORT_URL = reverse("book:book-export")
 
 
 def get_book_url(book):
@@ -16,6 +44,8 @@ def get_book_url(book):
 
 class BaseBookAPITest(APITestCase):
     def setUp(self):
+        # Invalidation runs on commit, which never happens inside a test.
+        cache.clear()
         self.client = APIClient()
 
         self.book_1 = Book.objects.create(
@@ -52,10 +82,10 @@ class UnauthenticatedBookApiTest(BaseBookAPITest):
 
     def test_unauthenticated_user_book_list_returns_200(self):
         res = self.client.get(BOOK_URL)
-        books = Book.objects.all()
+        books = Book.objects.order_by("-id")
         serializer = BookSerializer(books, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_unauthenticated_user_book_retrieve_returns_200(self):
         url = get_book_url(self.book_1)
@@ -111,10 +141,10 @@ class AuthenticatedBookApiTest(BaseBookAPITest):
 
     def test_authenticated_user_book_list_returns_200(self):
         res = self.client.get(BOOK_URL)
-        books = Book.objects.all()
+        books = Book.objects.order_by("-id")
         serializer = BookSerializer(books, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_authenticated_user_book_retrieve_returns_200(self):
         url = get_book_url(self.book_1)
@@ -170,10 +200,10 @@ class AdminBookApiTest(BaseBookAPITest):
 
     def test_admin_user_book_list_returns_200(self):
         res = self.client.get(BOOK_URL)
-        books = Book.objects.all()
+        books = Book.objects.order_by("-id")
         serializer = BookSerializer(books, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_admin_user_book_retrieve_returns_200(self):
         url = get_book_url(self.book_1)
@@ -230,3 +260,543 @@ class AdminBookApiTest(BaseBookAPITest):
         }
         res = self.client.post(BOOK_URL, payload)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BookInventoryTest(APITestCase):
+    def setUp(self):
+        self.book = Book.objects.create(
+            title="Title_book_1",
+            author="Author_book_1",
+            cover="hard",
+            inventory=1,
+            daily_fee=10,
+        )
+
+    def test_reserve_decreases_inventory(self):
+        self.assertTrue(Book.objects.reserve(self.book.id))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 0)
+
+    def test_reserve_with_zero_inventory_returns_false(self):
+        Book.objects.reserve(self.book.id)
+        self.assertFalse(Book.objects.reserve(self.book.id))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 0)
+
+    def test_decrease_with_zero_inventory_raises_validation_error(self):
+        self.book.decrease_on_1_for_inventory()
+        with self.assertRaises(ValidationError):
+            self.book.decrease_on_1_for_inventory()
+
+    def test_release_increases_inventory(self):
+        self.book.increase_on_1_for_inventory()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 2)
+
+
+class BookInventoryConcurrencyTest(TransactionTestCase):
+    inventory = 5
+    workers = 20
+
+    def setUp(self):
+        self.book = Book.objects.create(
+            title="Title_book_1",
+            author="Author_book_1",
+            cover="hard",
+            inventory=self.inventory,
+            daily_fee=10,
+        )
+
+    def _reserve(self, _):
+        try:
+            return Book.objects.reserve(self.book.id)
+        finally:
+            connection.close()
+
+    def test_concurrent_reserve_does_not_oversell(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self._reserve, range(self.workers * 2)))
+
+        self.book.refresh_from_db()
+        self.assertEqual(results.count(True), self.inventory)
+        self.assertEqual(self.book.total_inventory, 0)
+
+    def _wait_for_lock_waiter(self):
+        with connection.cursor() as cursor:
+            for _ in range(100):
+                cursor.execute("SELECT 1 FROM pg_locks WHERE NOT granted")
+                if cursor.fetchone():
+                    return
+                time.sleep(0.05)
+        self.fail("Nothing waits for a lock")
+
+    def test_adjust_inventory_keeps_concurrent_reservation(self):
+        reserved, commit = threading.Event(), threading.Event()
+
+        def reserve():
+            try:
+                with transaction.atomic():
+                    Book.objects.reserve(self.book.id)
+                    reserved.set()
+                    commit.wait(5)
+            finally:
+                connection.close()
+
+        def adjust():
+            try:
+                return adjust_inventory([{"id": self.book.id, "delta": 2}])
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            reservation = executor.submit(reserve)
+            reserved.wait(5)
+            adjustment = executor.submit(adjust)
+            self._wait_for_lock_waiter()
+            commit.set()
+            reservation.result()
+            adjustment.result()
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.total_inventory, self.inventory + 1)
+
+
+class ShardedBookInventoryConcurrencyTest(BookInventoryConcurrencyTest):
+    def setUp(self):
+        super().setUp()
+        enable_inventory_sharding(self.book, shards=3)
+
+
+class BookInventoryShardingTest(APITestCase):
+    def setUp(self):
+        self.book = Book.objects.create(
+            title="Title_book_1",
+            author="Author_book_1",
+            cover="hard",
+            inventory=10,
+            daily_fee=10,
+        )
+        enable_inventory_sharding(self.book, shards=4)
+
+    def test_enable_sharding_moves_inventory_to_shards(self):
+        self.book.refresh_from_db()
+        counts = list(
+            BookInventoryShard.objects.filter(book=self.book)
+            .order_by("shard")
+            .values_list("count", flat=True)
+        )
+        self.assertTrue(self.book.is_sharded)
+        self.assertEqual(self.book.inventory, 0)
+        self.assertEqual(counts, [3, 3, 2, 2])
+        self.assertEqual(self.book.total_inventory, 10)
+
+    def test_instance_inventory_follows_shard_reservations(self):
+        book = Book.objects.get(pk=self.book.pk)
+        book.decrease_on_1_for_inventory()
+        self.assertEqual(book.inventory, 0)
+        self.assertEqual(book.total_inventory, 9)
+
+        book.increase_on_1_for_inventory()
+        book.decrease_on_1_for_inventory()
+        book.save()
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 0)
+        self.assertEqual(book.total_inventory, 9)
+
+    def test_reserve_and_release_use_shards(self):
+        for _ in range(10):
+            self.assertTrue(Book.objects.reserve(self.book.id))
+        self.assertFalse(Book.objects.reserve(self.book.id))
+
+        Book.objects.release(self.book.id)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 0)
+        self.assertEqual(self.book.total_inventory, 1)
+
+    def test_compact_rebalances_shards(self):
+        for _ in range(6):
+            Book.objects.reserve(self.book.id)
+        compact_book_inventory(self.book.id)
+        counts = list(
+            BookInventoryShard.objects.filter(book=self.book)
+            .order_by("shard")
+            .values_list("count", flat=True)
+        )
+        self.assertEqual(counts, [1, 1, 1, 1])
+
+    def test_disable_sharding_folds_shards_into_book(self):
+        disable_inventory_sharding(self.book)
+        self.book.refresh_from_db()
+        self.assertFalse(self.book.is_sharded)
+        self.assertEqual(self.book.inventory, 10)
+        self.assertFalse(BookInventoryShard.objects.filter(book=self.book).exists())
+
+    def test_book_retrieve_shows_total_inventory(self):
+        res = self.client.get(get_book_url(self.book))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["inventory"], 10)
+
+
+class BookSearchApiTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.hobbit = Book.objects.create(
+            title="The Hobbit",
+            author="J. R. R. Tolkien",
+            cover="hard",
+            inventory=3,
+            daily_fee=10,
+        )
+        self.rings = Book.objects.create(
+            title="The Lord of the Rings",
+            author="J. R. R. Tolkien",
+            cover="hard",
+            inventory=3,
+            daily_fee=10,
+        )
+        self.dune = Book.objects.create(
+            title="Dune",
+            author="Frank Herbert",
+            cover="soft",
+            inventory=3,
+            daily_fee=10,
+        )
+
+    def _search_ids(self, search):
+        res = self.client.get(BOOK_URL, {"search": search})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [book["id"] for book in res.data["results"]]
+
+    def test_search_by_title_returns_200(self):
+        self.assertEqual(self._search_ids("hobbit"), [self.hobbit.id])
+
+    def test_search_by_author_returns_200(self):
+        self.assertCountEqual(
+            self._search_ids("tolkien"), [self.hobbit.id, self.rings.id]
+        )
+
+    def test_search_with_typo_returns_200(self):
+        self.assertEqual(self._search_ids("hobit"), [self.hobbit.id])
+
+    def test_search_results_are_ranked_returns_200(self):
+        self.assertEqual(self._search_ids("tolkien rings")[0], self.rings.id)
+
+    def test_search_without_match_returns_200(self):
+        self.assertEqual(self._search_ids("asimov"), [])
+
+    def test_search_counts_matches_once_returns_200(self):
+        with CaptureQueriesContext(connection) as queries:
+            self._search_ids("tolkien")
+
+        counts = [query for query in queries if "COUNT(" in query["sql"]]
+        self.assertEqual(len(counts), 1)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    BOOK_CACHE_STATS_FLUSH_EVERY=1,
+)
+class BookCacheApiTest(BaseBookAPITest):
+    def setUp(self):
+        super().setUp()
+        book_cache.stats.snapshot()
+        cache.clear()
+
+    def test_book_list_is_served_from_cache_returns_200(self):
+        res = self.client.get(BOOK_URL)
+        with self.assertNumQueries(0):
+            cached_res = self.client.get(BOOK_URL)
+
+        self.assertEqual(cached_res.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached_res.data, res.data)
+
+    def test_book_retrieve_is_served_from_cache_returns_200(self):
+        url = get_book_url(self.book_1)
+        res = self.client.get(url)
+        with self.assertNumQueries(0):
+            cached_res = self.client.get(url)
+
+        self.assertEqual(cached_res.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached_res.data, res.data)
+
+    def test_book_update_invalidates_cache_returns_200(self):
+        url = get_book_url(self.book_1)
+        self.client.get(url)
+        self.client.get(BOOK_URL)
+
+        self.client.force_authenticate(user=self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {"title": "Title_book_changed"})
+
+        self.assertEqual(self.client.get(url).data["title"], "Title_book_changed")
+        self.assertIn(
+            "Title_book_changed",
+            [book["title"] for book in self.client.get(BOOK_URL).data["results"]],
+        )
+
+    def test_inventory_change_invalidates_cache_returns_200(self):
+        url = get_book_url(self.book_1)
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.reserve(self.book_1.id)
+
+        self.assertEqual(self.client.get(url).data["inventory"], 2)
+
+    def test_reserve_touches_cache_only_after_commit(self):
+        with mock.patch.object(book_cache, "_bump_version") as bump_version:
+            with self.captureOnCommitCallbacks() as callbacks:
+                Book.objects.reserve(self.book_1.id)
+            bump_version.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+            bump_version.assert_called()
+
+    def test_import_touches_cache_only_after_commit(self):
+        lines = [
+            "title,author,cover,inventory,daily_fee\n",
+            "Title_book_new,Author_book_new,soft,5,1\n",
+        ]
+        with mock.patch.object(book_cache, "_invalidate_many") as invalidate_many:
+            with self.captureOnCommitCallbacks() as callbacks:
+                import_books(lines, "csv")
+            invalidate_many.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+            invalidate_many.assert_called_once()
+
+    def test_book_delete_invalidates_cache_returns_404(self):
+        url = get_book_url(self.book_1)
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book_1.delete()
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cache_unavailable_falls_back_to_database_returns_200(self):
+        with mock.patch.object(
+            LocMemCache, "get", side_effect=RedisConnectionError("down")
+        ), self.assertLogs("book.book_cache", "WARNING"):
+            res = self.client.get(get_book_url(self.book_1))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["title"], self.book_1.title)
+
+    def test_cache_stats_counts_hits_and_misses_returns_200(self):
+        self.client.get(BOOK_URL)
+        self.client.get(BOOK_URL)
+        self.client.get(get_book_url(self.book_1))
+
+        self.client.force_authenticate(user=self.admin)
+        res = self.client.get(BOOK_CACHE_STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["hits"], 1)
+        self.assertEqual(res.data["misses"], 2)
+
+    def test_user_cannot_see_cache_stats_returns_403(self):
+        self.client.force_authenticate(user=self.user)
+        res = self.client.get(BOOK_CACHE_STATS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BookImportApiTest(BaseBookAPITest):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_admin_can_import_books_from_csv_returns_200(self):
+        content = (
+            "title,author,cover,inventory,daily_fee\n"
+            "Title_book_new,Author_book_new,soft,5,1.5\n"
+            "Title_book_1,Author_book_1,hard,7,12\n"
+            "Title_book_bad,Author_book_bad,paper,-1,1\n"
+        )
+        res = self.client.post(
+            BOOK_IMPORT_URL, content.encode(), content_type="text/csv"
+        )
+        self.book_1.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["imported"], 2)
+        self.assertEqual(res.data["failed"], 1)
+        self.assertEqual(res.data["errors"][0]["row"], 3)
+        self.assertIn("cover", res.data["errors"][0]["errors"])
+        self.assertIn("inventory", res.data["errors"][0]["errors"])
+        self.assertEqual(self.book_1.inventory, 7)
+        self.assertTrue(Book.objects.filter(title="Title_book_new").exists())
+
+    def test_admin_can_import_books_from_ndjson_returns_200(self):
+        content = (
+            '{"title": "Title_book_new", "author": "Author_book_new", '
+            '"cover": "soft", "inventory": 5, "daily_fee": "1.5"}\n'
+            "\n"
+            "not json\n"
+        )
+        res = self.client.post(
+            BOOK_IMPORT_URL, content.encode(), content_type="application/x-ndjson"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["imported"], 1)
+        self.assertEqual(res.data["errors"][0]["row"], 2)
+
+    def test_import_reports_undecodable_lines_returns_200(self):
+        content = (
+            b"title,author,cover,inventory,daily_fee\n"
+            b"Title_book_\xff,Author_book_new,soft,5,1\n"
+            b"Title_book_new,Author_book_new,soft,5,1\n"
+        )
+        res = self.client.post(BOOK_IMPORT_URL, content, content_type="text/csv")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["imported"], 1)
+        self.assertEqual(res.data["errors"][0]["row"], 1)
+        self.assertIn("non_field_errors", res.data["errors"][0]["errors"])
+
+        content = b'{"title": "\xff"}\n'
+        res = self.client.post(
+            BOOK_IMPORT_URL, content, content_type="application/x-ndjson"
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["failed"], 1)
+
+    def test_import_empty_body_returns_400(self):
+        res = self.client.post(BOOK_IMPORT_URL, b"", content_type="text/csv")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_keeps_last_duplicate_in_batch(self):
+        lines = [
+            "title,author,cover,inventory,daily_fee\n",
+            "Title_book_new,Author_book_new,soft,5,1\n",
+            "Title_book_new,Author_book_new,soft,9,1\n",
+        ]
+        report = import_books(lines, "csv", batch_size=10)
+
+        self.assertEqual(report["imported"], 1)
+        self.assertEqual(Book.objects.get(title="Title_book_new").inventory, 9)
+
+    def test_import_unsupported_content_type_returns_415(self):
+        res = self.client.post(BOOK_IMPORT_URL, {"title": "x"}, format="json")
+        self.assertEqual(res.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_user_cannot_import_books_returns_403(self):
+        self.client.force_authenticate(user=self.user)
+        res = self.client.post(BOOK_IMPORT_URL, b"", content_type="text/csv")
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BookInventoryAdjustmentApiTest(BaseBookAPITest):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_admin_can_adjust_inventory_returns_200(self):
+        payload = [
+            {"id": self.book_1.id, "delta": -2},
+            {"id": self.book_2.id, "absolute": 10},
+        ]
+        with self.assertNumQueries(3):
+            res = self.client.post(BOOK_INVENTORY_URL, payload, format="json")
+        self.book_1.refresh_from_db()
+        self.book_2.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.book_1.inventory, 1)
+        self.assertEqual(self.book_2.inventory, 10)
+
+    def test_adjust_inventory_folds_shards_returns_200(self):
+        enable_inventory_sharding(self.book_1, shards=2)
+        payload = [{"id": self.book_1.id, "delta": 1}]
+        res = self.client.post(BOOK_INVENTORY_URL, payload, format="json")
+        self.book_1.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.book_1.inventory, 4)
+        self.assertEqual(self.book_1.total_inventory, 4)
+
+    def test_adjust_inventory_below_zero_changes_nothing_returns_400(self):
+        payload = [
+            {"id": self.book_1.id, "delta": -4},
+            {"id": self.book_2.id, "absolute": 10},
+            {"id": self.book_2.id + 100, "delta": 1},
+        ]
+        res = self.client.post(BOOK_INVENTORY_URL, payload, format="json")
+        self.book_2.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data["negative_inventory"], [str(self.book_1.id)])
+        self.assertEqual(res.data["not_found"], [str(self.book_2.id + 100)])
+        self.assertEqual(self.book_2.inventory, 3)
+
+    def test_adjust_inventory_requires_delta_or_absolute_returns_400(self):
+        payload = [{"id": self.book_1.id, "delta": 1, "absolute": 1}]
+        res = self.client.post(BOOK_INVENTORY_URL, payload, format="json")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_adjust_inventory_out_of_range_returns_400(self):
+        for adjustment in ({"delta": 2**31}, {"delta": -(2**31)}, {"absolute": 2**31}):
+            with self.subTest(**adjustment):
+                serializer = InventoryAdjustmentSerializer(
+                    data={"id": self.book_1.id, **adjustment}
+                )
+                self.assertFalse(serializer.is_valid())
+
+        payload = [{"id": self.book_1.id, "delta": 2**31 - 1}]
+        res = self.client.post(BOOK_INVENTORY_URL, payload, format="json")
+        self.book_1.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("inventory", res.data)
+        self.assertEqual(self.book_1.inventory, 3)
+
+    def test_adjust_inventory_duplicate_book_returns_400(self):
+        payload = [
+            {"id": self.book_1.id, "delta": 1},
+            {"id": self.book_1.id, "delta": 1},
+        ]
+        res = self.client.post(BOOK_INVENTORY_URL, payload, format="json")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_user_cannot_adjust_inventory_returns_403(self):
+        self.client.force_authenticate(user=self.user)
+        payload = [{"id": self.book_1.id, "delta": 1}]
+        res = self.client.post(BOOK_INVENTORY_URL, payload, format="json")
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BookExportApiTest(BaseBookAPITest):
+    def test_export_ndjson_streams_all_books_returns_200(self):
+        enable_inventory_sharding(self.book_2, shards=2)
+        with override_settings(EXPORT_CHUNK_SIZE=1):
+            res = self.client.get(BOOK_EXPORT_URL)
+            rows = [
+                json.loads(line)
+                for line in b"".join(res.streaming_content).splitlines()
+            ]
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Content-Type"], "application/x-ndjson")
+        self.assertEqual([row["id"] for row in rows], [self.book_1.id, self.book_2.id])
+        self.assertEqual(rows[1]["inventory"], 3)
+        self.assertEqual(rows[1]["daily_fee"], "10.000")
+
+    def test_export_csv_gzip_returns_200(self):
+        res = self.client.get(
+            BOOK_EXPORT_URL, {"file_format": "csv"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        content = gzip.decompress(b"".join(res.streaming_content)).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Content-Encoding"], "gzip")
+        self.assertEqual(rows[0]["title"], self.book_1.title)
+        self.assertEqual(len(rows), 2)
+
+    def test_export_unknown_format_returns_400(self):
+        res = self.client.get(BOOK_EXPORT_URL, {"file_format": "xml"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
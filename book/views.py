@@ -1,10 +1,156 @@
+from django.conf import settings
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
-from book.models import Book
-from book.serializers import BookSerializer
+from book import book_cache
+from book.book_services import adjust_inventory, import_books, iter_text_lines
+from book.models import Book, BookInventoryShard
+from book.serializers import BookSerializer, InventoryAdjustmentListSerializer
 from book.permissions import IsAdminOrAllowAnyReadOnly
+from common.export import ExportMixin
+from common.pagination import RankedPageNumberPagination
 
 
-class BookViewSet(ModelViewSet):
+IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+class BookViewSet(ExportMixin, ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = (IsAdminOrAllowAnyReadOnly,)
+    export_filename = "books"
+    export_fields = {
+        "id": "id",
+        "title": "title",
+        "author": "author",
+        "cover": "cover",
+        "inventory": F("inventory") + F("shard_inventory"),
+        "daily_fee": "daily_fee",
+    }
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator") and self._get_search():
+            self._paginator = RankedPageNumberPagination()
+        return super().paginator
+
+    def _get_search(self):
+        if self.action != "list":
+            return None
+        return self.request.query_params.get("search", "").strip() or None
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="search",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description=(
+                    "Search by title and author, tolerant to typos, "
+                    "ordered by relevance (ex., ?search=tolkien hobit)"
+                ),
+            ),
+        ]
+    )
+    def list(self, request, *args, **kwargs):
+        return book_cache.cached_response(
+            lambda: book_cache.list_cache_key(request),
+            lambda: super(BookViewSet, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return book_cache.cached_response(
+            lambda: book_cache.detail_cache_key(request, kwargs["pk"]),
+            lambda: super(BookViewSet, self).retrieve(request, *args, **kwargs),
+        )
+
+    @extend_schema(description="Hit and miss counters of the book response cache")
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="cache-stats",
+        permission_classes=(IsAdminUser,),
+    )
+    def cache_stats(self, request):
+        return Response(book_cache.stats.snapshot())
+
+    def get_queryset(self):
+        shard_inventory = (
+            BookInventoryShard.objects.filter(book=OuterRef("pk"))
+            .values("book")
+            .annotate(total=Sum("count"))
+            .values("total")
+        )
+        queryset = (
+            super()
+            .get_queryset()
+            .annotate(shard_inventory=Coalesce(Subquery(shard_inventory), 0))
+        )
+
+        search = self._get_search()
+        if search:
+            queryset = queryset.search(search)
+        return queryset
+
+    @extend_schema(
+        description=(
+            "Bulk import of books streamed as text/csv or application/x-ndjson "
+            "with title, author, cover, inventory and daily_fee columns. "
+            "Existing books (same title, author and cover) are updated."
+        ),
+        request={
+            "text/csv": OpenApiTypes.BINARY,
+            "application/x-ndjson": OpenApiTypes.BINARY,
+        },
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="import",
+        permission_classes=(IsAdminUser,),
+    )
+    def bulk_import(self, request):
+        content_type = request.content_type.split(";")[0].strip()
+        file_format = IMPORT_CONTENT_TYPES.get(content_type)
+        if file_format is None:
+            raise UnsupportedMediaType(content_type)
+        # DRF leaves no stream at all for an empty body.
+        if request.stream is None:
+            raise ParseError("Request body is empty.")
+
+        report = import_books(iter_text_lines(request.stream), file_format)
+        return Response(report, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        description=(
+            "Set (absolute) or change (delta) the inventory of many books "
+            "at once. Either all adjustments are applied or none."
+        ),
+        request=InventoryAdjustmentListSerializer,
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="inventory",
+        permission_classes=(IsAdminUser,),
+    )
+    def adjust_inventory(self, request):
+        serializer = InventoryAdjustmentListSerializer(
+            data=request.data,
+            allow_empty=False,
+            max_length=settings.BOOK_INVENTORY_ADJUSTMENT_MAX_ITEMS,
+        )
+        serializer.is_valid(raise_exception=True)
+        updated = adjust_inventory(serializer.validated_data)
+        return Response(updated, status=status.HTTP_200_OK)
@@ -1,17 +1,292 @@
-from datetime import date
+import logging
+import time
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, DateTimeField, F, Q, QuerySet, Value, When
+from django.utils import timezone
+from django_q.tasks import async_task, result_group
+from redis.exceptions import RedisError
+
 from borrow.models import Borrow
 from notifications.telegram_services import (
-    send_borrow_overdue_message,
+    render_overdue_digests,
     send_borrow_not_overdue_message,
+    send_messages,
 )
 
+logger = logging.getLogger(__name__)
+
 
-def checking_overdue_borrows():
-    queryset = Borrow.objects.filter(expected_return_date__lt=date.today()).filter(
-        is_active=True
+def overdue_borrows(today: date = None):
+    today = today or date.today()
+    return Borrow.objects.filter(is_active=True, expected_return_date__lt=today)
+
+
+def _with_digest_fields(queryset: QuerySet) -> QuerySet:
+    return queryset.select_related("book", "user").only(
+        "id",
+        "expected_return_date",
+        "overdue_reminders",
+        "book__title",
+        "book__author",
+        "user__email",
     )
-    if queryset:
-        for borrow in queryset:
-            send_borrow_overdue_message(borrow)
-    else:
+
+
+def newly_overdue_borrows(today: date) -> QuerySet:
+    return _with_digest_fields(
+        overdue_borrows(today).filter(overdue_notified_at__isnull=True)
+    ).order_by("expected_return_date", "id")
+
+
+def overdue_reminders_due(now: datetime) -> QuerySet:
+    return _with_digest_fields(
+        Borrow.objects.filter(is_active=True, overdue_remind_at__lte=now)
+    ).order_by("overdue_remind_at", "id")
+
+
+def _next_reminder_at(now: datetime) -> Case | Value:
+    """The n-th reminder follows the n-th OVERDUE_REMINDER_INTERVALS entry.
+
+    The last interval repeats until the borrow is returned. Without
+    intervals no reminder is scheduled.
+    """
+    intervals = [timedelta(days=days) for days in settings.OVERDUE_REMINDER_INTERVALS]
+    if not intervals:
+        return Value(None, output_field=DateTimeField())
+    return Case(
+        *[
+            When(overdue_reminders=number, then=Value(now + interval))
+            for number, interval in enumerate(intervals[:-1])
+        ],
+        default=Value(now + intervals[-1]),
+    )
+
+
+def _notify_overdue(
+    queryset: QuerySet, title: str, today: date, now: datetime
+) -> tuple[int, int]:
+    """Send digests chunk by chunk and record each chunk as notified.
+
+    A chunk is marked only after its messages went out, so a failed run
+    resends the unmarked borrows on the next run. Marked borrows leave the
+    queryset, so every chunk is read from the top in its own short query
+    and no server-side cursor stays open while digests are sent. Returns
+    the number of borrows and of messages sent.
+    """
+    chunk_size = settings.OVERDUE_SCAN_CHUNK_SIZE
+    notified = sent = 0
+    while chunk := list(queryset[:chunk_size]):
+        notified += len(chunk)
+        sent += send_messages(render_overdue_digests(chunk, today, title))
+        Borrow.objects.filter(pk__in=[borrow.pk for borrow in chunk]).update(
+            overdue_notified_at=now,
+            overdue_remind_at=_next_reminder_at(now),
+            overdue_reminders=F("overdue_reminders") + 1,
+        )
+        if len(chunk) < chunk_size:
+            break
+    return notified, sent
+
+
+def _notify_quiet_day(today: date) -> None:
+    # The first run of a day without new overdue borrows decides whether
+    # the daily "no overdue borrowings" message is sent.
+    key = f"borrow:overdue:quiet:{today}"
+    try:
+        if not cache.add(key, True, 24 * 60 * 60):
+            return
+    except RedisError as exc:
+        logger.warning("Quiet day message skipped, cache is unavailable: %s", exc)
+        return
+    if overdue_borrows(today).exists():
+        return
+    try:
         send_borrow_not_overdue_message()
+    except Exception:
+        # Let the next run of the day try again.
+        try:
+            cache.delete(key)
+        except RedisError as exc:
+            logger.warning("Quiet day key was not released: %s", exc)
+        raise
+
+
+def _notify_all_overdue(
+    today: date, now: datetime, id_range: Q = Q()
+) -> tuple[int, int]:
+    notified, sent = _notify_overdue(
+        newly_overdue_borrows(today).filter(id_range),
+        "Newly overdue borrows",
+        today,
+        now,
+    )
+    if settings.OVERDUE_REMINDER_INTERVALS:
+        reminded, reminders_sent = _notify_overdue(
+            overdue_reminders_due(now).filter(id_range),
+            "Still overdue borrows",
+            today,
+            now,
+        )
+        notified += reminded
+        sent += reminders_sent
+    return notified, sent
+
+
+def overdue_candidates(today: date, now: datetime) -> QuerySet:
+    """Borrows the next run notifies: never notified or with a reminder due."""
+    due = Q(overdue_notified_at__isnull=True, expected_return_date__lt=today)
+    if settings.OVERDUE_REMINDER_INTERVALS:
+        due |= Q(overdue_remind_at__lte=now)
+    return Borrow.objects.filter(due, is_active=True)
+
+
+def overdue_shards(today: date, now: datetime, shards: int) -> list[tuple[int, int]]:
+    """Split the candidate ids into ``shards`` ranges of about equal size.
+
+    Returns ``(after_id, last_id)`` pairs, a shard covers
+    ``after_id < id <= last_id``. The boundaries are id percentiles computed
+    in a single query, so gaps in the id sequence do not skew the shards.
+    """
+    sql, params = overdue_candidates(today, now).values("id").query.sql_with_params()
+    fractions = [number / shards for number in range(1, shards)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT min(id), percentile_disc(%s::float8[]) WITHIN GROUP "
+            f"(ORDER BY id), max(id) FROM ({sql}) AS candidate",
+            [fractions, *params],
+        )
+        first_id, cuts, last_id = cursor.fetchone()
+    if first_id is None:
+        return []
+    edges = [first_id - 1, *cuts, last_id]
+    return [
+        (after_id, until_id)
+        for after_id, until_id in zip(edges, edges[1:])
+        if until_id > after_id
+    ]
+
+
+def notify_overdue_shard(
+    number: int, after_id: int, last_id: int, now: datetime
+) -> dict:
+    """django_q task: notify the overdue borrows of one id range."""
+    started = time.perf_counter()
+    notified, sent = _notify_all_overdue(
+        timezone.localdate(now), now, Q(pk__gt=after_id, pk__lte=last_id)
+    )
+    seconds = time.perf_counter() - started
+    logger.info(
+        "Overdue shard %s (ids %s-%s): %s borrows, %s messages in %.2fs",
+        number,
+        after_id + 1,
+        last_id,
+        notified,
+        sent,
+        seconds,
+    )
+    return {
+        "shard": number,
+        "first_id": after_id + 1,
+        "last_id": last_id,
+        "borrows": notified,
+        "messages": sent,
+        "seconds": round(seconds, 3),
+    }
+
+
+def summarize_overdue_shards(results: list, shards: int, seconds: float) -> dict:
+    """Fold shard results into totals; failed shards return a traceback."""
+    done = sorted(
+        (result for result in results if isinstance(result, dict)),
+        key=lambda result: result["shard"],
+    )
+    return {
+        "shards": shards,
+        "failed": len(results) - len(done),
+        "missing": shards - len(results),
+        "borrows": sum(result["borrows"] for result in done),
+        "messages": sum(result["messages"] for result in done),
+        "slowest": max((result["seconds"] for result in done), default=0.0),
+        "seconds": round(seconds, 3),
+        "timings": done,
+    }
+
+
+def fan_out_overdue_borrows(now: datetime = None) -> dict:
+    """Notify overdue borrows with one django_q task per id range.
+
+    The shard tasks form a django_q group with cached results, and this
+    coordinator waits up to OVERDUE_FANOUT_TIMEOUT for the whole group. It
+    occupies a worker while waiting, so the shards run in parallel on the
+    remaining Q_CLUSTER workers.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    started = time.perf_counter()
+
+    shards = overdue_shards(today, now, settings.OVERDUE_FANOUT_SHARDS)
+    group = f"overdue-borrows-{now:%Y%m%dT%H%M%S}"
+    for number, (after_id, last_id) in enumerate(shards):
+        async_task(
+            "borrow.borrow_services.notify_overdue_shard",
+            number,
+            after_id,
+            last_id,
+            now,
+            group=group,
+            cached=settings.OVERDUE_FANOUT_TIMEOUT * 2,
+            timeout=settings.OVERDUE_FANOUT_TIMEOUT,
+        )
+    results = []
+    if shards:
+        results = result_group(
+            group,
+            failures=True,
+            count=len(shards),
+            wait=settings.OVERDUE_FANOUT_TIMEOUT * 1000,
+            cached=True,
+        )
+    summary = summarize_overdue_shards(
+        results or [], len(shards), time.perf_counter() - started
+    )
+    logger.info(
+        "Overdue fan-out %s: %s shards (%s failed, %s missing), "
+        "%s borrows, %s messages in %.2fs, slowest shard %.2fs",
+        group,
+        summary["shards"],
+        summary["failed"],
+        summary["missing"],
+        summary["borrows"],
+        summary["messages"],
+        summary["seconds"],
+        summary["slowest"],
+    )
+
+    if not summary["messages"] and not summary["failed"] + summary["missing"]:
+        _notify_quiet_day(today)
+    return summary
+
+
+def checking_overdue_borrows(now: datetime = None) -> int:
+    """Hourly task: report borrows that became overdue since the last run.
+
+    Instead of rescanning every overdue borrow, each run reads borrows that
+    were never notified and the ones whose next reminder is due, both from
+    partial indexes. Reminders follow OVERDUE_REMINDER_INTERVALS (in days).
+    With OVERDUE_FANOUT_SHARDS above 1 the work is split across django_q
+    workers by fan_out_overdue_borrows.
+    """
+    if settings.OVERDUE_FANOUT_SHARDS > 1:
+        return fan_out_overdue_borrows(now)["messages"]
+
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+
+    sent = _notify_all_overdue(today, now)[1]
+    if not sent:
+        _notify_quiet_day(today)
+    return sent
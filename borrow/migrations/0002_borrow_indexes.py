@@ -0,0 +1,82 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("book", "0002_alter_book_inventory"),
+        ("borrow", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="borrow",
+            index=models.Index(fields=["user", "id"], name="borrow_user_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="borrow",
+            index=models.Index(
+                fields=["user", "is_active", "id"], name="borrow_user_active_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="borrow",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["expected_return_date"],
+                name="borrow_active_expected_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="borrow",
+            index=models.Index(
+                fields=["book", "borrow_date"], name="borrow_book_date_idx"
+            ),
+        ),
+        # The composite indexes above lead with the foreign keys, so the
+        # single column indexes Django created for them are dropped.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="borrow",
+                    name="book",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="borrows_books",
+                        to="book.book",
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="borrow",
+                    name="user",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="borrows_user",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    "DROP INDEX CONCURRENTLY IF EXISTS borrow_borrow_book_id_85d6076c",
+                    "CREATE INDEX CONCURRENTLY borrow_borrow_book_id_85d6076c "
+                    "ON borrow_borrow (book_id)",
+                ),
+                migrations.RunSQL(
+                    "DROP INDEX CONCURRENTLY IF EXISTS borrow_borrow_user_id_12c88002",
+                    "CREATE INDEX CONCURRENTLY borrow_borrow_user_id_12c88002 "
+                    "ON borrow_borrow (user_id)",
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:08
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("book", "0004_book_search"),
+        ("borrow", "0002_borrow_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="borrow",
+            name="overdue_notified_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="borrow",
+            name="overdue_remind_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="borrow",
+            name="overdue_reminders",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        AddIndexConcurrently(
+            model_name="borrow",
+            index=models.Index(
+                condition=models.Q(
+                    ("is_active", True), ("overdue_notified_at__isnull", True)
+                ),
+                fields=["expected_return_date"],
+                name="borrow_overdue_new_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="borrow",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["overdue_remind_at"],
+                name="borrow_overdue_remind_idx",
+            ),
+        ),
+    ]
@@ -11,14 +11,49 @@ class Borrow(models.Model):
     book = models.ForeignKey(
         Book,
         on_delete=models.CASCADE,
-        related_name="borrows_books"
+        related_name="borrows_books",
+        db_index=False,
     )
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name="borrows_user"
+        related_name="borrows_user",
+        db_index=False,
     )
     is_active = models.BooleanField(default=True)
+    overdue_notified_at = models.DateTimeField(blank=True, null=True)
+    overdue_remind_at = models.DateTimeField(blank=True, null=True)
+    overdue_reminders = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Own borrows of a user newest first, optionally by is_active.
+            # They also replace the single column foreign key indexes.
+            models.Index(fields=["user", "id"], name="borrow_user_idx"),
+            models.Index(
+                fields=["user", "is_active", "id"], name="borrow_user_active_idx"
+            ),
+            # Overdue scan: only the active borrows are indexed.
+            models.Index(
+                fields=["expected_return_date"],
+                condition=models.Q(is_active=True),
+                name="borrow_active_expected_idx",
+            ),
+            # Incremental overdue detection: active borrows not notified yet,
+            # and the next reminder of the notified ones.
+            models.Index(
+                fields=["expected_return_date"],
+                condition=models.Q(is_active=True, overdue_notified_at__isnull=True),
+                name="borrow_overdue_new_idx",
+            ),
+            models.Index(
+                fields=["overdue_remind_at"],
+                condition=models.Q(is_active=True),
+                name="borrow_overdue_remind_idx",
+            ),
+            # Recent borrows per book counted by the inventory sharding task.
+            models.Index(fields=["book", "borrow_date"], name="borrow_book_date_idx"),
+        ]
 
     def clean(self):
         super().clean()
@@ -4,7 +4,8 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from borrow.models import Borrow
 from book.serializers import BookSerializer
-from notifications.telegram_services import send_borrow_created_message
+from notifications.models import OutboxEvent
+from notifications.outbox import publish_event
 from payments.payment_services import (
     create_checkout_session,
     total_amount,
@@ -55,6 +56,42 @@ class BorrowRetrieveSerializer(serializers.ModelSerializer):
         )
 
 
+class BorrowQuoteSerializer(serializers.ModelSerializer):
+    """A borrow priced by payments.pricing.annotate_prices."""
+
+    rental_days = serializers.IntegerField(read_only=True)
+    overdue_days = serializers.IntegerField(read_only=True)
+    rental_total = serializers.DecimalField(
+        max_digits=12, decimal_places=3, read_only=True
+    )
+    fine = serializers.DecimalField(max_digits=12, decimal_places=3, read_only=True)
+    total = serializers.DecimalField(max_digits=12, decimal_places=3, read_only=True)
+
+    class Meta:
+        model = Borrow
+        fields = (
+            "id",
+            "borrow_date",
+            "expected_return_date",
+            "actual_return_date",
+            "book",
+            "user",
+            "is_active",
+            "rental_days",
+            "overdue_days",
+            "rental_total",
+            "fine",
+            "total",
+        )
+
+
+class BorrowQuoteTotalsSerializer(serializers.Serializer):
+    borrows = serializers.IntegerField()
+    rental_total = serializers.DecimalField(max_digits=14, decimal_places=3)
+    fine = serializers.DecimalField(max_digits=14, decimal_places=3)
+    total = serializers.DecimalField(max_digits=14, decimal_places=3)
+
+
 class BorrowSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -82,10 +119,12 @@ class BorrowSerializer(serializers.ModelSerializer):
         with transaction.atomic():
             book.decrease_on_1_for_inventory()
             instance = Borrow.objects.create(**validated_data)
-        send_borrow_created_message(instance)
-        create_checkout_session(
-            instance, request, type_of_payment="pending", amount_to_pay=total_amount
-        )
+            create_checkout_session(
+                instance, request, type_of_payment="pending", amount_to_pay=total_amount
+            )
+            publish_event(
+                OutboxEvent.EventType.BORROW_CREATED, {"borrow_id": instance.id}
+            )
         return instance
 
 
@@ -116,21 +155,26 @@ class BorrowReturnSerializer(serializers.ModelSerializer):
         )
 
     def update(self, instance: Borrow, validated_data):
-        if not instance.is_active:
-            raise ValidationError(
-                {"This borrow": "Is unactive. You can't return this borrow twice"}
-            )
+        actual_return_date = datetime.now().date()
         with transaction.atomic():
+            # Flipping is_active with a conditional UPDATE lets exactly one of
+            # concurrent returns through, without Borrow.save()'s full_clean().
+            returned = Borrow.objects.filter(pk=instance.pk, is_active=True).update(
+                is_active=False, actual_return_date=actual_return_date
+            )
+            if not returned:
+                raise ValidationError(
+                    {"This borrow": "Is unactive. You can't return this borrow twice"}
+                )
             instance.is_active = False
-            instance.actual_return_date = datetime.now().date()
+            instance.actual_return_date = actual_return_date
             instance.book.increase_on_1_for_inventory()
-            instance.save()
-        if instance.expected_return_date < instance.actual_return_date:
-            request = self.context.get("request")
-            create_checkout_session(
-                instance,
-                request,
-                type_of_payment="fine",
-                amount_to_pay=calculate_fine_amount,
-            )
+            if instance.expected_return_date < instance.actual_return_date:
+                request = self.context.get("request")
+                create_checkout_session(
+                    instance,
+                    request,
+                    type_of_payment="fine",
+                    amount_to_pay=calculate_fine_amount,
+                )
         return instance
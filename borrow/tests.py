@@ -1,14 +1,40 @@
 import datetime
+import importlib.util
+import os
+from datetime import timedelta
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
 from rest_framework.test import APIClient, APITestCase
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+from redis.exceptions import ConnectionError as RedisConnectionError
 from rest_framework import status
 
 from book.models import Book
+from borrow.borrow_services import (
+    checking_overdue_borrows,
+    notify_overdue_shard,
+    overdue_shards,
+)
 from borrow.models import Borrow
 from borrow.serializers import BorrowListSerializer, BorrowRetrieveSerializer
+from common.pagination import IdCursorPagination
+from notifications.models import OutboxEvent
+from notifications.outbox import publish_event
+from payments.models import Payment
 
 BORROW_URL = reverse("borrow:borrow-list")
+BORROW_EXPORT_URL = reverse("borrow:borrow-export")
+BORROW_QUOTE_URL = reverse("borrow:borrow-quote")
 
 
 def get_borrow_url(borrow):
@@ -137,10 +163,21 @@ class AuthenticatedBorrowApiTest(BaseBorrowAPITest):
 
     def test_authenticated_user_can_see_only_own_borrow_list_returns_200(self):
         res = self.client.get(BORROW_URL)
-        borrows = Borrow.objects.all().filter(user=self.user_1.id)
+        borrows = Borrow.objects.filter(user=self.user_1.id).order_by("-id")
         serializer = BorrowListSerializer(borrows, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
+
+    def test_authenticated_user_exports_only_own_borrows_returns_200(self):
+        res = self.client.get(BORROW_EXPORT_URL)
+        rows = [
+            json.loads(line) for line in b"".join(res.streaming_content).splitlines()
+        ]
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["id"], self.borrow_1.id)
+        self.assertEqual(rows[0]["user_email"], self.user_1.email)
+        self.assertEqual(rows[0]["borrow_date"], "2025-12-16")
 
     def test_authenticated_user_borrow_retrieve_returns_200(self):
         url = get_borrow_url(self.borrow_1)
@@ -160,6 +197,29 @@ class AuthenticatedBorrowApiTest(BaseBorrowAPITest):
         res = self.client.post(BORROW_URL, payload)
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
 
+    def test_create_borrow_records_outbox_events_returns_201(self):
+        payload = {
+            "borrow_date": datetime.date(2025, 12, 17),
+            "expected_return_date": datetime.date(2025, 12, 19),
+            "book": self.book.id,
+        }
+        res = self.client.post(BORROW_URL, payload)
+        payment = Payment.objects.get(borrowing_id=res.data["id"])
+        events = {
+            event.event_type: event.payload
+            for event in OutboxEvent.objects.filter(processed_at__isnull=True)
+        }
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(payment.status, Payment.StatusChoices.CREATING)
+        self.assertEqual(payment.money_to_pay, 20)
+        self.assertEqual(
+            events[OutboxEvent.EventType.BORROW_CREATED], {"borrow_id": res.data["id"]}
+        )
+        self.assertEqual(
+            events[OutboxEvent.EventType.CHECKOUT_REQUESTED]["payment_id"], payment.pk
+        )
+
     def test_authenticated_user_cannot_patch_borrow_returns_405(self):
         url = get_borrow_url(self.borrow_1)
         payload = {
@@ -197,10 +257,10 @@ class AdminBorrowApiTest(BaseBorrowAPITest):
 
     def test_admin_user_can_see_all_borrow_list_returns_200(self):
         res = self.client.get(BORROW_URL)
-        borrows = Borrow.objects.all()
+        borrows = Borrow.objects.order_by("-id")
         serializer = BorrowListSerializer(borrows, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_admin_user_borrow_retrieve_returns_200(self):
         url = get_borrow_url(self.borrow_1)
@@ -256,10 +316,10 @@ class AdminBorrowApiTest(BaseBorrowAPITest):
         serializer_with_search_user_4 = BorrowListSerializer(self.borrow_4)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(serializer_with_search_user_2.data, res.data)
-        self.assertIn(serializer_with_search_user_4.data, res.data)
-        self.assertNotIn(serializer_without_search_user_1.data, res.data)
-        self.assertNotIn(serializer_without_search_user_3.data, res.data)
+        self.assertIn(serializer_with_search_user_2.data, res.data["results"])
+        self.assertIn(serializer_with_search_user_4.data, res.data["results"])
+        self.assertNotIn(serializer_without_search_user_1.data, res.data["results"])
+        self.assertNotIn(serializer_without_search_user_3.data, res.data["results"])
 
     def test_search_filter_borrow_by_user_is_and_is_active_returns_200(self):
         res = self.client.get(BORROW_URL, {"is_active": f"true"})
@@ -269,10 +329,12 @@ class AdminBorrowApiTest(BaseBorrowAPITest):
         serializer_with_search_is_active_4 = BorrowListSerializer(self.borrow_4)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(serializer_with_search_is_active_2.data, res.data)
-        self.assertIn(serializer_with_search_is_active_3.data, res.data)
-        self.assertIn(serializer_with_search_is_active_4.data, res.data)
-        self.assertNotIn(serializer_without_search_is_active_1.data, res.data)
+        self.assertIn(serializer_with_search_is_active_2.data, res.data["results"])
+        self.assertIn(serializer_with_search_is_active_3.data, res.data["results"])
+        self.assertIn(serializer_with_search_is_active_4.data, res.data["results"])
+        self.assertNotIn(
+            serializer_without_search_is_active_1.data, res.data["results"]
+        )
 
     def test_search_filter_borrow_by_is_active_returns_200(self):
         res = self.client.get(
@@ -284,7 +346,521 @@ class AdminBorrowApiTest(BaseBorrowAPITest):
         serializer_without_search_parameters_4 = BorrowListSerializer(self.borrow_4)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(serializer_with_search_parameters_1.data, res.data)
-        self.assertNotIn(serializer_without_search_parameters_2.data, res.data)
-        self.assertNotIn(serializer_without_search_parameters_3.data, res.data)
-        self.assertNotIn(serializer_without_search_parameters_4.data, res.data)
+        self.assertIn(serializer_with_search_parameters_1.data, res.data["results"])
+        self.assertNotIn(
+            serializer_without_search_parameters_2.data, res.data["results"]
+        )
+        self.assertNotIn(
+            serializer_without_search_parameters_3.data, res.data["results"]
+        )
+        self.assertNotIn(
+            serializer_without_search_parameters_4.data, res.data["results"]
+        )
+
+    def test_borrow_list_paginates_with_cursor_returns_200(self):
+        res = self.client.get(BORROW_URL, {"page_size": 3})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["results"]), 3)
+        self.assertIsNone(res.data["previous"])
+
+        next_res = self.client.get(res.data["next"])
+        self.assertEqual(next_res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(next_res.data["next"])
+
+        ids = [borrow["id"] for borrow in res.data["results"]]
+        ids += [borrow["id"] for borrow in next_res.data["results"]]
+        self.assertEqual(
+            ids, list(Borrow.objects.order_by("-id").values_list("id", flat=True))
+        )
+
+    def test_borrow_list_page_size_is_capped_returns_200(self):
+        with mock.patch.object(IdCursorPagination, "max_page_size", 2):
+            res = self.client.get(BORROW_URL, {"page_size": 100})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["results"]), 2)
+
+    def test_borrow_list_paginates_with_filters_returns_200(self):
+        res = self.client.get(
+            BORROW_URL, {"user_id": f"{self.user_2.id}", "page_size": 1}
+        )
+        next_res = self.client.get(res.data["next"])
+
+        self.assertEqual(res.data["results"][0]["id"], self.borrow_4.id)
+        self.assertEqual(next_res.data["results"][0]["id"], self.borrow_2.id)
+        self.assertIsNone(next_res.data["next"])
+
+
+class BorrowQuoteApiTest(BaseBorrowAPITest):
+    def test_admin_quotes_active_borrows_with_projected_fines_returns_200(self):
+        self.client.force_authenticate(user=self.admin)
+
+        with self.assertNumQueries(2):
+            res = self.client.get(
+                BORROW_QUOTE_URL, {"is_active": "true", "on": "2025-12-20"}
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data["totals"],
+            {
+                "borrows": 3,
+                "rental_total": "60.000",
+                "fine": "120.000",
+                "total": "180.000",
+            },
+        )
+        self.assertEqual(
+            [quote["id"] for quote in res.data["results"]],
+            [self.borrow_4.id, self.borrow_3.id, self.borrow_2.id],
+        )
+        quote = res.data["results"][0]
+        self.assertEqual((quote["rental_days"], quote["overdue_days"]), (2, 2))
+        self.assertEqual(quote["total"], "60.000")
+
+    def test_user_quotes_only_own_borrows_returns_200(self):
+        self.client.force_authenticate(user=self.user_2)
+
+        res = self.client.get(
+            BORROW_QUOTE_URL,
+            {"ids": f"{self.borrow_2.id},{self.borrow_3.id}", "on": "2025-12-18"},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [quote["id"] for quote in res.data["results"]], [self.borrow_2.id]
+        )
+        self.assertEqual(res.data["totals"]["fine"], "0.000")
+
+    def test_invalid_quote_date_returns_400(self):
+        self.client.force_authenticate(user=self.user_1)
+
+        res = self.client.get(BORROW_QUOTE_URL, {"on": "tomorrow"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BorrowIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        book = Book.objects.create(
+            title="Title_book_1",
+            author="Author_book_1",
+            cover="hard",
+            inventory=3,
+            daily_fee=10,
+        )
+        cls.users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"user_{number}@user.com", password="password")
+            for number in range(100)
+        )
+        today = datetime.date.today()
+        Borrow.objects.bulk_create(
+            Borrow(
+                borrow_date=today - datetime.timedelta(days=number % 60 + 10),
+                expected_return_date=today - datetime.timedelta(days=number % 60),
+                book=book,
+                user=cls.users[number % len(cls.users)],
+                is_active=number % 20 == 0,
+            )
+            for number in range(20000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE borrow_borrow")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn("Seq Scan on borrow_borrow", plan)
+
+    def test_user_active_borrows_use_index_scan(self):
+        queryset = Borrow.objects.filter(user=self.users[0], is_active=True)
+        self.assertUsesIndex(queryset.order_by("-id")[:51], "borrow_user_active_idx")
+
+    def test_user_borrows_use_index_scan(self):
+        queryset = Borrow.objects.filter(user=self.users[0])
+        self.assertUsesIndex(queryset.order_by("-id")[:51], "borrow_user_idx")
+
+    def test_overdue_borrows_use_partial_index_scan(self):
+        queryset = Borrow.objects.filter(
+            expected_return_date__lt=datetime.date.today()
+            - datetime.timedelta(days=50),
+            is_active=True,
+        )
+        self.assertUsesIndex(queryset, "borrow_active_expected_idx")
+
+
+class BorrowIdempotencyTest(BaseBorrowAPITest):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.user_1)
+        self.payload = {
+            "borrow_date": datetime.date(2025, 12, 17),
+            "expected_return_date": datetime.date(2025, 12, 19),
+            "book": self.book.id,
+        }
+
+    def test_retried_create_replays_first_response_returns_201(self):
+        res = self.client.post(BORROW_URL, self.payload, HTTP_IDEMPOTENCY_KEY="k-1")
+        with self.assertNumQueries(4):
+            retry = self.client.post(
+                BORROW_URL, self.payload, HTTP_IDEMPOTENCY_KEY="k-1"
+            )
+        self.book.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json(), res.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(self.book.inventory, 2)
+        self.assertEqual(Payment.objects.filter(borrowing_id=res.data["id"]).count(), 1)
+        self.assertEqual(OutboxEvent.objects.count(), 2)
+
+    def test_retried_return_replays_first_response_returns_200(self):
+        borrow = Borrow.objects.create(
+            borrow_date=datetime.date.today(),
+            expected_return_date=datetime.date.today() + datetime.timedelta(days=2),
+            book=self.book,
+            user=self.user_1,
+        )
+        url = reverse("borrow:borrow-return-of-borrow", args=[borrow.id])
+
+        res = self.client.post(url, HTTP_IDEMPOTENCY_KEY="k-2")
+        retry = self.client.post(url, HTTP_IDEMPOTENCY_KEY="k-2")
+        self.book.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.json(), res.json())
+        self.assertEqual(self.book.inventory, 4)
+
+    def test_failed_request_is_not_replayed_returns_400(self):
+        self.book.inventory = 0
+        self.book.save()
+        res = self.client.post(BORROW_URL, self.payload, HTTP_IDEMPOTENCY_KEY="k-3")
+        self.book.inventory = 1
+        self.book.save()
+        retry = self.client.post(BORROW_URL, self.payload, HTTP_IDEMPOTENCY_KEY="k-3")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+
+    def test_key_reused_for_another_request_returns_422(self):
+        self.client.post(BORROW_URL, self.payload, HTTP_IDEMPOTENCY_KEY="k-4")
+        self.payload["expected_return_date"] = datetime.date(2025, 12, 20)
+        res = self.client.post(BORROW_URL, self.payload, HTTP_IDEMPOTENCY_KEY="k-4")
+        self.assertEqual(res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_same_key_of_another_user_is_independent_returns_201(self):
+        self.client.post(BORROW_URL, self.payload, HTTP_IDEMPOTENCY_KEY="k-5")
+        self.client.force_authenticate(user=self.user_2)
+        res = self.client.post(BORROW_URL, self.payload, HTTP_IDEMPOTENCY_KEY="k-5")
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Borrow.objects.filter(user=self.user_2).count(), 3)
+
+
+class BorrowIdempotencyConcurrencyTest(TransactionTestCase):
+    duplicates = 4
+
+    def setUp(self):
+        self.book = Book.objects.create(
+            title="Title_book_1",
+            author="Author_book_1",
+            cover="hard",
+            inventory=10,
+            daily_fee=10,
+        )
+        self.user = get_user_model().objects.create_user(
+            email="user_1@user.com",
+            password="password",
+        )
+
+    def test_concurrent_duplicates_wait_for_first_request(self):
+        payload = {
+            "borrow_date": datetime.date(2025, 12, 17),
+            "expected_return_date": datetime.date(2025, 12, 19),
+            "book": self.book.id,
+        }
+        barrier = threading.Barrier(self.duplicates)
+
+        def slow_publish_event(*args):
+            # Keeps the first request in flight while the duplicates arrive.
+            threading.Event().wait(0.2)
+            return publish_event(*args)
+
+        def post(_):
+            client = APIClient()
+            client.force_authenticate(user=self.user)
+            barrier.wait()
+            try:
+                return client.post(BORROW_URL, payload, HTTP_IDEMPOTENCY_KEY="k-1")
+            finally:
+                connection.close()
+
+        with mock.patch("borrow.serializers.publish_event", slow_publish_event):
+            with ThreadPoolExecutor(max_workers=self.duplicates) as executor:
+                responses = list(executor.map(post, range(self.duplicates)))
+        self.book.refresh_from_db()
+
+        self.assertEqual(
+            [res.status_code for res in responses],
+            [status.HTTP_201_CREATED] * self.duplicates,
+        )
+        self.assertEqual(len({res.json()["id"] for res in responses}), 1)
+        self.assertEqual(Borrow.objects.count(), 1)
+        self.assertEqual(self.book.inventory, 9)
+
+
+class BorrowReturnConcurrencyTest(TransactionTestCase):
+    workers = 8
+
+    def setUp(self):
+        self.book = Book.objects.create(
+            title="Title_book_1",
+            author="Author_book_1",
+            cover="hard",
+            inventory=2,
+            daily_fee=10,
+        )
+        self.user = get_user_model().objects.create_user(
+            email="user_1@user.com",
+            password="password",
+        )
+        today = datetime.date.today()
+        self.borrow = Borrow.objects.create(
+            borrow_date=today - datetime.timedelta(days=5),
+            expected_return_date=today - datetime.timedelta(days=2),
+            book=self.book,
+            user=self.user,
+        )
+
+    def test_concurrent_returns_release_inventory_once(self):
+        url = reverse("borrow:borrow-return-of-borrow", args=[self.borrow.id])
+        barrier = threading.Barrier(self.workers)
+
+        def post(_):
+            client = APIClient()
+            client.force_authenticate(user=self.user)
+            barrier.wait()
+            try:
+                return client.post(url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            codes = list(executor.map(post, range(self.workers)))
+        self.book.refresh_from_db()
+
+        self.assertEqual(codes.count(status.HTTP_200_OK), 1)
+        self.assertEqual(codes.count(status.HTTP_400_BAD_REQUEST), self.workers - 1)
+        self.assertEqual(self.book.inventory, 3)
+        self.assertEqual(Payment.objects.filter(borrowing=self.borrow).count(), 1)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class CheckingOverdueBorrowsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        books = Book.objects.bulk_create(
+            Book(
+                title=f"Title_book_{number}",
+                author="Author",
+                cover="hard",
+                inventory=3,
+                daily_fee=10,
+            )
+            for number in range(10)
+        )
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"user_{number}@user.com", password="password")
+            for number in range(10)
+        )
+        today = datetime.date.today()
+        cls.overdue = Borrow.objects.bulk_create(
+            Borrow(
+                borrow_date=today - datetime.timedelta(days=10),
+                expected_return_date=today - datetime.timedelta(days=number % 5 + 1),
+                book=books[number % 10],
+                user=users[number % 10],
+            )
+            for number in range(150)
+        )
+        Borrow.objects.create(
+            borrow_date=today - datetime.timedelta(days=10),
+            expected_return_date=today - datetime.timedelta(days=1),
+            book=books[0],
+            user=users[0],
+            is_active=False,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch("common.http.requests.Session.request")
+    def test_overdue_borrows_are_sent_as_digests(self, mock_post):
+        # New overdue borrows, their update, and the empty reminder scan.
+        with self.assertNumQueries(3):
+            sent = checking_overdue_borrows()
+
+        texts = [call.kwargs["json"]["text"] for call in mock_post.call_args_list]
+        self.assertEqual(sent, len(texts))
+        self.assertGreater(len(texts), 1)
+        self.assertLess(len(texts), len(self.overdue))
+        self.assertTrue(all(len(text) <= 4096 for text in texts))
+        self.assertEqual(
+            sum(text.count("- Borrow ") for text in texts), len(self.overdue)
+        )
+
+    @override_settings(OVERDUE_REMINDER_INTERVALS=[])
+    @mock.patch("common.http.requests.Session.request")
+    def test_empty_intervals_disable_reminders(self, mock_post):
+        now = timezone.now()
+        self.assertGreater(checking_overdue_borrows(now), 0)
+        mock_post.reset_mock()
+
+        self.assertEqual(checking_overdue_borrows(now + timedelta(days=30)), 0)
+        mock_post.assert_not_called()
+        self.assertFalse(
+            Borrow.objects.filter(overdue_remind_at__isnull=False).exists()
+        )
+
+    def test_non_positive_intervals_are_rejected_on_settings_load(self):
+        spec = importlib.util.spec_from_file_location(
+            "settings_under_test", settings.BASE_DIR / "drf_library" / "settings.py"
+        )
+        for intervals in ("1,0", "-1"):
+            with self.subTest(intervals=intervals), mock.patch.dict(
+                os.environ, {"OVERDUE_REMINDER_INTERVALS": intervals}
+            ), self.assertRaises(ImproperlyConfigured):
+                spec.loader.exec_module(importlib.util.module_from_spec(spec))
+
+    @mock.patch("common.http.requests.Session.request")
+    def test_next_run_only_sends_due_reminders(self, mock_post):
+        now = timezone.now()
+        checking_overdue_borrows(now)
+        mock_post.reset_mock()
+
+        with self.assertNumQueries(3):
+            self.assertEqual(checking_overdue_borrows(now + timedelta(hours=1)), 0)
+        mock_post.assert_not_called()
+
+        checking_overdue_borrows(now + timedelta(days=1, hours=1))
+        texts = [call.kwargs["json"]["text"] for call in mock_post.call_args_list]
+        self.assertTrue(all(text.startswith("Still overdue") for text in texts))
+        self.assertEqual(
+            sum(text.count("- Borrow ") for text in texts), len(self.overdue)
+        )
+        borrow = Borrow.objects.get(pk=self.overdue[0].pk)
+        self.assertEqual(borrow.overdue_reminders, 2)
+        self.assertEqual(borrow.overdue_remind_at, now + timedelta(days=4, hours=1))
+
+    @mock.patch("common.http.requests.Session.request")
+    def test_borrow_overdue_since_last_run_is_sent(self, mock_post):
+        now = timezone.now()
+        checking_overdue_borrows(now)
+        mock_post.reset_mock()
+        borrow = Borrow.objects.create(
+            borrow_date=datetime.date.today() - datetime.timedelta(days=3),
+            expected_return_date=datetime.date.today() - datetime.timedelta(days=1),
+            book=self.overdue[0].book,
+            user=self.overdue[0].user,
+        )
+
+        self.assertEqual(checking_overdue_borrows(now + timedelta(hours=1)), 1)
+        text = mock_post.call_args.kwargs["json"]["text"]
+        self.assertEqual(text.count("- Borrow "), 1)
+        self.assertIn(f"- Borrow {borrow.id}:", text)
+
+    @mock.patch("borrow.borrow_services.send_borrow_not_overdue_message")
+    @mock.patch("common.http.requests.Session.request")
+    def test_no_overdue_borrows_sends_single_message_a_day(
+        self, mock_post, mock_not_overdue
+    ):
+        Borrow.objects.update(is_active=False)
+        self.assertEqual(checking_overdue_borrows(), 0)
+        self.assertEqual(checking_overdue_borrows(), 0)
+        mock_post.assert_not_called()
+        mock_not_overdue.assert_called_once()
+
+    @mock.patch("borrow.borrow_services.send_borrow_not_overdue_message")
+    def test_failed_quiet_day_message_is_retried(self, mock_not_overdue):
+        Borrow.objects.update(is_active=False)
+        mock_not_overdue.side_effect = [RuntimeError("telegram down"), None]
+
+        with self.assertRaises(RuntimeError):
+            checking_overdue_borrows()
+        checking_overdue_borrows()
+
+        self.assertEqual(mock_not_overdue.call_count, 2)
+
+    @mock.patch("borrow.borrow_services.send_borrow_not_overdue_message")
+    def test_quiet_day_is_skipped_while_cache_is_down(self, mock_not_overdue):
+        Borrow.objects.update(is_active=False)
+
+        with mock.patch.object(
+            cache, "add", side_effect=RedisConnectionError("down")
+        ), self.assertLogs("borrow.borrow_services", "WARNING"):
+            self.assertEqual(checking_overdue_borrows(), 0)
+
+        mock_not_overdue.assert_not_called()
+
+    def test_overdue_shards_split_candidates_evenly(self):
+        now = timezone.now()
+        shards = overdue_shards(timezone.localdate(now), now, 4)
+
+        sizes = [
+            Borrow.objects.filter(pk__gt=after_id, pk__lte=last_id).count()
+            for after_id, last_id in shards
+        ]
+        self.assertEqual(len(shards), 4)
+        self.assertEqual(shards[0][0], self.overdue[0].pk - 1)
+        self.assertEqual(shards[-1][1], self.overdue[-1].pk)
+        self.assertTrue(
+            all(prev[1] == shard[0] for prev, shard in zip(shards, shards[1:]))
+        )
+        self.assertEqual(sum(sizes), len(self.overdue))
+        self.assertLessEqual(max(sizes) - min(sizes), 1)
+
+    @override_settings(OVERDUE_FANOUT_SHARDS=4)
+    @mock.patch("borrow.borrow_services.result_group")
+    @mock.patch("borrow.borrow_services.async_task")
+    @mock.patch("common.http.requests.Session.request")
+    def test_fan_out_runs_one_task_per_shard(
+        self, mock_post, mock_async_task, mock_result_group
+    ):
+        results = []
+        mock_async_task.side_effect = lambda func, *args, **options: results.append(
+            notify_overdue_shard(*args)
+        )
+        mock_result_group.side_effect = lambda *args, **kwargs: results
+
+        sent = checking_overdue_borrows()
+
+        texts = [call.kwargs["json"]["text"] for call in mock_post.call_args_list]
+        groups = {call.kwargs["group"] for call in mock_async_task.call_args_list}
+        self.assertEqual(mock_async_task.call_count, 4)
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(mock_result_group.call_args.kwargs["count"], 4)
+        self.assertEqual(sent, len(texts))
+        self.assertEqual(sum(result["borrows"] for result in results), 150)
+        self.assertEqual(
+            sum(text.count("- Borrow ") for text in texts), len(self.overdue)
+        )
+        self.assertFalse(
+            Borrow.objects.filter(
+                is_active=True, overdue_notified_at__isnull=True
+            ).exists()
+        )
+
+    @override_settings(OVERDUE_FANOUT_SHARDS=2)
+    @mock.patch("borrow.borrow_services.send_borrow_not_overdue_message")
+    @mock.patch("borrow.borrow_services.result_group")
+    @mock.patch("borrow.borrow_services.async_task")
+    def test_fan_out_summary_counts_failed_and_missing_shards(
+        self, mock_async_task, mock_result_group, mock_not_overdue
+    ):
+        mock_result_group.return_value = ["Traceback (most recent call last): ..."]
+
+        self.assertEqual(checking_overdue_borrows(), 0)
+        mock_not_overdue.assert_not_called()
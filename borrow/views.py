@@ -1,3 +1,5 @@
+from datetime import date
+
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import mixins, status
@@ -9,13 +11,29 @@ from rest_framework.viewsets import GenericViewSet
 from borrow.models import Borrow
 from borrow.serializers import (
     BorrowListSerializer,
+    BorrowQuoteSerializer,
+    BorrowQuoteTotalsSerializer,
     BorrowRetrieveSerializer,
     BorrowSerializer,
     BorrowReturnSerializer,
 )
+from common.export import ExportMixin
+from common.idempotency import IDEMPOTENCY_HEADER, idempotent
+from payments.pricing import annotate_prices, quote_totals
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    name=IDEMPOTENCY_HEADER,
+    type=OpenApiTypes.STR,
+    location=OpenApiParameter.HEADER,
+    description=(
+        "Unique key of the request; a retry with the same key replays "
+        "the first response instead of repeating it"
+    ),
+)
 
 
 class BorrowViewSet(
+    ExportMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
@@ -23,15 +41,27 @@ class BorrowViewSet(
 ):
     queryset = Borrow.objects.all()
     permission_classes = (IsAuthenticated,)
+    export_filename = "borrows"
+    export_fields = {
+        "id": "id",
+        "borrow_date": "borrow_date",
+        "expected_return_date": "expected_return_date",
+        "actual_return_date": "actual_return_date",
+        "is_active": "is_active",
+        "book_id": "book_id",
+        "book_title": "book__title",
+        "user_id": "user_id",
+        "user_email": "user__email",
+    }
 
     @staticmethod
-    def _params_to_ints(query_string):
+    def _params_to_ints(query_string, name="user_id"):
         try:
             return [int(str_id) for str_id in query_string.split(",")]
         except ValueError:
             raise ValidationError(
                 {
-                    "user_id": "Must be an integer (ex. user_id=1)",
+                    name: f"Must be an integer (ex. {name}=1)",
                 }
             )
 
@@ -70,6 +100,11 @@ class BorrowViewSet(
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def get_queryset(self):
         queryset = (
             super()
@@ -81,7 +116,7 @@ class BorrowViewSet(
         user_id = self.request.query_params.get("user_id")
         is_active = self.request.query_params.get("is_active")
 
-        if self.action == "list":
+        if self.action in ("list", "export", "quote"):
             if not self.request.user.is_staff:
                 queryset = queryset.filter(user=self.request.user)
                 if is_active:
@@ -106,12 +141,17 @@ class BorrowViewSet(
             return BorrowRetrieveSerializer
         if self.action == "return_of_borrow":
             return BorrowReturnSerializer
+        if self.action == "quote":
+            return BorrowQuoteSerializer
         return BorrowSerializer
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-    @extend_schema(description="This endpoint to use for return of borrow")
+    @extend_schema(
+        description="This endpoint to use for return of borrow",
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
+    )
     @action(
         methods=[
             "POST",
@@ -119,6 +159,7 @@ class BorrowViewSet(
         detail=True,
         url_path="return",
     )
+    @idempotent
     def return_of_borrow(self, request, pk=None):
         borrow = self.get_object()
         serializer = self.get_serializer(borrow, data=request.data)
@@ -127,3 +168,66 @@ class BorrowViewSet(
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @extend_schema(
+        description=(
+            "Rental totals and fines of many borrows, priced in the database. "
+            "Fines of active borrows are projected to the ?on= date, today by "
+            "default. Totals cover every matching borrow, the quotes of "
+            "single borrows are paginated."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="ids",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description="Quote only these borrows (ex., ?ids=1,2,3)",
+            ),
+            OpenApiParameter(
+                name="on",
+                type=OpenApiTypes.DATE,
+                location=OpenApiParameter.QUERY,
+                description="Project fines of active borrows to this date",
+            ),
+            OpenApiParameter(
+                name="user_id",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description="Filter by user_id (ex., ?user_id=1)",
+            ),
+            OpenApiParameter(
+                name="is_active",
+                type=OpenApiTypes.BOOL,
+                location=OpenApiParameter.QUERY,
+                description="Filter by is_active (ex., ?is_active=true)",
+            ),
+        ],
+    )
+    @action(
+        methods=[
+            "GET",
+        ],
+        detail=False,
+        url_path="quote",
+    )
+    def quote(self, request):
+        # Prices are computed from the book's columns, no rows are prefetched.
+        queryset = self.get_queryset().select_related(None).prefetch_related(None)
+        ids = request.query_params.get("ids")
+        if ids:
+            queryset = queryset.filter(id__in=self._params_to_ints(ids, "ids"))
+        on = request.query_params.get("on")
+        try:
+            on = date.fromisoformat(on) if on else date.today()
+        except ValueError:
+            raise ValidationError({"on": "Must be a date (ex. on=2025-12-31)"})
+
+        queryset = annotate_prices(queryset, on)
+        totals = BorrowQuoteTotalsSerializer(quote_totals(queryset)).data
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
+        response.data["on"] = on
+        response.data["totals"] = totals
+        return response
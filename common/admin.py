@@ -1,3 +1,5 @@
 from django.contrib import admin
+from common.models import IdempotencyKey
 
-# Register your models here.
+
+admin.site.register(IdempotencyKey)
@@ -0,0 +1,138 @@
+import logging
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = 6
+COUNTERS = ("calls", "failures")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, upstream: str, retry_at: float):
+        self.upstream = upstream
+        self.retry_at = retry_at
+        until = datetime.fromtimestamp(retry_at, timezone.utc)
+        super().__init__(
+            f"{upstream.capitalize()} is unavailable, its circuit is open "
+            f"until {until:%H:%M:%S} UTC"
+        )
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker with its state shared through the cache.
+
+    Calls and failures (errors and calls slower than
+    BREAKER_SLOW_CALL_SECONDS) are counted in BUCKETS buckets that together
+    cover BREAKER_WINDOW_SECONDS. The circuit opens for BREAKER_OPEN_SECONDS
+    once the window holds BREAKER_MIN_CALLS calls and the failure rate
+    reaches BREAKER_FAILURE_RATE. Then a single caller is let through as a
+    probe: its success closes the circuit, its failure opens it again.
+
+    When the cache is unavailable the breaker lets every call through.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def _key(self, suffix: str) -> str:
+        return f"breaker:{self.name}:{suffix}"
+
+    def _bucket_keys(self, counter: str, now: float) -> list:
+        size = settings.BREAKER_WINDOW_SECONDS / BUCKETS
+        current = int(now // size)
+        return [
+            self._key(f"{bucket}:{counter}")
+            for bucket in range(current - BUCKETS + 1, current + 1)
+        ]
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless the call may go to the upstream."""
+        try:
+            open_until = cache.get(self._key("open_until"))
+            if open_until is None:
+                return
+            if time.time() < open_until:
+                raise CircuitOpenError(self.name, open_until)
+            # Half-open: the first caller after the pause probes the upstream.
+            if not cache.add(
+                self._key("probe"), True, timeout=settings.BREAKER_OPEN_SECONDS
+            ):
+                raise CircuitOpenError(
+                    self.name, time.time() + settings.BREAKER_OPEN_SECONDS
+                )
+        except RedisError as exc:
+            logger.warning("Circuit breaker %s is unavailable: %s", self.name, exc)
+
+    def record(self, failed: bool, seconds: float) -> None:
+        failed = failed or seconds >= settings.BREAKER_SLOW_CALL_SECONDS
+        now = time.time()
+        try:
+            if cache.get(self._key("probe")):
+                self._finish_probe(failed, now)
+                return
+            counters = ("calls", "failures") if failed else ("calls",)
+            for counter in counters:
+                key = self._bucket_keys(counter, now)[-1]
+                if not cache.add(key, 1, timeout=settings.BREAKER_WINDOW_SECONDS * 2):
+                    cache.incr(key)
+            if failed:
+                self._maybe_open(now)
+        except (RedisError, ValueError) as exc:
+            logger.warning("Circuit breaker %s is unavailable: %s", self.name, exc)
+
+    def _window(self, now: float) -> dict:
+        keys = {counter: self._bucket_keys(counter, now) for counter in COUNTERS}
+        stored = cache.get_many([key for bucket in keys.values() for key in bucket])
+        return {
+            counter: sum(stored.get(key, 0) for key in bucket)
+            for counter, bucket in keys.items()
+        }
+
+    def _maybe_open(self, now: float) -> None:
+        window = self._window(now)
+        if (
+            window["calls"] >= settings.BREAKER_MIN_CALLS
+            and window["failures"] / window["calls"] >= settings.BREAKER_FAILURE_RATE
+        ):
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        cache.set(
+            self._key("open_until"), now + settings.BREAKER_OPEN_SECONDS, timeout=None
+        )
+        cache.delete(self._key("probe"))
+        logger.warning("Circuit breaker %s opened", self.name)
+
+    def _finish_probe(self, failed: bool, now: float) -> None:
+        if failed:
+            self._open(now)
+            return
+        # Failures from before the pause must not reopen the circuit.
+        cache.delete_many(
+            [self._key("open_until"), self._key("probe")]
+            + [key for counter in COUNTERS for key in self._bucket_keys(counter, now)]
+        )
+        logger.info("Circuit breaker %s closed", self.name)
+
+    def state(self) -> dict:
+        now = time.time()
+        try:
+            open_until = cache.get(self._key("open_until"))
+            window = self._window(now)
+        except RedisError as exc:
+            logger.warning("Circuit breaker %s is unavailable: %s", self.name, exc)
+            return {"state": "unknown"}
+        if open_until is None:
+            state = "closed"
+        elif now < open_until:
+            state = "open"
+        else:
+            state = "half_open"
+        return {"state": state, "open_until": open_until, **window}
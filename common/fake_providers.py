@@ -0,0 +1,432 @@
+import hashlib
+import hmac
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+from collections import Counter
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+TELEGRAM_SEND_MESSAGE = re.compile(r"^/bot[^/]*/sendMessage$")
+STRIPE_SESSION = re.compile(r"^/v1/checkout/sessions/(?P<id>[\w-]+)$")
+STRIPE_SESSION_EXPIRE = re.compile(r"^/v1/checkout/sessions/(?P<id>[\w-]+)/expire$")
+STRIPE_OBJECTS = {"/v1/products": "product", "/v1/prices": "price"}
+PAY = re.compile(r"^/pay/(?P<id>[\w-]+)$")
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class _RateLimiter:
+    """Token bucket allowing ``rate`` requests per second, 0 disables it."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if not self.rate:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def _form_fields(body: bytes) -> dict:
+    return {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+
+
+class FakeProviders:
+    """Local stand-in for Stripe Checkout, Products, Prices and Telegram.
+
+    Every provider request waits ``latency_ms`` plus up to ``jitter_ms``,
+    fails with a 500 at ``error_rate`` and gets a 429 above ``stripe_rps``
+    or ``telegram_rps``, so retries, timeouts and circuit breakers run as
+    they would against the real services. ``GET /pay/<session id>``
+    completes a session like a paying customer would and, with
+    ``webhook_url``, delivers a signed checkout.session.completed event.
+    Request counts per endpoint and outcome are served at ``/__stats``.
+
+    Use it as a context manager, or run ``manage.py fake_providers``.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0,
+        stripe_rps: float = 0,
+        telegram_rps: float = 0,
+        webhook_url: str = None,
+        webhook_secret: str = None,
+    ):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.limiters = {
+            "stripe": _RateLimiter(stripe_rps),
+            "telegram": _RateLimiter(telegram_rps),
+        }
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.sessions = {}
+        self.products = {}
+        self.prices = {}
+        self.idempotent_responses = {}
+        self.messages = []
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve_forever(self) -> None:
+        self.server.serve_forever()
+
+    def _handler_class(self):
+        providers = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so pooled clients reuse their connections.
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; without TCP_NODELAY the
+            # body waits for the client's delayed ACK.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                providers._dispatch(self, "GET")
+
+            def do_POST(self):
+                providers._dispatch(self, "POST")
+
+        return Handler
+
+    def _respond(self, handler, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def _provider_call(self, handler, provider: str, endpoint: str) -> bool:
+        """Apply latency, rate limit and errors; False if already answered."""
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        if not self.limiters[provider].allow():
+            self._count(endpoint, 429)
+            if provider == "telegram":
+                body = {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                }
+            else:
+                body = {"error": {"type": "rate_limit_error", "message": "Slow down"}}
+            self._respond(handler, 429, body, {"Retry-After": "1"})
+            return False
+        if self.error_rate and random.random() < self.error_rate:
+            self._count(endpoint, 500)
+            if provider == "telegram":
+                body = {"ok": False, "error_code": 500, "description": "Internal"}
+            else:
+                body = {"error": {"type": "api_error", "message": "Fake outage"}}
+            self._respond(handler, 500, body)
+            return False
+        return True
+
+    def _count(self, endpoint: str, status: int) -> None:
+        with self.lock:
+            self.stats[f"{endpoint} {status}"] += 1
+
+    def _dispatch(self, handler, method: str) -> None:
+        url = urlsplit(handler.path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+
+        if method == "GET" and url.path == "/__stats":
+            with self.lock:
+                stats = dict(self.stats)
+            return self._respond(handler, 200, stats)
+        if method == "POST" and TELEGRAM_SEND_MESSAGE.match(url.path):
+            return self._send_message(handler, body)
+        if method == "GET" and (match := PAY.match(url.path)):
+            return self._pay(handler, match["id"])
+        if url.path == "/v1/checkout/sessions":
+            if method == "POST":
+                return self._create_session(handler, body)
+            return self._list_sessions(handler, parse_qs(url.query))
+        if method == "POST" and url.path in STRIPE_OBJECTS:
+            return self._create_object(handler, STRIPE_OBJECTS[url.path], body)
+        if method == "GET" and (match := STRIPE_SESSION.match(url.path)):
+            return self._retrieve_session(handler, match["id"])
+        if method == "POST" and (match := STRIPE_SESSION_EXPIRE.match(url.path)):
+            return self._expire_session(handler, match["id"])
+        self._respond(handler, 404, {"error": {"type": "invalid_request_error"}})
+
+    def _send_message(self, handler, body: bytes) -> None:
+        endpoint = "telegram.sendMessage"
+        if not self._provider_call(handler, "telegram", endpoint):
+            return
+        message = json.loads(body or b"{}")
+        text = message.get("text") or ""
+        if not text:
+            status, description = 400, "Bad Request: message text is empty"
+        elif len(text) > TELEGRAM_MESSAGE_LIMIT:
+            status, description = 400, "Bad Request: message is too long"
+        else:
+            status, description = 200, None
+
+        self._count(endpoint, status)
+        if status != 200:
+            return self._respond(
+                handler,
+                status,
+                {"ok": False, "error_code": status, "description": description},
+            )
+        with self.lock:
+            self.messages.append(text)
+            message_id = len(self.messages)
+        self._respond(
+            handler,
+            200,
+            {"ok": True, "result": {"message_id": message_id, "text": text}},
+        )
+
+    def _create_session(self, handler, body: bytes) -> None:
+        endpoint = "stripe.checkout.sessions.create"
+        if not self._provider_call(handler, "stripe", endpoint):
+            return
+        key = handler.headers.get("Idempotency-Key")
+        with self.lock:
+            if key in self.idempotent_responses:
+                session = self.idempotent_responses[key]
+                self.stats[f"{endpoint} 200"] += 1
+                return self._respond(handler, 200, session)
+
+            fields = _form_fields(body)
+            session_id = f"cs_test_fake{next(self._ids):08d}"
+            if "line_items[0][price]" in fields:
+                price = self.prices[fields["line_items[0][price]"]]
+                unit_amount = Decimal(price["unit_amount_decimal"])
+            else:
+                unit_amount = int(
+                    fields.get("line_items[0][price_data][unit_amount]", 0)
+                )
+            quantity = int(fields.get("line_items[0][quantity]", 1))
+            session = {
+                "id": session_id,
+                "object": "checkout.session",
+                "amount_total": round(unit_amount * quantity),
+                "created": int(time.time()),
+                "expires_at": int(time.time()) + 24 * 60 * 60,
+                "metadata": {
+                    name[len("metadata[") : -1]: value
+                    for name, value in fields.items()
+                    if name.startswith("metadata[")
+                },
+                "mode": fields.get("mode", "payment"),
+                "payment_status": "unpaid",
+                "status": "open",
+                "success_url": fields.get("success_url"),
+                "cancel_url": fields.get("cancel_url"),
+                "url": f"{self.url}/pay/{session_id}",
+            }
+            self.sessions[session_id] = session
+            if key:
+                self.idempotent_responses[key] = session
+            self.stats[f"{endpoint} 200"] += 1
+        self._respond(handler, 200, session)
+
+    def _create_object(self, handler, kind: str, body: bytes) -> None:
+        """Create a Product or Price, replaying retries by Idempotency-Key."""
+        endpoint = f"stripe.{kind}s.create"
+        if not self._provider_call(handler, "stripe", endpoint):
+            return
+        key = handler.headers.get("Idempotency-Key")
+        with self.lock:
+            if key in self.idempotent_responses:
+                obj = self.idempotent_responses[key]
+            else:
+                fields = _form_fields(body)
+                obj = {
+                    "id": f"{kind[:4]}_fake{next(self._ids):08d}",
+                    "object": kind,
+                    "active": True,
+                    "metadata": {
+                        name[len("metadata[") : -1]: value
+                        for name, value in fields.items()
+                        if name.startswith("metadata[")
+                    },
+                }
+                if kind == "product":
+                    obj["name"] = fields.get("name")
+                else:
+                    obj.update(
+                        product=fields.get("product"),
+                        currency=fields.get("currency"),
+                        unit_amount_decimal=fields.get("unit_amount_decimal")
+                        or fields.get("unit_amount"),
+                    )
+                getattr(self, f"{kind}s")[obj["id"]] = obj
+                if key:
+                    self.idempotent_responses[key] = obj
+            self.stats[f"{endpoint} 200"] += 1
+        self._respond(handler, 200, obj)
+
+    def _retrieve_session(self, handler, session_id: str) -> None:
+        endpoint = "stripe.checkout.sessions.retrieve"
+        if not self._provider_call(handler, "stripe", endpoint):
+            return
+        session = self.sessions.get(session_id)
+        if session is None:
+            self._count(endpoint, 404)
+            return self._respond(
+                handler,
+                404,
+                {
+                    "error": {
+                        "type": "invalid_request_error",
+                        "code": "resource_missing",
+                    }
+                },
+            )
+        self._count(endpoint, 200)
+        self._respond(handler, 200, session)
+
+    def _list_sessions(self, handler, query: dict) -> None:
+        endpoint = "stripe.checkout.sessions.list"
+        if not self._provider_call(handler, "stripe", endpoint):
+            return
+        limit = min(int(query.get("limit", ["10"])[-1]), 100)
+        created_gte = int(query.get("created[gte]", ["0"])[-1])
+        starting_after = query.get("starting_after", [None])[-1]
+        with self.lock:
+            # Newest first, like the Stripe API.
+            sessions = [
+                session
+                for session in reversed(self.sessions.values())
+                if session["created"] >= created_gte
+            ]
+        if starting_after:
+            ids = [session["id"] for session in sessions]
+            if starting_after in ids:
+                sessions = sessions[ids.index(starting_after) + 1 :]
+        self._count(endpoint, 200)
+        self._respond(
+            handler,
+            200,
+            {
+                "object": "list",
+                "url": "/v1/checkout/sessions",
+                "has_more": len(sessions) > limit,
+                "data": sessions[:limit],
+            },
+        )
+
+    def _expire_session(self, handler, session_id: str) -> None:
+        endpoint = "stripe.checkout.sessions.expire"
+        if not self._provider_call(handler, "stripe", endpoint):
+            return
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None and session["status"] == "open":
+                session["status"] = "expired"
+        if session is None:
+            self._count(endpoint, 404)
+            return self._respond(handler, 404, {"error": {"type": "invalid_request"}})
+        self._count(endpoint, 200)
+        self._respond(handler, 200, session)
+        self._deliver_webhook("checkout.session.expired", session)
+
+    def _pay(self, handler, session_id: str) -> None:
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None and session["status"] == "open":
+                session.update(status="complete", payment_status="paid")
+        if session is None or session["status"] != "complete":
+            self._count("pay", 404)
+            return self._respond(handler, 404, {"error": "Unknown or closed session"})
+        self._count("pay", 303)
+        self._deliver_webhook("checkout.session.completed", session)
+
+        handler.send_response(303)
+        handler.send_header(
+            "Location",
+            (session["success_url"] or "/").replace(
+                "{CHECKOUT_SESSION_ID}", session_id
+            ),
+        )
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+
+    def signed_event(self, event_type: str, session: dict) -> tuple[bytes, str]:
+        """A webhook body and its Stripe-Signature header for ``session``."""
+        payload = json.dumps(
+            {
+                "id": f"evt_fake{next(self._ids):08d}",
+                "object": "event",
+                "type": event_type,
+                "created": int(time.time()),
+                "data": {"object": session},
+            }
+        ).encode()
+        timestamp = int(time.time())
+        signature = hmac.new(
+            (self.webhook_secret or "").encode(),
+            f"{timestamp}.".encode() + payload,
+            hashlib.sha256,
+        ).hexdigest()
+        return payload, f"t={timestamp},v1={signature}"
+
+    def _deliver_webhook(self, event_type: str, session: dict) -> None:
+        if not self.webhook_url:
+            return
+        payload, signature = self.signed_event(event_type, session)
+        request = urllib.request.Request(
+            self.webhook_url,
+            data=payload,
+            headers={
+                "Content-Type": "application/json",
+                "Stripe-Signature": signature,
+            },
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                status = response.status
+        except OSError as exc:
+            status = getattr(exc, "code", "error")
+        self._count(f"webhook.{event_type}", status)
@@ -0,0 +1,243 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import RedisError
+from requests.adapters import HTTPAdapter
+
+from common.breaker import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+UPSTREAMS = ("stripe", "telegram")
+METRICS = ("requests", "errors", "retries", "rejected", "latency_ms")
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+def _metric_key(upstream: str, name: str) -> str:
+    return f"http:{upstream}:{name}"
+
+
+class _UpstreamMetrics:
+    """Per-upstream request counters shared by all workers through the cache.
+
+    Like the book cache stats, counts are accumulated in-process and flushed
+    with one INCR per counter every HTTP_METRICS_FLUSH_EVERY requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._requests = 0
+        self._pid = os.getpid()
+
+    def record(self, upstream: str, **counts: int) -> None:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Counts inherited from the parent are flushed by the parent.
+                self._pending, self._requests, self._pid = {}, 0, os.getpid()
+            pending = self._pending.setdefault(upstream, dict.fromkeys(METRICS, 0))
+            for name, count in counts.items():
+                pending[name] += count
+            self._requests += counts.get("requests", 0)
+            if self._requests < settings.HTTP_METRICS_FLUSH_EVERY:
+                return
+            pending, self._pending, self._requests = self._pending, {}, 0
+        self._flush(pending)
+
+    def _flush(self, pending: dict) -> None:
+        try:
+            for upstream, counts in pending.items():
+                for name, count in counts.items():
+                    if not count:
+                        continue
+                    key = _metric_key(upstream, name)
+                    if not cache.add(key, count, timeout=None):
+                        cache.incr(key, count)
+        except (RedisError, ValueError) as exc:
+            logger.warning("HTTP metrics were not flushed: %s", exc)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pending, self._pending, self._requests = self._pending, {}, 0
+        self._flush(pending)
+        keys = [
+            _metric_key(upstream, name) for upstream in UPSTREAMS for name in METRICS
+        ]
+        try:
+            stored = cache.get_many(keys)
+        except RedisError as exc:
+            logger.warning("HTTP metrics are unavailable: %s", exc)
+            stored = {}
+
+        snapshot = {}
+        for upstream in UPSTREAMS:
+            counts = {
+                name: stored.get(_metric_key(upstream, name), 0) for name in METRICS
+            }
+            latency_ms = counts.pop("latency_ms")
+            counts["avg_latency_ms"] = (
+                round(latency_ms / counts["requests"], 1)
+                if counts["requests"]
+                else None
+            )
+            counts["breaker"] = CircuitBreaker(upstream).state()
+            snapshot[upstream] = counts
+        return snapshot
+
+
+metrics = _UpstreamMetrics()
+
+
+class UpstreamClient:
+    """A keep-alive session for one upstream with timeouts and retries.
+
+    Connection errors, 429 and 5xx responses are retried up to
+    ``max_retries`` times with exponential backoff and full jitter. Requests
+    that are not idempotent are retried only without an answer from the
+    upstream or when they carry an Idempotency-Key header.
+
+    Every attempt passes the upstream's circuit breaker, so no request is
+    sent while the circuit is open and CircuitOpenError is raised instead.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        connect_timeout: float,
+        read_timeout: float,
+        max_retries: int,
+        pool_size: int,
+    ):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker(name)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _can_retry(self, method: str, headers: dict, exc: Exception = None) -> bool:
+        if method.upper() in IDEMPOTENT_METHODS or "Idempotency-Key" in headers:
+            return True
+        # The request never reached the upstream, so it is safe to send again.
+        return isinstance(exc, requests.ConnectTimeout)
+
+    def _backoff(self, attempt: int, response: requests.Response = None) -> float:
+        retry_after = response is not None and response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), settings.HTTP_RETRY_MAX_DELAY)
+        ceiling = min(
+            settings.HTTP_RETRY_BACKOFF * 2**attempt, settings.HTTP_RETRY_MAX_DELAY
+        )
+        return random.uniform(0, ceiling)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        headers = kwargs.get("headers") or {}
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                metrics.record(self.name, rejected=1)
+                raise
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                elapsed = time.perf_counter() - started
+                self.breaker.record(failed=True, seconds=elapsed)
+                metrics.record(
+                    self.name, requests=1, errors=1, latency_ms=round(elapsed * 1000)
+                )
+                if attempt >= self.max_retries or not self._can_retry(
+                    method, headers, exc
+                ):
+                    raise
+                response = None
+            else:
+                elapsed = time.perf_counter() - started
+                failed = response.status_code in RETRY_STATUSES
+                self.breaker.record(failed=failed, seconds=elapsed)
+                metrics.record(
+                    self.name,
+                    requests=1,
+                    errors=int(failed),
+                    latency_ms=round(elapsed * 1000),
+                )
+                if (
+                    not failed
+                    or attempt >= self.max_retries
+                    or not self._can_retry(method, headers)
+                ):
+                    return response
+
+            metrics.record(self.name, retries=1)
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+
+
+def get_client(name: str) -> UpstreamClient:
+    """The pooled client of an upstream, one per process.
+
+    Clients are created on first use and again after a fork, so django_q
+    workers never share sockets with the cluster process.
+    """
+    global _clients_pid
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _clients_pid = os.getpid()
+        if name not in _clients:
+            prefix = name.upper()
+            _clients[name] = UpstreamClient(
+                name,
+                connect_timeout=getattr(settings, f"{prefix}_CONNECT_TIMEOUT"),
+                read_timeout=getattr(settings, f"{prefix}_READ_TIMEOUT"),
+                max_retries=getattr(settings, f"{prefix}_MAX_RETRIES"),
+                pool_size=settings.HTTP_POOL_SIZE,
+            )
+        return _clients[name]
+
+
+class StripeHttpClient(stripe.RequestsClient):
+    """Sends stripe-python requests through the pooled "stripe" client.
+
+    stripe-python adds an Idempotency-Key to every POST, so its requests
+    are retried by UpstreamClient and its own retries are turned off.
+    """
+
+    def request(self, method, url, headers, post_data=None, **kwargs):
+        try:
+            response = get_client("stripe").request(
+                method, url, headers=headers, data=post_data
+            )
+        except CircuitOpenError:
+            raise
+        except Exception as exc:
+            self._handle_request_error(exc)
+        return response.content, response.status_code, response.headers
+
+
+def configure_stripe() -> None:
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.api_base = settings.STRIPE_API_BASE
+    stripe.max_network_retries = 0
+    stripe.default_http_client = StripeHttpClient()
@@ -0,0 +1,112 @@
+import functools
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from common.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+CLAIM_KEY_SQL = """
+    INSERT INTO common_idempotencykey (user_id, key, fingerprint, created_at)
+    VALUES (%(user_id)s, %(key)s, %(fingerprint)s, %(now)s)
+    ON CONFLICT (user_id, key) DO UPDATE
+    SET fingerprint = EXCLUDED.fingerprint,
+        created_at = EXCLUDED.created_at,
+        response_status = NULL,
+        response_body = NULL
+    WHERE common_idempotencykey.created_at < %(expired_before)s
+    RETURNING id
+"""
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used for another request."
+    default_code = "idempotency_key_reused"
+
+
+def _fingerprint(request) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.path}\n".encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _claim_key(user_id: int, key: str, fingerprint: str):
+    """Claim the key for this request or return the stored first result.
+
+    A duplicate of an in-flight request blocks on the unique index until
+    that request commits, so it replays the result instead of racing it.
+    Keys older than IDEMPOTENCY_KEY_TTL are claimed anew.
+    """
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            CLAIM_KEY_SQL,
+            {
+                "user_id": user_id,
+                "key": key,
+                "fingerprint": fingerprint,
+                "now": now,
+                "expired_before": now - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+            },
+        )
+        claimed = cursor.fetchone()
+    if claimed:
+        return claimed[0], None
+    return None, IdempotencyKey.objects.get(user_id=user_id, key=key)
+
+
+def idempotent(view_method):
+    """Replay the first successful response of a retried unsafe request.
+
+    Requests with an Idempotency-Key header run in one transaction with
+    the key, so the stored response and the writes it describes commit
+    together. Failed responses are rolled back along with the key and can
+    be retried.
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            raise ValidationError(
+                {IDEMPOTENCY_HEADER: "Must be 255 characters or less"}
+            )
+
+        fingerprint = _fingerprint(request)
+        with transaction.atomic():
+            key_id, stored = _claim_key(request.user.id, key, fingerprint)
+            if stored is not None:
+                if stored.fingerprint != fingerprint:
+                    raise IdempotencyKeyReused()
+                return Response(
+                    stored.response_body,
+                    status=stored.response_status,
+                    headers={"Idempotent-Replayed": "true"},
+                )
+
+            response = view_method(self, request, *args, **kwargs)
+            if not status.is_success(response.status_code):
+                transaction.set_rollback(True)
+                return response
+            IdempotencyKey.objects.filter(pk=key_id).update(
+                response_status=response.status_code, response_body=response.data
+            )
+        return response
+
+    return wrapper
+
+
+def purge_expired_idempotency_keys() -> None:
+    expired_before = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    IdempotencyKey.objects.filter(created_at__lt=expired_before).delete()
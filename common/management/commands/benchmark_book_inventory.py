@@ -0,0 +1,78 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from book.book_services import enable_inventory_sharding
+from book.models import Book
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare borrow/return throughput of the single-row inventory path "
+        "against sharded inventory counters on one hot book. "
+        "Creates and removes its own book in the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--operations", type=int, default=500)
+        parser.add_argument("--inventory", type=int, default=32)
+        parser.add_argument("--shards", type=int, default=None)
+        parser.add_argument(
+            "--hold-ms",
+            type=float,
+            default=2,
+            help="Time the borrow transaction keeps running after the reservation",
+        )
+
+    def _run(self, book: Book, threads: int, operations: int, hold: float) -> float:
+        def worker(_):
+            try:
+                for _ in range(operations):
+                    with transaction.atomic():
+                        reserved = Book.objects.reserve(book.pk)
+                        time.sleep(hold)
+                    if reserved:
+                        Book.objects.release(book.pk)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(worker, range(threads)))
+        return time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        threads = options["threads"]
+        operations = options["operations"]
+        hold = options["hold_ms"] / 1000
+        total = threads * operations
+
+        book = Book.objects.create(
+            title="Inventory benchmark",
+            author="benchmark_book_inventory",
+            cover=Book.CoverChoices.SOFT,
+            inventory=options["inventory"],
+            daily_fee=1,
+        )
+        try:
+            single_row = self._run(book, threads, operations, hold)
+            enable_inventory_sharding(book, shards=options["shards"])
+            sharded = self._run(book, threads, operations, hold)
+            book.refresh_from_db()
+            inventory = book.total_inventory
+        finally:
+            book.delete()
+
+        self.stdout.write(
+            f"single row: {total / single_row:.0f} borrow+return/s ({single_row:.2f}s)"
+        )
+        self.stdout.write(
+            f"sharded:    {total / sharded:.0f} borrow+return/s ({sharded:.2f}s)"
+        )
+        if inventory != options["inventory"]:
+            self.stdout.write(self.style.ERROR(f"Inventory drifted to {inventory}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Inventory is consistent"))
@@ -0,0 +1,111 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from book.models import Book
+
+SYLLABLES = (
+    "ka lo mi ren dor sa vel tri an bo cor da el fin gar hal is jun kel lim mor "
+    "nes ol pra quin ros sel tam ul var wen yor zel bre cla dri fal gre hor lun"
+).split()
+
+
+def make_word(rnd: random.Random) -> str:
+    return "".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4)))
+
+
+def make_typo(word: str) -> str:
+    middle = len(word) // 2
+    return word[: middle - 1] + word[middle] + word[middle - 1] + word[middle + 1 :]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic catalog and measure ?search= query latency. "
+        "Seeded books are removed afterwards unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=1_000_000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--vocabulary", type=int, default=200_000)
+        parser.add_argument("--authors", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--limit", type=int, default=50)
+        parser.add_argument("--keep", action="store_true")
+
+    def _seed(self, options: dict, first_number: int) -> None:
+        rnd = random.Random(42)
+        words = [make_word(rnd) for _ in range(options["vocabulary"])]
+        authors = [
+            f"{make_word(rnd).title()} {make_word(rnd).title()}"
+            for _ in range(options["authors"])
+        ]
+
+        count, batch_size = options["books"], options["batch_size"]
+        for start in range(0, count, batch_size):
+            Book.objects.bulk_create(
+                [
+                    Book(
+                        title=" ".join(rnd.choices(words, k=rnd.randint(1, 4))).title()
+                        + f" {first_number + number}",
+                        author=rnd.choice(authors),
+                        cover=rnd.choice(Book.CoverChoices.values),
+                        inventory=rnd.randint(0, 10),
+                        daily_fee=rnd.randint(1, 20),
+                    )
+                    for number in range(start, min(start + batch_size, count))
+                ]
+            )
+            self.stdout.write(f"seeded {min(start + batch_size, count)}/{count}")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE book_book")
+
+    def _queries(self, book: Book) -> list:
+        title_words = book.title.lower().split()[:-1]
+        first_name, last_name = book.author.lower().split()
+        return [
+            title_words[0],
+            " ".join(title_words[:2]),
+            last_name,
+            f"{first_name} {last_name}",
+            f"{title_words[0]} {last_name}",
+            make_typo(title_words[0]),
+            make_typo(last_name),
+        ]
+
+    def handle(self, *args, **options):
+        last_id = Book.objects.order_by("-id").values_list("id", flat=True).first()
+        last_id = last_id or 0
+
+        started = time.perf_counter()
+        self._seed(options, last_id)
+        self.stdout.write(f"seeding took {time.perf_counter() - started:.1f}s")
+        # Ids of deleted books are not reused, so count rows instead of ids.
+        sample = Book.objects.filter(id__gt=last_id).order_by("id")[
+            options["books"] // 2
+        ]
+
+        try:
+            for query in self._queries(sample):
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    found = list(
+                        Book.objects.search(query).values_list("id", flat=True)[
+                            : options["limit"]
+                        ]
+                    )
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f"{query!r:>30}: {len(found):>3} results, "
+                    f"median {statistics.median(timings):.1f}ms, "
+                    f"max {max(timings):.1f}ms"
+                )
+        finally:
+            if not options["keep"]:
+                with connection.cursor() as cursor:
+                    cursor.execute("DELETE FROM book_book WHERE id > %s", [last_id])
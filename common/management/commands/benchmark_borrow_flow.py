@@ -0,0 +1,173 @@
+import datetime
+import time
+
+import requests
+import stripe
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.test.utils import setup_databases, teardown_databases
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from book.models import Book
+from borrow.models import Borrow
+from common.fake_providers import FakeProviders
+from notifications.outbox import outbox_backlog, relay_outbox
+from payments.models import Payment
+
+WEBHOOK_SECRET = "whsec_benchmark"
+
+
+class Command(BaseCommand):
+    help = (
+        "Run borrows through checkout, payment and an overdue return against "
+        "local fake Stripe and Telegram servers and report the throughput of "
+        "every phase. It runs on a throwaway test database, which is "
+        "created and dropped again, so the relay never touches real events."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--borrows", type=int, default=200)
+        parser.add_argument("--latency-ms", type=float, default=50)
+        parser.add_argument("--jitter-ms", type=float, default=0)
+        parser.add_argument("--error-rate", type=float, default=0)
+        parser.add_argument("--stripe-rps", type=float, default=0)
+        parser.add_argument("--telegram-rps", type=float, default=0)
+        parser.add_argument(
+            "--drain-timeout",
+            type=float,
+            default=120,
+            help="Seconds to wait for failed outbox events to be retried",
+        )
+
+    def _post(self, client: APIClient, url: str, **kwargs):
+        response = client.post(url, **kwargs)
+        if response.status_code >= 300:
+            raise CommandError(f"POST {url} returned {response.status_code}")
+        return response
+
+    def _borrow(self, client: APIClient, book: Book, count: int) -> int:
+        # Overdue from the start, so every return is charged a fine.
+        today = datetime.date.today()
+        for _ in range(count):
+            self._post(
+                client,
+                reverse("borrow:borrow-list"),
+                data={
+                    "borrow_date": today - datetime.timedelta(days=10),
+                    "expected_return_date": today - datetime.timedelta(days=3),
+                    "book": book.id,
+                },
+            )
+        return count
+
+    def _drain(self, timeout: float) -> int:
+        processed = 0
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            report = relay_outbox()
+            processed += report["processed"]
+            if sum(report.values()):
+                continue
+            if not outbox_backlog()["pending"]:
+                break
+            time.sleep(0.1)
+        return processed
+
+    def _pay(self, client: APIClient, providers: FakeProviders, user) -> int:
+        """Complete every pending session and deliver its signed webhook."""
+        paid = 0
+        payments = Payment.objects.filter(
+            borrowing__user=user, status=Payment.StatusChoices.PENDING
+        )
+        with requests.Session() as browser:
+            for session_url, session_id in payments.values_list(
+                "session_url", "session_id"
+            ):
+                browser.get(session_url, allow_redirects=False).raise_for_status()
+                payload, signature = providers.signed_event(
+                    "checkout.session.completed", providers.sessions[session_id]
+                )
+                self._post(
+                    client,
+                    reverse("payment:webhook"),
+                    data=payload,
+                    content_type="application/json",
+                    HTTP_STRIPE_SIGNATURE=signature,
+                )
+                paid += 1
+        return paid
+
+    def _return(self, client: APIClient, user) -> int:
+        borrow_ids = list(
+            Borrow.objects.filter(user=user, is_active=True).values_list(
+                "id", flat=True
+            )
+        )
+        for borrow_id in borrow_ids:
+            self._post(
+                client, reverse("borrow:borrow-return-of-borrow", args=[borrow_id])
+            )
+        return len(borrow_ids)
+
+    def _timed(self, phase: str, run, *args) -> None:
+        started = time.perf_counter()
+        count = run(*args)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{phase}: {count} in {elapsed:.2f}s, {count / max(elapsed, 1e-9):.1f}/s"
+        )
+
+    def handle(self, *args, **options):
+        # relay_outbox hands off every pending event, so with Stripe and
+        # Telegram pointed at the fake it must not see a real database.
+        databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            self._run(options)
+        finally:
+            teardown_databases(databases, verbosity=0)
+
+    def _run(self, options: dict) -> None:
+        book = Book.objects.create(
+            title="Benchmark book",
+            author="Benchmark author",
+            cover="hard",
+            inventory=options["borrows"],
+            daily_fee=1,
+        )
+        user = get_user_model().objects.create_user(
+            email="flow@example.com", password="benchmark"
+        )
+        client = APIClient(SERVER_NAME="localhost")
+        client.force_authenticate(user)
+
+        providers = FakeProviders(
+            latency_ms=options["latency_ms"],
+            jitter_ms=options["jitter_ms"],
+            error_rate=options["error_rate"],
+            stripe_rps=options["stripe_rps"],
+            telegram_rps=options["telegram_rps"],
+            webhook_secret=WEBHOOK_SECRET,
+        )
+        providers.start()
+        api_base, api_key = stripe.api_base, stripe.api_key
+        # The fake accepts any key, stripe-python only needs one to be set.
+        stripe.api_base, stripe.api_key = providers.url, api_key or "sk_test_fake"
+        drain_timeout = options["drain_timeout"]
+
+        try:
+            with override_settings(
+                TELEGRAM_API_URL=providers.url, STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET
+            ):
+                self._timed("borrow", self._borrow, client, book, options["borrows"])
+                self._timed("relay checkout and messages", self._drain, drain_timeout)
+                self._timed("pay", self._pay, client, providers, user)
+                self._timed("relay paid messages", self._drain, drain_timeout)
+                self._timed("return overdue", self._return, client, user)
+                self._timed("relay fine checkout", self._drain, drain_timeout)
+            for endpoint, count in sorted(providers.stats.items()):
+                self.stdout.write(f"  {endpoint}: {count}")
+        finally:
+            stripe.api_base, stripe.api_key = api_base, api_key
+            providers.stop()
@@ -0,0 +1,105 @@
+import datetime
+from datetime import timedelta
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from book.models import Book
+from borrow.borrow_services import checking_overdue_borrows
+from borrow.models import Borrow
+from common.fake_providers import FakeProviders
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed overdue borrows and time checking_overdue_borrows against a "
+        "local fake Telegram with a fixed latency per message, then time the "
+        "next hourly run. Seeded rows are removed afterwards unless --keep "
+        "is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--borrows", type=int, default=100_000)
+        parser.add_argument("--books", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=5000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--latency-ms", type=float, default=50)
+        parser.add_argument("--concurrency", type=int, default=None)
+        parser.add_argument("--keep", action="store_true")
+
+    def _seed(self, options: dict, tag: str) -> None:
+        books = Book.objects.bulk_create(
+            Book(
+                title=f"Benchmark book {number} {tag}",
+                author=f"Benchmark author {number % 100}",
+                cover="hard",
+                inventory=1,
+                daily_fee=1,
+            )
+            for number in range(options["books"])
+        )
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"overdue_{number}_{tag}@example.com")
+            for number in range(options["users"])
+        )
+        today = datetime.date.today()
+        count, batch_size = options["borrows"], options["batch_size"]
+        for start in range(0, count, batch_size):
+            Borrow.objects.bulk_create(
+                Borrow(
+                    borrow_date=today - datetime.timedelta(days=60),
+                    expected_return_date=today
+                    - datetime.timedelta(days=number % 30 + 1),
+                    book=books[number % len(books)],
+                    user=users[number % len(users)],
+                )
+                for number in range(start, min(start + batch_size, count))
+            )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE borrow_borrow")
+
+    def _cleanup(self, tag: str) -> None:
+        Borrow.objects.filter(book__title__endswith=f" {tag}").delete()
+        Book.objects.filter(title__endswith=f" {tag}").delete()
+        get_user_model().objects.filter(email__endswith=f"_{tag}@example.com").delete()
+
+    def handle(self, *args, **options):
+        tag = f"bench{time.time_ns()}"
+        started = time.perf_counter()
+        self._seed(options, tag)
+        self.stdout.write(
+            f"seeded {options['borrows']} overdue borrows "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+        providers = FakeProviders(latency_ms=options["latency_ms"])
+        providers.start()
+        overrides = {"TELEGRAM_API_URL": providers.url}
+        if options["concurrency"]:
+            overrides["TELEGRAM_MAX_CONCURRENCY"] = options["concurrency"]
+
+        try:
+            with override_settings(**overrides):
+                started = time.perf_counter()
+                sent = checking_overdue_borrows()
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"first run: {options['borrows']} overdue borrows sent as "
+                    f"{sent} messages ({len(providers.messages)} received) "
+                    f"in {elapsed:.1f}s"
+                )
+
+                started = time.perf_counter()
+                sent = checking_overdue_borrows(timezone.now() + timedelta(hours=1))
+                self.stdout.write(
+                    f"next hourly run: {sent} messages "
+                    f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+                )
+        finally:
+            providers.stop()
+            if not options["keep"]:
+                self._cleanup(tag)
@@ -0,0 +1,125 @@
+import copy
+import datetime
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from book.models import Book
+from borrow.models import Borrow
+from payments.payment_services import calculate_fine_amount, total_amount
+from payments.pricing import annotate_prices, quote_totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed borrows and compare pricing them one by one with total_amount "
+        "and calculate_fine_amount against annotate_prices in SQL. Seeded "
+        "rows are removed afterwards unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--borrows", type=int, default=100_000)
+        parser.add_argument("--books", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=5000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--keep", action="store_true")
+
+    def _seed(self, options: dict, tag: str) -> None:
+        books = Book.objects.bulk_create(
+            Book(
+                title=f"Benchmark book {number} {tag}",
+                author=f"Benchmark author {number % 100}",
+                cover="hard",
+                inventory=1,
+                daily_fee=Decimal(number % 2000 + 1) / 100,
+            )
+            for number in range(options["books"])
+        )
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"pricing_{number}_{tag}@example.com")
+            for number in range(options["users"])
+        )
+        today = datetime.date.today()
+        count, batch_size = options["borrows"], options["batch_size"]
+        for start in range(0, count, batch_size):
+            Borrow.objects.bulk_create(
+                Borrow(
+                    borrow_date=today - datetime.timedelta(days=30),
+                    expected_return_date=today
+                    - datetime.timedelta(days=number % 40 - 10),
+                    # Every third borrow is returned, some of them late.
+                    actual_return_date=(
+                        today - datetime.timedelta(days=number % 7)
+                        if number % 3 == 0
+                        else None
+                    ),
+                    is_active=number % 3 != 0,
+                    book=books[number % len(books)],
+                    user=users[number % len(users)],
+                )
+                for number in range(start, min(start + batch_size, count))
+            )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE borrow_borrow")
+
+    def _cleanup(self, tag: str) -> None:
+        Borrow.objects.filter(book__title__endswith=f" {tag}").delete()
+        Book.objects.filter(title__endswith=f" {tag}").delete()
+        get_user_model().objects.filter(email__endswith=f"_{tag}@example.com").delete()
+
+    def _per_instance(self, borrows, today: datetime.date) -> dict:
+        totals = {"borrows": 0, "rental_total": 0, "fine": 0}
+        for borrow in borrows.select_related("book").iterator(chunk_size=2000):
+            returned = copy.copy(borrow)
+            returned.actual_return_date = borrow.actual_return_date or today
+            totals["borrows"] += 1
+            totals["rental_total"] += total_amount(borrow)
+            totals["fine"] += max(calculate_fine_amount(returned), 0)
+        totals["total"] = totals["rental_total"] + totals["fine"]
+        return totals
+
+    def handle(self, *args, **options):
+        tag = f"bench{time.time_ns()}"
+        started = time.perf_counter()
+        self._seed(options, tag)
+        self.stdout.write(
+            f"seeded {options['borrows']} borrows "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+        today = datetime.date.today()
+        borrows = Borrow.objects.filter(book__title__endswith=f" {tag}")
+        try:
+            started = time.perf_counter()
+            expected = self._per_instance(borrows, today)
+            per_instance = time.perf_counter() - started
+            self.stdout.write(
+                f"per instance: {per_instance:.2f}s, "
+                f"{expected['borrows'] / per_instance:.0f} borrows/s"
+            )
+
+            started = time.perf_counter()
+            totals = quote_totals(annotate_prices(borrows, today))
+            in_sql = time.perf_counter() - started
+            self.stdout.write(
+                f"annotate_prices: {in_sql:.2f}s, "
+                f"{totals['borrows'] / in_sql:.0f} borrows/s, "
+                f"{per_instance / in_sql:.1f}x faster"
+            )
+
+            started = time.perf_counter()
+            page = list(annotate_prices(borrows, today).order_by("-id")[:100])
+            self.stdout.write(
+                f"one page of {len(page)} quotes: "
+                f"{(time.perf_counter() - started) * 1000:.1f}ms"
+            )
+
+            if totals != expected:
+                raise CommandError(f"Totals differ: {totals} != {expected}")
+            self.stdout.write(f"totals match: {totals}")
+        finally:
+            if not options["keep"]:
+                self._cleanup(tag)
@@ -1,15 +1,23 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django_q.models import Schedule
 
 
 class Command(BaseCommand):
     def handle(self, *args, **options):
-        schedule, created = Schedule.objects.get_or_create(
+        schedule, created = Schedule.objects.update_or_create(
             func="borrow.borrow_services.checking_overdue_borrows",
-            schedule_type=Schedule.DAILY,
-            repeats=-1,
+            defaults={
+                "schedule_type": Schedule.HOURLY,
+                "repeats": -1,
+                # The fan-out coordinator waits for its shards, so it may
+                # outlive the cluster-wide task timeout.
+                "kwargs": str(
+                    {"q_options": {"timeout": settings.OVERDUE_FANOUT_TIMEOUT + 60}}
+                ),
+            },
         )
         if created:
             self.stdout.write(self.style.SUCCESS("Schedule created successfully"))
         else:
-            self.stdout.write(self.style.WARNING("Schedule already exists"))
+            self.stdout.write(self.style.WARNING("Schedule already exists, updated"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+
+
+class Command(BaseCommand):
+    def handle(self, *args, **options):
+        schedule, created = Schedule.objects.get_or_create(
+            func="payments.payment_services.expire_stale_sessions",
+            defaults={
+                "schedule_type": Schedule.MINUTES,
+                "minutes": 15,
+                "repeats": -1,
+            },
+        )
+        if created:
+            self.stdout.write(self.style.SUCCESS("Schedule created successfully"))
+        else:
+            self.stdout.write(self.style.WARNING("Schedule already exists"))
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common.fake_providers import FakeProviders
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local stand-in for the Stripe Checkout API and Telegram "
+        "sendMessage. Set FAKE_PROVIDERS_URL to its address to use it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency-ms", type=float, default=0)
+        parser.add_argument("--jitter-ms", type=float, default=0)
+        parser.add_argument(
+            "--error-rate", type=float, default=0, help="Share of requests failing"
+        )
+        parser.add_argument(
+            "--stripe-rps", type=float, default=0, help="Stripe rate limit, 0 is off"
+        )
+        parser.add_argument(
+            "--telegram-rps",
+            type=float,
+            default=0,
+            help="Telegram rate limit, 0 is off",
+        )
+        parser.add_argument(
+            "--webhook-url",
+            default=None,
+            help="Receives signed checkout.session.* events, "
+            "ex. http://localhost:8000/api/v1/library/payment/webhook/",
+        )
+
+    def handle(self, *args, **options):
+        providers = FakeProviders(
+            host=options["host"],
+            port=options["port"],
+            latency_ms=options["latency_ms"],
+            jitter_ms=options["jitter_ms"],
+            error_rate=options["error_rate"],
+            stripe_rps=options["stripe_rps"],
+            telegram_rps=options["telegram_rps"],
+            webhook_url=options["webhook_url"],
+            webhook_secret=settings.STRIPE_WEBHOOK_SECRET,
+        )
+        self.stdout.write(f"Fake Stripe and Telegram listening on {providers.url}")
+        try:
+            providers.serve_forever()
+        except KeyboardInterrupt:
+            pass
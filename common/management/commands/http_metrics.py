@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from common.http import metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Print request, error, retry and rejected counts, latency and the "
+        "circuit breaker state per upstream."
+    )
+
+    def handle(self, *args, **options):
+        for upstream, counts in metrics.snapshot().items():
+            self.stdout.write(
+                f"{upstream}: {counts['requests']} requests, "
+                f"{counts['errors']} errors, {counts['retries']} retries, "
+                f"{counts['rejected']} rejected, "
+                f"avg latency {counts['avg_latency_ms']} ms, "
+                f"circuit {counts['breaker']['state']}"
+            )
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from book.book_services import IMPORT_FORMATS, import_books
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert books from a CSV or NDJSON file (or '-' for stdin) "
+        "with title, author, cover, inventory and daily_fee fields."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, default=None)
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or path.rsplit(".", 1)[-1].lower()
+        if file_format in ("jsonl", "json"):
+            file_format = "ndjson"
+        if file_format not in IMPORT_FORMATS:
+            raise CommandError("Use --format csv or --format ndjson")
+
+        if path == "-":
+            report = import_books(sys.stdin, file_format, options["batch_size"])
+        else:
+            with open(path, encoding="utf-8", newline="") as lines:
+                report = import_books(lines, file_format, options["batch_size"])
+
+        for error in report["errors"]:
+            self.stdout.write(
+                self.style.ERROR(f"row {error['row']}: {error['errors']}")
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report['imported']} books, {report['failed']} rows failed"
+            )
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+
+
+class Command(BaseCommand):
+    def handle(self, *args, **options):
+        schedule, created = Schedule.objects.get_or_create(
+            func="common.idempotency.purge_expired_idempotency_keys",
+            schedule_type=Schedule.DAILY,
+            repeats=-1,
+        )
+        if created:
+            self.stdout.write(self.style.SUCCESS("Schedule created successfully"))
+        else:
+            self.stdout.write(self.style.WARNING("Schedule already exists"))
@@ -0,0 +1,57 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.outbox import outbox_backlog, relay_outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Drain the outbox and hand events to their handlers. Several relays "
+        "can run in parallel. Throughput and backlog are reported every "
+        "--stats-every seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--interval", type=float, default=settings.OUTBOX_POLL_INTERVAL
+        )
+        parser.add_argument("--stats-every", type=float, default=60)
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the outbox once and exit"
+        )
+
+    def _report_stats(self, totals: dict, elapsed: float) -> None:
+        backlog = outbox_backlog()
+        self.stdout.write(
+            f"processed {totals['processed']}, failed {totals['failed']}, "
+            f"deferred {totals['deferred']}, "
+            f"{totals['processed'] / elapsed:.1f} events/s, "
+            f"pending {backlog['pending']}, lag {backlog['lag']:.1f}s"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"] or settings.OUTBOX_BATCH_SIZE
+        totals = {"processed": 0, "failed": 0, "deferred": 0}
+        stats_started = time.monotonic()
+
+        try:
+            while True:
+                report = relay_outbox(batch_size)
+                for name, count in report.items():
+                    totals[name] += count
+
+                if time.monotonic() - stats_started >= options["stats_every"]:
+                    self._report_stats(totals, time.monotonic() - stats_started)
+                    totals = dict.fromkeys(totals, 0)
+                    stats_started = time.monotonic()
+
+                if sum(report.values()) < batch_size:
+                    if options["once"]:
+                        break
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        self._report_stats(totals, max(time.monotonic() - stats_started, 1e-9))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination over the primary key index.
+
+    Pages are fetched with ``WHERE id < <cursor>`` instead of OFFSET, so deep
+    pages cost the same as the first one.
+    """
+
+    ordering = "-id"
+    page_size_query_param = "page_size"
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class RankedPageNumberPagination(PageNumberPagination):
+    """Pagination for relevance-ordered results, which have no stable keyset."""
+
+    page_size_query_param = "page_size"
+    max_page_size = settings.API_MAX_PAGE_SIZE
@@ -1,3 +1,314 @@
-from django.test import TestCase
+import datetime
+import json
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+import stripe
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from book.models import Book
+from common.breaker import CircuitBreaker, CircuitOpenError
+from common.fake_providers import FakeProviders, _RateLimiter
+from common.http import UpstreamClient, get_client, metrics
+from notifications.models import OutboxEvent
+from notifications.outbox import relay_outbox
+from payments.models import Payment
+from payments.stripe_prices import price_cache
+
+
+class ImportBooksCommandTest(TestCase):
+    def test_import_books_from_ndjson_file(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson") as file:
+            file.write(
+                '{"title": "Title_book_1", "author": "Author_book_1", '
+                '"cover": "hard", "inventory": 3, "daily_fee": 10}\n'
+            )
+            file.flush()
+            call_command("import_books", file.name, stdout=StringIO())
+
+        self.assertTrue(Book.objects.filter(title="Title_book_1").exists())
+
+
+def fake_response(status_code: int, body: dict = None, headers: dict = None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body or {}).encode()
+    response.headers.update(headers or {})
+    return response
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    HTTP_METRICS_FLUSH_EVERY=1,
+)
+@mock.patch("common.http.time.sleep")
+@mock.patch("common.http.requests.Session.request")
+class UpstreamClientTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = UpstreamClient(
+            "telegram", connect_timeout=1, read_timeout=2, max_retries=2, pool_size=4
+        )
+
+    def test_server_errors_are_retried_with_bounded_backoff(self, mock_request, sleep):
+        mock_request.side_effect = [
+            fake_response(503),
+            fake_response(429, headers={"Retry-After": "60"}),
+            fake_response(200),
+        ]
+
+        response = self.client.request("GET", "https://upstream.test/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_request.call_count, 3)
+        self.assertEqual(mock_request.call_args.kwargs["timeout"], (1, 2))
+        self.assertLessEqual(sleep.call_args_list[0].args[0], 0.5)
+        self.assertEqual(sleep.call_args_list[1].args[0], 5)
+        snapshot = metrics.snapshot()["telegram"]
+        self.assertEqual(
+            [snapshot["requests"], snapshot["errors"], snapshot["retries"]], [3, 2, 2]
+        )
+
+    def test_retries_stop_after_max_retries(self, mock_request, sleep):
+        mock_request.return_value = fake_response(502)
+
+        response = self.client.request("GET", "https://upstream.test/")
+
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(mock_request.call_count, 3)
+
+    def test_post_is_not_resent_after_read_timeout(self, mock_request, sleep):
+        mock_request.side_effect = requests.ReadTimeout()
+
+        with self.assertRaises(requests.ReadTimeout):
+            self.client.post("https://upstream.test/", json={})
+        self.assertEqual(mock_request.call_count, 1)
+
+    def test_post_is_resent_after_connect_timeout(self, mock_request, sleep):
+        mock_request.side_effect = [requests.ConnectTimeout(), fake_response(200)]
+
+        response = self.client.post("https://upstream.test/", json={})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_request.call_count, 2)
+
+    def test_post_with_idempotency_key_is_resent_after_server_error(
+        self, mock_request, sleep
+    ):
+        mock_request.side_effect = [fake_response(500), fake_response(200)]
+
+        self.client.post("https://upstream.test/", headers={"Idempotency-Key": "key"})
+
+        self.assertEqual(mock_request.call_count, 2)
+
+    def test_stripe_calls_use_pooled_client(self, mock_request, sleep):
+        mock_request.side_effect = [
+            fake_response(500),
+            fake_response(200, {"id": "cs_test_1", "object": "checkout.session"}),
+        ]
+
+        session = stripe.checkout.Session.create(api_key="sk_test", mode="payment")
+
+        headers = mock_request.call_args.kwargs["headers"]
+        self.assertEqual(session.id, "cs_test_1")
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(
+            mock_request.call_args.kwargs["timeout"],
+            get_client("stripe").timeout,
+        )
+        self.assertIn("Idempotency-Key", headers)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    BREAKER_MIN_CALLS=4,
+    BREAKER_FAILURE_RATE=0.5,
+    BREAKER_OPEN_SECONDS=30,
+)
+@mock.patch("common.http.time.sleep")
+@mock.patch("common.http.requests.Session.request")
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = UpstreamClient(
+            "stripe", connect_timeout=1, read_timeout=2, max_retries=0, pool_size=4
+        )
+
+    def _fail_until_open(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError()
+        for _ in range(4):
+            with self.assertRaises(requests.ConnectionError):
+                self.client.request("GET", "https://upstream.test/")
+
+    def test_failures_open_circuit_and_reject_calls(self, mock_request, sleep):
+        self._fail_until_open(mock_request)
+        mock_request.reset_mock()
+
+        with self.assertRaisesMessage(CircuitOpenError, "Stripe is unavailable"):
+            self.client.request("GET", "https://upstream.test/")
+        mock_request.assert_not_called()
+        self.assertEqual(CircuitBreaker("stripe").state()["state"], "open")
+
+    def test_slow_calls_count_as_failures(self, mock_request, sleep):
+        mock_request.return_value = fake_response(200)
+        breaker = CircuitBreaker("stripe")
+        with override_settings(BREAKER_SLOW_CALL_SECONDS=0):
+            for _ in range(4):
+                breaker.record(failed=False, seconds=0.1)
+
+        self.assertEqual(breaker.state()["state"], "open")
+
+    def test_half_open_probe_closes_circuit(self, mock_request, sleep):
+        self._fail_until_open(mock_request)
+        mock_request.side_effect = None
+        mock_request.return_value = fake_response(200)
+
+        with mock.patch("common.breaker.time.time", return_value=time.time() + 31):
+            self.assertEqual(CircuitBreaker("stripe").state()["state"], "half_open")
+            CircuitBreaker("stripe").before_call()
+            # Other callers wait while the probe is in flight.
+            with self.assertRaises(CircuitOpenError):
+                self.client.request("GET", "https://upstream.test/")
+            CircuitBreaker("stripe").record(failed=False, seconds=0.1)
+
+        self.assertEqual(CircuitBreaker("stripe").state()["state"], "closed")
+        self.assertEqual(
+            self.client.request("GET", "https://upstream.test/").status_code, 200
+        )
+
+    def test_failed_probe_reopens_circuit(self, mock_request, sleep):
+        self._fail_until_open(mock_request)
+
+        with mock.patch("common.breaker.time.time", return_value=time.time() + 31):
+            with self.assertRaises(requests.ConnectionError):
+                self.client.request("GET", "https://upstream.test/")
+            self.assertEqual(CircuitBreaker("stripe").state()["state"], "open")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    STRIPE_WEBHOOK_SECRET="whsec_test",
+)
+class FakeProvidersTest(TestCase):
+    """Borrow and payment flow over real HTTP against the local providers."""
+
+    def setUp(self):
+        cache.clear()
+        price_cache.clear()
+        self.providers = FakeProviders(webhook_secret="whsec_test")
+        self.providers.start()
+        self.addCleanup(self.providers.stop)
+        self.enterContext(mock.patch("stripe.api_base", self.providers.url))
+        self.enterContext(mock.patch("stripe.api_key", "sk_test"))
+        self.enterContext(override_settings(TELEGRAM_API_URL=self.providers.url))
+
+        self.user = get_user_model().objects.create_user(
+            email="user_1@user.com", password="password"
+        )
+        self.book = Book.objects.create(
+            title="Title_book_1",
+            author="Author_book_1",
+            cover="hard",
+            inventory=3,
+            daily_fee=10,
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def _borrow(self) -> Payment:
+        res = self.api.post(
+            reverse("borrow:borrow-list"),
+            {
+                "borrow_date": datetime.date(2025, 12, 17),
+                "expected_return_date": datetime.date(2025, 12, 19),
+                "book": self.book.id,
+            },
+        )
+        self.assertEqual(res.status_code, 201)
+        return Payment.objects.get(borrowing_id=res.data["id"])
+
+    def test_borrow_flow_reaches_fake_providers(self):
+        payment = self._borrow()
+
+        report = relay_outbox()
+        payment.refresh_from_db()
+
+        self.assertEqual(report["processed"], 2)
+        self.assertEqual(payment.status, Payment.StatusChoices.PENDING)
+        self.assertTrue(payment.session_url.startswith(f"{self.providers.url}/pay/"))
+        session = self.providers.sessions[payment.session_id]
+        self.assertEqual(session["amount_total"], 2000)
+        self.assertEqual(len(self.providers.messages), 1)
+        self.assertEqual(
+            stripe.checkout.Session.retrieve(payment.session_id).status, "open"
+        )
+
+        payload, signature = self.providers.signed_event(
+            "checkout.session.completed", {**session, "payment_status": "paid"}
+        )
+        res = self.api.post(
+            reverse("payment:webhook"),
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=signature,
+        )
+        payment.refresh_from_db()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(payment.status, Payment.StatusChoices.PAID)
+
+    def test_sessions_are_listed_newest_first_and_expired(self):
+        first = stripe.checkout.Session.create(mode="payment", idempotency_key="a")
+        second = stripe.checkout.Session.create(mode="payment", idempotency_key="b")
+        again = stripe.checkout.Session.create(mode="payment", idempotency_key="a")
+
+        listed = stripe.checkout.Session.list(limit=1)
+        expired = stripe.checkout.Session.expire(first.id)
+
+        self.assertEqual(again.id, first.id)
+        self.assertEqual(listed.data[0].id, second.id)
+        self.assertTrue(listed.has_more)
+        self.assertEqual(
+            [session.id for session in listed.auto_paging_iter()],
+            [second.id, first.id],
+        )
+        self.assertEqual(expired.status, "expired")
+
+    @mock.patch("common.http.time.sleep")
+    def test_errors_and_rate_limits_are_retried(self, sleep):
+        self.providers.error_rate = 1
+        payment = self._borrow()
+
+        report = relay_outbox()
+
+        self.assertEqual(report["failed"], 2)
+        self.assertEqual(
+            self.providers.stats["stripe.products.create 500"],
+            settings.STRIPE_MAX_RETRIES + 1,
+        )
+
+        self.providers.error_rate = 0
+        limiter = self.providers.limiters["stripe"] = _RateLimiter(1)
+        limiter.tokens = 0
+        # The bucket refills while the client waits out Retry-After.
+        sleep.side_effect = lambda seconds: setattr(limiter, "tokens", 1)
+        OutboxEvent.objects.update(available_at=timezone.now())
+        report = relay_outbox()
+        payment.refresh_from_db()
+
+        self.assertEqual(report["processed"], 2)
+        for endpoint in ("products", "prices", "checkout.sessions"):
+            self.assertEqual(self.providers.stats[f"stripe.{endpoint}.create 429"], 1)
+        sleep.assert_called_with(1.0)
+        self.assertEqual(payment.status, Payment.StatusChoices.PENDING)
+        self.assertEqual(len(self.providers.messages), 1)
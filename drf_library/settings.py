@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from datetime import timedelta
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 
@@ -28,6 +29,7 @@ load_dotenv(os.path.join(BASE_DIR, ".env"))
 SECRET_KEY = os.getenv("SECRET_KEY")
 
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
@@ -44,6 +46,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "debug_toolbar",
     "book",
@@ -150,8 +153,14 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.AllowAny",),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_PAGINATION_CLASS": "common.pagination.IdCursorPagination",
+    "PAGE_SIZE": int(os.getenv("API_PAGE_SIZE", 50)),
 }
 
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", 500))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 24 * 60 * 60))
+
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
@@ -160,9 +169,27 @@ SIMPLE_JWT = {
     "AUTH_HEADER_NAME": "HTTP_AUTHORIZE",
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": (
+            f"redis://{os.getenv('REDIS_HOST', 'localhost')}:"
+            f"{os.getenv('REDIS_PORT', 6379)}/1"
+        ),
+        "OPTIONS": {
+            "socket_connect_timeout": 0.5,
+            "socket_timeout": 0.5,
+        },
+    },
+}
+
+BOOK_CACHE_ALIAS = "default"
+BOOK_CACHE_TIMEOUT = int(os.getenv("BOOK_CACHE_TIMEOUT", 60 * 60))
+BOOK_CACHE_STATS_FLUSH_EVERY = int(os.getenv("BOOK_CACHE_STATS_FLUSH_EVERY", 100))
+
 Q_CLUSTER = {
     "name": "drf_library",
-    "workers": 4,
+    "workers": int(os.getenv("Q_WORKERS", 4)),
     "recycle": 100,
     "timeout": 60,
     "compress": True,
@@ -176,6 +203,79 @@ Q_CLUSTER = {
     },
 }
 
+BOOK_INVENTORY_SHARDS = int(os.getenv("BOOK_INVENTORY_SHARDS", 8))
+BOOK_INVENTORY_SHARDING_THRESHOLD = int(
+    os.getenv("BOOK_INVENTORY_SHARDING_THRESHOLD", 50)
+)
+BOOK_INVENTORY_SHARDING_WINDOW_DAYS = int(
+    os.getenv("BOOK_INVENTORY_SHARDING_WINDOW_DAYS", 7)
+)
+BOOK_IMPORT_BATCH_SIZE = int(os.getenv("BOOK_IMPORT_BATCH_SIZE", 5000))
+BOOK_INVENTORY_ADJUSTMENT_MAX_ITEMS = int(
+    os.getenv("BOOK_INVENTORY_ADJUSTMENT_MAX_ITEMS", 10000)
+)
+
+# Points Stripe and Telegram at one local stand-in (manage.py fake_providers).
+FAKE_PROVIDERS_URL = os.getenv("FAKE_PROVIDERS_URL")
+TELEGRAM_API_URL = FAKE_PROVIDERS_URL or os.getenv(
+    "TELEGRAM_API_URL", "https://api.telegram.org"
+)
+STRIPE_API_BASE = FAKE_PROVIDERS_URL or os.getenv(
+    "STRIPE_API_BASE", "https://api.stripe.com"
+)
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", 3.05))
+TELEGRAM_READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", 10))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", 2))
+TELEGRAM_MAX_CONCURRENCY = int(os.getenv("TELEGRAM_MAX_CONCURRENCY", 4))
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", 3.05))
+STRIPE_READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", 30))
+STRIPE_MAX_RETRIES = int(os.getenv("STRIPE_MAX_RETRIES", 2))
+# Keep-alive connections per upstream and process, at least
+# TELEGRAM_MAX_CONCURRENCY.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.5))
+HTTP_RETRY_MAX_DELAY = float(os.getenv("HTTP_RETRY_MAX_DELAY", 5))
+HTTP_METRICS_FLUSH_EVERY = int(os.getenv("HTTP_METRICS_FLUSH_EVERY", 50))
+# Circuit breaker per upstream: open for BREAKER_OPEN_SECONDS when the share
+# of failed or slow calls within the window reaches BREAKER_FAILURE_RATE.
+BREAKER_WINDOW_SECONDS = int(os.getenv("BREAKER_WINDOW_SECONDS", 60))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 20))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", 0.5))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", 5))
+BREAKER_OPEN_SECONDS = int(os.getenv("BREAKER_OPEN_SECONDS", 30))
+# "defer" reschedules outbox events while a circuit is open, "fail_fast"
+# counts the CircuitOpenError as a failed attempt.
+BREAKER_OPEN_BEHAVIOR = os.getenv("BREAKER_OPEN_BEHAVIOR", "defer")
+OVERDUE_SCAN_CHUNK_SIZE = int(os.getenv("OVERDUE_SCAN_CHUNK_SIZE", 2000))
+# Days between overdue reminders; the last interval repeats, empty disables.
+OVERDUE_REMINDER_INTERVALS = [
+    int(days)
+    for days in os.getenv("OVERDUE_REMINDER_INTERVALS", "1,3,7").split(",")
+    if days.strip()
+]
+# A reminder due right away would be picked up again by the same run.
+if any(days <= 0 for days in OVERDUE_REMINDER_INTERVALS):
+    raise ImproperlyConfigured("OVERDUE_REMINDER_INTERVALS must be positive days")
+# Split the overdue run into this many django_q tasks; 1 runs it inline.
+OVERDUE_FANOUT_SHARDS = int(os.getenv("OVERDUE_FANOUT_SHARDS", 1))
+OVERDUE_FANOUT_TIMEOUT = int(os.getenv("OVERDUE_FANOUT_TIMEOUT", 15 * 60))
+
+# Checkout sessions expire after 24 hours, so older ones are never paid.
+STRIPE_RECONCILE_LOOKBACK = int(os.getenv("STRIPE_RECONCILE_LOOKBACK", 25 * 60 * 60))
+STRIPE_RECONCILE_PAGE_SIZE = int(os.getenv("STRIPE_RECONCILE_PAGE_SIZE", 100))
+# Book Stripe Price ids kept in each process, see payments.stripe_prices.
+STRIPE_PRICE_CACHE_SIZE = int(os.getenv("STRIPE_PRICE_CACHE_SIZE", 2048))
+PAYMENT_EXPIRE_CHUNK_SIZE = int(os.getenv("PAYMENT_EXPIRE_CHUNK_SIZE", 1000))
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 1.0))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 10))
+OUTBOX_MAX_RETRY_DELAY = int(os.getenv("OUTBOX_MAX_RETRY_DELAY", 60 * 60))
+# Claimed events are due again after this many seconds if their relay dies.
+OUTBOX_LEASE = int(os.getenv("OUTBOX_LEASE", 15 * 60))
+OUTBOX_RETENTION = int(os.getenv("OUTBOX_RETENTION", 7 * 24 * 60 * 60))
+OUTBOX_PURGE_CHUNK_SIZE = int(os.getenv("OUTBOX_PURGE_CHUNK_SIZE", 1000))
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "DRF Library API",
     "DESCRIPTION": "Project intended for managing library borrow",
@@ -1,3 +1,8 @@
 from django.contrib import admin
+from notifications.models import OutboxEvent
 
-# Register your models here.
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "event_type", "created_at", "processed_at", "attempts")
+    list_filter = ("event_type",)
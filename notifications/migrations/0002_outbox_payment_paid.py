@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0001_outbox_event"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="outboxevent",
+            name="event_type",
+            field=models.CharField(
+                choices=[
+                    ("borrow_created", "Borrow Created"),
+                    ("checkout_requested", "Checkout Requested"),
+                    ("payment_paid", "Payment Paid"),
+                ],
+                max_length=50,
+            ),
+        ),
+    ]
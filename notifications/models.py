@@ -1,3 +1,29 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class OutboxEvent(models.Model):
+    class EventType(models.TextChoices):
+        BORROW_CREATED = "borrow_created"
+        CHECKOUT_REQUESTED = "checkout_requested"
+        PAYMENT_PAID = "payment_paid"
+
+    event_type = models.CharField(choices=EventType.choices, max_length=50)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["available_at", "id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="outbox_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"ID: {self.pk}, {self.event_type}, attempts: {self.attempts}"
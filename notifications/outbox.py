@@ -0,0 +1,157 @@
+import logging
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Subquery
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from common.breaker import CircuitOpenError
+from notifications.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {
+    OutboxEvent.EventType.BORROW_CREATED: (
+        "notifications.telegram_services.notify_borrow_created"
+    ),
+    OutboxEvent.EventType.CHECKOUT_REQUESTED: (
+        "payments.payment_services.fill_checkout_session"
+    ),
+    OutboxEvent.EventType.PAYMENT_PAID: (
+        "notifications.telegram_services.notify_payment_paid"
+    ),
+}
+
+
+def publish_event(event_type: str, payload: dict) -> OutboxEvent:
+    """Record a side effect in the caller's transaction.
+
+    The event is handed to its handler by relay_outbox only if the
+    transaction commits, and it survives a crash right after the commit.
+    """
+    return OutboxEvent.objects.create(event_type=event_type, payload=payload)
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(2**attempts, settings.OUTBOX_MAX_RETRY_DELAY))
+
+
+def _record_failure(event: OutboxEvent, exc: Exception) -> None:
+    event.attempts += 1
+    event.last_error = repr(exc)
+    event.available_at = timezone.now() + _retry_delay(event.attempts)
+
+
+def _claim_batch(batch_size: int) -> tuple[list, datetime]:
+    """Lease a batch of due events to this relay in one short transaction.
+
+    Leased events are due again only at the end of the lease, so a relay
+    that dies mid-batch leaves them to the next one.
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=settings.OUTBOX_LEASE)
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(
+                processed_at__isnull=True,
+                available_at__lte=now,
+                attempts__lt=settings.OUTBOX_MAX_ATTEMPTS,
+            )
+            .order_by("available_at", "id")[:batch_size]
+        )
+        if events:
+            OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                available_at=lease_until
+            )
+    return events, lease_until
+
+
+def relay_outbox(batch_size: int = None) -> dict:
+    """Hand a batch of pending events to their handlers.
+
+    Events are claimed with SELECT ... FOR UPDATE SKIP LOCKED and leased
+    for OUTBOX_LEASE seconds, so relays running in parallel never pick the
+    same event. Handlers run outside any transaction and the outcomes are
+    recorded in a second short one, so no row lock is held while Stripe or
+    Telegram is called. Events whose lease ran out before their turn are
+    left for the next relay. A failed handler is retried with exponential
+    backoff until OUTBOX_MAX_ATTEMPTS is reached; the event then stays
+    unprocessed with its last error for inspection. With
+    BREAKER_OPEN_BEHAVIOR "defer", an event rejected by an open circuit
+    waits until the circuit may close without using up an attempt.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    events, lease_until = _claim_batch(batch_size)
+
+    processed, failed, deferred = [], [], []
+    for event in events:
+        if timezone.now() >= lease_until:
+            break
+        try:
+            import_string(HANDLERS[event.event_type])(**event.payload)
+        except CircuitOpenError as exc:
+            if settings.BREAKER_OPEN_BEHAVIOR == "defer":
+                event.last_error = str(exc)
+                event.available_at = datetime.fromtimestamp(
+                    exc.retry_at, dt_timezone.utc
+                )
+                deferred.append(event)
+            else:
+                _record_failure(event, exc)
+                failed.append(event)
+        except Exception as exc:
+            logger.exception("Outbox event %s failed", event.pk)
+            _record_failure(event, exc)
+            failed.append(event)
+        else:
+            processed.append(event.pk)
+
+    with transaction.atomic():
+        if processed:
+            OutboxEvent.objects.filter(pk__in=processed).update(
+                processed_at=timezone.now()
+            )
+        if failed or deferred:
+            OutboxEvent.objects.bulk_update(
+                failed + deferred, ["attempts", "last_error", "available_at"]
+            )
+
+    return {
+        "processed": len(processed),
+        "failed": len(failed),
+        "deferred": len(deferred),
+    }
+
+
+def purge_processed_events() -> int:
+    """Delete events processed more than OUTBOX_RETENTION seconds ago.
+
+    Rows are deleted OUTBOX_PURGE_CHUNK_SIZE at a time, one short
+    transaction per chunk.
+    """
+    processed_before = timezone.now() - timedelta(seconds=settings.OUTBOX_RETENTION)
+    purged = 0
+    while True:
+        chunk = OutboxEvent.objects.filter(processed_at__lt=processed_before).values(
+            "pk"
+        )[: settings.OUTBOX_PURGE_CHUNK_SIZE]
+        deleted, _ = OutboxEvent.objects.filter(pk__in=Subquery(chunk)).delete()
+        if not deleted:
+            break
+        purged += deleted
+    if purged:
+        logger.info("Purged %s processed outbox events", purged)
+    return purged
+
+
+def outbox_backlog() -> dict:
+    backlog = OutboxEvent.objects.filter(
+        processed_at__isnull=True, attempts__lt=settings.OUTBOX_MAX_ATTEMPTS
+    ).aggregate(pending=Count("id"), oldest=Min("created_at"))
+    oldest = backlog.pop("oldest")
+    backlog["lag"] = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return backlog
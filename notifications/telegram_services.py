@@ -1,7 +1,15 @@
 import os
-import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date
+from typing import Iterable, Iterator
+
+from django.conf import settings
 from dotenv import load_dotenv
+
 from borrow.models import Borrow
+from common.http import get_client
+from payments.models import Payment
+from payments.payment_services import payment_for_session
 
 
 load_dotenv()
@@ -9,7 +17,7 @@ load_dotenv()
 
 def send_borrow_created_message(instance: Borrow) -> None:
     bot_token = os.getenv("BOT_TOKEN")
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+    url = f"{settings.TELEGRAM_API_URL}/bot{bot_token}/sendMessage"
 
     payload = {
         "text": f"Created a new Borrow: \n\n"
@@ -36,26 +44,37 @@ def send_borrow_created_message(instance: Borrow) -> None:
         "content-type": "application/json",
     }
 
-    requests.post(url, json=payload, headers=headers)
+    get_client("telegram").post(url, json=payload, headers=headers).raise_for_status()
+
+
+def notify_borrow_created(borrow_id: int) -> None:
+    borrow = Borrow.objects.select_related("book", "user").get(pk=borrow_id)
+    send_borrow_created_message(borrow)
 
 
-def send_borrow_overdue_message(instance: Borrow) -> None:
+def notify_payment_paid(session_id: str) -> None:
+    payment = payment_for_session(session_id)
+    if payment is None:
+        raise Payment.DoesNotExist(f"No payment has session {session_id}")
+    borrow = payment.borrowing
+    send_messages(
+        [
+            f"Payment received: \n\n"
+            f"- Payment ID: {payment.id} ({payment.type}),\n"
+            f"- Amount: {payment.money_to_pay},\n"
+            f"- Borrow ID: {borrow.id},\n"
+            f"- Book title: {borrow.book.title},\n"
+            f"- User email: {borrow.user.email}"
+        ]
+    )
+
+
+def send_borrow_not_overdue_message() -> None:
     bot_token = os.getenv("BOT_TOKEN")
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+    url = f"{settings.TELEGRAM_API_URL}/bot{bot_token}/sendMessage"
 
     payload = {
-        "text": f"This Borrow is overdue: \n\n"
-        f"- Borrow ID: {instance.id},\n"
-        f"- Borrow create date: {instance.borrow_date},\n"
-        f"- Expected return date: {instance.expected_return_date},\n\n"
-        f"- Actual return date: {instance.actual_return_date},\n\n"
-        f"- Book ID: {instance.book.id},\n"
-        f"- Book title: {instance.book.title},\n"
-        f"- Book author: {instance.book.author},\n\n"
-        f"- User ID: {instance.user.id},\n"
-        f"- User email: {instance.user.email},\n"
-        f"- User first name: {instance.user.first_name},\n"
-        f"- User last name: {instance.user.last_name}",
+        "text": f"There are no overdue borrowings today.\n\n",
         "parse_mode": "",
         "disable_web_page_preview": False,
         "disable_notification": False,
@@ -69,26 +88,73 @@ def send_borrow_overdue_message(instance: Borrow) -> None:
         "content-type": "application/json",
     }
 
-    requests.post(url, json=payload, headers=headers)
+    get_client("telegram").post(url, json=payload, headers=headers).raise_for_status()
 
 
-def send_borrow_not_overdue_message() -> None:
-    bot_token = os.getenv("BOT_TOKEN")
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+TELEGRAM_MESSAGE_LIMIT = 4096
 
-    payload = {
-        "text": f"There are no overdue borrowings today.\n\n",
+
+def _message_payload(text: str) -> dict:
+    return {
+        "text": text,
         "parse_mode": "",
-        "disable_web_page_preview": False,
+        "disable_web_page_preview": True,
         "disable_notification": False,
-        "reply_to_message_id": None,
         "chat_id": os.getenv("TELEGRAM_CHAT_ID"),
     }
 
-    headers = {
-        "accept": "application/json",
-        "User-Agent": "Telegram Bot SDK - (https://github.com/irazasyed/telegram-bot-sdk)",
-        "content-type": "application/json",
-    }
 
-    requests.post(url, json=payload, headers=headers)
+def render_overdue_digests(
+    borrows: Iterable[Borrow], today: date = None, title: str = "Overdue borrows"
+) -> Iterator[str]:
+    """Render overdue borrows as digests of one line per borrow.
+
+    Each digest fits into a single Telegram message.
+    """
+    today = today or date.today()
+    header = f"{title} on {today}:\n\n"
+    digest = header
+    for borrow in borrows:
+        line = (
+            f"- Borrow {borrow.id}: {borrow.book.title} by {borrow.book.author} "
+            f"(book {borrow.book_id}), due {borrow.expected_return_date}, "
+            f"{(today - borrow.expected_return_date).days} days late, "
+            f"user {borrow.user.email} ({borrow.user_id})\n"
+        )
+        line = line[: TELEGRAM_MESSAGE_LIMIT - len(header)]
+        if len(digest) + len(line) > TELEGRAM_MESSAGE_LIMIT:
+            yield digest
+            digest = header
+        digest += line
+    if digest != header:
+        yield digest
+
+
+def send_messages(texts: Iterable[str]) -> int:
+    """Send messages over the pooled client, TELEGRAM_MAX_CONCURRENCY at a time.
+
+    Texts are consumed lazily, so a generator backed by a database cursor is
+    never read further ahead than the messages in flight.
+    """
+    url = f"{settings.TELEGRAM_API_URL}/bot{os.getenv('BOT_TOKEN')}/sendMessage"
+    concurrency = settings.TELEGRAM_MAX_CONCURRENCY
+    client = get_client("telegram")
+    sent = 0
+
+    with ThreadPoolExecutor(concurrency) as executor:
+
+        def send(text: str) -> None:
+            client.post(url, json=_message_payload(text)).raise_for_status()
+
+        in_flight = set()
+        for text in texts:
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                    sent += 1
+            in_flight.add(executor.submit(send, text))
+        for future in in_flight:
+            future.result()
+            sent += 1
+    return sent
@@ -1,18 +1,59 @@
 import datetime
 import os
+from datetime import timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 
 from book.models import Book
+from common.breaker import CircuitOpenError
 from borrow.models import Borrow
+from notifications.models import OutboxEvent
+from notifications.outbox import (
+    publish_event,
+    purge_processed_events,
+    relay_outbox,
+)
 from notifications.telegram_services import (
     send_borrow_created_message,
-    send_borrow_overdue_message,
     send_borrow_not_overdue_message,
 )
 
+handled_events = []
+handled_events_lock = threading.Lock()
+
+
+def record_event(number: int) -> None:
+    time.sleep(0.001)
+    with handled_events_lock:
+        handled_events.append(number)
+
+
+def record_transaction_state(number: int) -> None:
+    with handled_events_lock:
+        handled_events.append(connection.in_atomic_block)
+
+
+def fail_event(number: int) -> None:
+    raise RuntimeError(f"Event {number} failed")
+
+
+def circuit_open_event(number: int) -> None:
+    raise CircuitOpenError("telegram", time.time() + 30)
+
+
+TEST_HANDLERS = {
+    OutboxEvent.EventType.BORROW_CREATED: "notifications.tests.record_event",
+    OutboxEvent.EventType.CHECKOUT_REQUESTED: "notifications.tests.fail_event",
+}
+
 
 class SendMassageTest(APITestCase):
     def setUp(self):
@@ -39,7 +80,7 @@ class SendMassageTest(APITestCase):
             is_active=True,
         )
 
-    @mock.patch("notifications.telegram_services.requests.post")
+    @mock.patch("common.http.requests.Session.request")
     @mock.patch.dict(
         os.environ,
         {
@@ -51,14 +92,14 @@ class SendMassageTest(APITestCase):
         send_borrow_created_message(self.borrow)
         args, kwargs = mock_post.call_args
         mock_post.assert_called_once()
-        assert args[0] == "https://api.telegram.org/botTEST_TOKEN/sendMessage"
+        assert args == ("POST", "https://api.telegram.org/botTEST_TOKEN/sendMessage")
         assert kwargs["json"]["chat_id"] == "TEST_CHAT_ID"
         assert f"Borrow ID: {self.borrow.id}," in kwargs["json"]["text"]
         assert f"Book ID: {self.borrow.book.id}," in kwargs["json"]["text"]
         assert f"User ID: {self.borrow.user.id}," in kwargs["json"]["text"]
         assert f"Created a new Borrow" in kwargs["json"]["text"]
 
-    @mock.patch("notifications.telegram_services.requests.post")
+    @mock.patch("common.http.requests.Session.request")
     @mock.patch.dict(
         os.environ,
         {
@@ -66,29 +107,139 @@ class SendMassageTest(APITestCase):
             "TELEGRAM_CHAT_ID": "TEST_CHAT_ID",
         },
     )
-    def test_send_borrow_overdue_message_func(self, mock_post):
-        send_borrow_overdue_message(self.borrow)
+    def test_send_borrow_not_overdue_message_func(self, mock_post):
+        send_borrow_not_overdue_message()
         args, kwargs = mock_post.call_args
         mock_post.assert_called_once()
-        assert args[0] == "https://api.telegram.org/botTEST_TOKEN/sendMessage"
+        assert args == ("POST", "https://api.telegram.org/botTEST_TOKEN/sendMessage")
         assert kwargs["json"]["chat_id"] == "TEST_CHAT_ID"
-        assert f"Borrow ID: {self.borrow.id}," in kwargs["json"]["text"]
-        assert f"Book ID: {self.borrow.book.id}," in kwargs["json"]["text"]
-        assert f"User ID: {self.borrow.user.id}," in kwargs["json"]["text"]
-        assert f"This Borrow is overdue:" in kwargs["json"]["text"]
+        assert f"There are no overdue borrowings today." in kwargs["json"]["text"]
+
+
+@mock.patch.dict("notifications.outbox.HANDLERS", TEST_HANDLERS)
+class OutboxRelayTest(TestCase):
+    def setUp(self):
+        handled_events.clear()
+
+    def test_relay_hands_events_to_handlers_once(self):
+        for number in range(3):
+            publish_event(OutboxEvent.EventType.BORROW_CREATED, {"number": number})
+
+        self.assertEqual(relay_outbox(), {"processed": 3, "failed": 0, "deferred": 0})
+        self.assertEqual(relay_outbox(), {"processed": 0, "failed": 0, "deferred": 0})
+        self.assertEqual(handled_events, [0, 1, 2])
+        self.assertFalse(OutboxEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_failed_event_is_retried_later(self):
+        event = publish_event(OutboxEvent.EventType.CHECKOUT_REQUESTED, {"number": 1})
+
+        with self.assertLogs("notifications.outbox", level="ERROR"):
+            self.assertEqual(
+                relay_outbox(), {"processed": 0, "failed": 1, "deferred": 0}
+            )
+        self.assertEqual(relay_outbox(), {"processed": 0, "failed": 0, "deferred": 0})
+        event.refresh_from_db()
+        self.assertIsNone(event.processed_at)
+        self.assertEqual(event.attempts, 1)
+        self.assertIn("Event 1 failed", event.last_error)
 
-    @mock.patch("notifications.telegram_services.requests.post")
     @mock.patch.dict(
-        os.environ,
+        "notifications.outbox.HANDLERS",
+        {OutboxEvent.EventType.PAYMENT_PAID: "notifications.tests.circuit_open_event"},
+    )
+    def test_event_is_deferred_while_circuit_is_open(self):
+        event = publish_event(OutboxEvent.EventType.PAYMENT_PAID, {"number": 1})
+
+        self.assertEqual(relay_outbox(), {"processed": 0, "failed": 0, "deferred": 1})
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 0)
+        self.assertGreater(event.available_at, timezone.now() + timedelta(seconds=20))
+        self.assertIn("circuit is open", event.last_error)
+
+    @override_settings(BREAKER_OPEN_BEHAVIOR="fail_fast")
+    @mock.patch.dict(
+        "notifications.outbox.HANDLERS",
+        {OutboxEvent.EventType.PAYMENT_PAID: "notifications.tests.circuit_open_event"},
+    )
+    def test_event_fails_fast_while_circuit_is_open(self):
+        event = publish_event(OutboxEvent.EventType.PAYMENT_PAID, {"number": 1})
+
+        self.assertEqual(relay_outbox(), {"processed": 0, "failed": 1, "deferred": 0})
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 1)
+
+    @override_settings(OUTBOX_LEASE=0)
+    def test_events_past_their_lease_are_left_for_the_next_relay(self):
+        publish_event(OutboxEvent.EventType.BORROW_CREATED, {"number": 1})
+
+        self.assertEqual(relay_outbox(), {"processed": 0, "failed": 0, "deferred": 0})
+        self.assertEqual(handled_events, [])
+        event = OutboxEvent.objects.get()
+        self.assertIsNone(event.processed_at)
+        self.assertLessEqual(event.available_at, timezone.now())
+
+    @override_settings(OUTBOX_RETENTION=60, OUTBOX_PURGE_CHUNK_SIZE=2)
+    def test_purge_deletes_old_processed_events(self):
+        for number in range(4):
+            publish_event(OutboxEvent.EventType.BORROW_CREATED, {"number": number})
+        pending = publish_event(OutboxEvent.EventType.BORROW_CREATED, {"number": 4})
+        recent = OutboxEvent.objects.exclude(pk=pending.pk).last()
+        OutboxEvent.objects.exclude(pk__in=[pending.pk, recent.pk]).update(
+            processed_at=timezone.now() - timedelta(minutes=2)
+        )
+        OutboxEvent.objects.filter(pk=recent.pk).update(processed_at=timezone.now())
+
+        self.assertEqual(purge_processed_events(), 3)
+        self.assertEqual(
+            set(OutboxEvent.objects.values_list("pk", flat=True)),
+            {pending.pk, recent.pk},
+        )
+
+
+@mock.patch.dict("notifications.outbox.HANDLERS", TEST_HANDLERS)
+class OutboxRelayConcurrencyTest(TransactionTestCase):
+    events = 400
+    relays = 4
+
+    def setUp(self):
+        handled_events.clear()
+        OutboxEvent.objects.bulk_create(
+            OutboxEvent(
+                event_type=OutboxEvent.EventType.BORROW_CREATED,
+                payload={"number": number},
+            )
+            for number in range(self.events)
+        )
+
+    def _relay(self) -> int:
+        processed = 0
+        try:
+            while report := relay_outbox(batch_size=10):
+                if not report["processed"]:
+                    break
+                processed += report["processed"]
+        finally:
+            connection.close()
+        return processed
+
+    def test_parallel_relays_hand_off_every_event_exactly_once(self):
+        with ThreadPoolExecutor(max_workers=self.relays) as executor:
+            processed = list(executor.map(lambda _: self._relay(), range(self.relays)))
+
+        self.assertEqual(sum(processed), self.events)
+        self.assertEqual(sorted(handled_events), list(range(self.events)))
+        self.assertFalse(OutboxEvent.objects.filter(processed_at__isnull=True).exists())
+
+    @mock.patch.dict(
+        "notifications.outbox.HANDLERS",
         {
-            "BOT_TOKEN": "TEST_TOKEN",
-            "TELEGRAM_CHAT_ID": "TEST_CHAT_ID",
+            OutboxEvent.EventType.BORROW_CREATED: (
+                "notifications.tests.record_transaction_state"
+            )
         },
     )
-    def test_send_borrow_not_overdue_message_func(self, mock_post):
-        send_borrow_not_overdue_message()
-        args, kwargs = mock_post.call_args
-        mock_post.assert_called_once()
-        assert args[0] == "https://api.telegram.org/botTEST_TOKEN/sendMessage"
-        assert kwargs["json"]["chat_id"] == "TEST_CHAT_ID"
-        assert f"There are no overdue borrowings today." in kwargs["json"]["text"]
+    def test_handlers_run_outside_a_transaction(self):
+        report = relay_outbox(batch_size=3)
+
+        self.assertEqual(report, {"processed": 3, "failed": 0, "deferred": 0})
+        self.assertEqual(handled_events, [False, False, False])
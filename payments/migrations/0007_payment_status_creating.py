@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "payments",
+            "0006_alter_payment_session_id_alter_payment_session_url_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="payment",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("creating", "Creating"),
+                    ("pending", "Pending"),
+                    ("paid", "Paid"),
+                ],
+                default="pending",
+                max_length=20,
+            ),
+        ),
+    ]
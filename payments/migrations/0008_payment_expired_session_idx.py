@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:22
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("payments", "0007_payment_status_creating"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="payment",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("creating", "Creating"),
+                    ("pending", "Pending"),
+                    ("paid", "Paid"),
+                    ("expired", "Expired"),
+                ],
+                default="pending",
+                max_length=20,
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(fields=["session_id"], name="payment_session_idx"),
+        ),
+    ]
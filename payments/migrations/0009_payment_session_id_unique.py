@@ -0,0 +1,56 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:25
+
+from django.contrib.postgres.operations import RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("payments", "0008_payment_expired_session_idx"),
+    ]
+
+    operations = [
+        # Payments never sent to Stripe must not collide on an empty id.
+        migrations.RunSQL(
+            "UPDATE payments_payment SET session_id = NULL WHERE session_id = ''",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="session_id",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        # Build the unique index without blocking writes, then attach it
+        # as the constraint.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name="payment",
+                    constraint=models.UniqueConstraint(
+                        fields=("session_id",), name="payment_session_id_uniq"
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    "CREATE UNIQUE INDEX CONCURRENTLY payment_session_id_uniq "
+                    "ON payments_payment (session_id)",
+                    "DROP INDEX CONCURRENTLY IF EXISTS payment_session_id_uniq",
+                ),
+                migrations.RunSQL(
+                    "ALTER TABLE payments_payment ADD CONSTRAINT "
+                    "payment_session_id_uniq UNIQUE USING INDEX "
+                    "payment_session_id_uniq",
+                    "ALTER TABLE payments_payment DROP CONSTRAINT "
+                    "payment_session_id_uniq",
+                ),
+            ],
+        ),
+        RemoveIndexConcurrently(
+            model_name="payment",
+            name="payment_session_idx",
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("book", "0004_book_search"),
+        ("payments", "0011_payment_session_expires_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookStripePrice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("daily_fee", models.DecimalField(decimal_places=3, max_digits=6)),
+                ("product_id", models.CharField(max_length=255)),
+                ("price_id", models.CharField(max_length=255)),
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stripe_price",
+                        to="book.book",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0012_book_stripe_price"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReplacedCheckoutSession",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("session_id", models.CharField(max_length=255, unique=True)),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="replaced_sessions",
+                        to="payments.payment",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -1,11 +1,14 @@
 from django.db import models
+from book.models import Book
 from borrow.models import Borrow
 
 
 class Payment(models.Model):
     class StatusChoices(models.TextChoices):
+        CREATING = "creating"
         PENDING = "pending"
         PAID = "paid"
+        EXPIRED = "expired"
 
     class TypeChoices(models.TextChoices):
         PAYMENT = "payment"
@@ -21,8 +24,64 @@ class Payment(models.Model):
         Borrow, on_delete=models.CASCADE, related_name="payments"
     )
     session_url = models.TextField(null=True, blank=True)
-    session_id = models.TextField(null=True, blank=True)
+    session_id = models.CharField(max_length=255, null=True, blank=True)
+    session_expires_at = models.DateTimeField(null=True, blank=True)
     money_to_pay = models.DecimalField(max_digits=6, decimal_places=3)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["session_id"], name="payment_session_id_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["session_expires_at"],
+                name="payment_pending_expiry_idx",
+                condition=models.Q(status="pending"),
+            ),
+        ]
+
     def __str__(self):
         return f"ID: {self.pk}, borrow_id: {self.borrowing.id}, Money_to_pay: {self.money_to_pay}"
+
+
+class ReconciliationCheckpoint(models.Model):
+    """Where an interrupted Stripe reconciliation run resumes."""
+
+    name = models.CharField(max_length=50, unique=True)
+    created_gte = models.DateTimeField(null=True, blank=True)
+    starting_after = models.CharField(max_length=255, null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: after {self.starting_after}, finished {self.finished_at}"
+
+
+class BookStripePrice(models.Model):
+    """The Stripe Product of a book and its Price for the current daily fee."""
+
+    book = models.OneToOneField(
+        Book, on_delete=models.CASCADE, related_name="stripe_price"
+    )
+    daily_fee = models.DecimalField(max_digits=6, decimal_places=3)
+    product_id = models.CharField(max_length=255)
+    price_id = models.CharField(max_length=255)
+
+    def __str__(self):
+        return f"book_id: {self.book_id}, daily_fee: {self.daily_fee}, {self.price_id}"
+
+
+class ReplacedCheckoutSession(models.Model):
+    """A Checkout session of a payment that a renewed session replaced.
+
+    The customer may still pay it, its webhook then settles the payment.
+    """
+
+    payment = models.ForeignKey(
+        Payment, on_delete=models.CASCADE, related_name="replaced_sessions"
+    )
+    session_id = models.CharField(max_length=255, unique=True)
+
+    def __str__(self):
+        return f"payment_id: {self.payment_id}, {self.session_id}"
@@ -1,14 +1,77 @@
 import decimal
-import os
-from decimal import Decimal
+import logging
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from itertools import islice
 from typing import Callable
 
 import stripe
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Subquery
 from django.http import HttpRequest
 from django.urls import reverse
+from django.utils import timezone
 
+from book.models import Book
 from borrow.models import Borrow
-from payments.models import Payment
+from notifications.models import OutboxEvent
+from notifications.outbox import publish_event
+from payments.models import (
+    Payment,
+    ReconciliationCheckpoint,
+    ReplacedCheckoutSession,
+)
+from payments.pricing import FINE_MULTIPLIER
+from payments.stripe_prices import book_price_id
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_CHECKPOINT = "stripe_checkout_sessions"
+# A session paid just before it expired, or before it was renewed, still
+# settles the payment that holds it.
+UNPAID_STATUSES = (
+    Payment.StatusChoices.CREATING,
+    Payment.StatusChoices.PENDING,
+    Payment.StatusChoices.EXPIRED,
+)
+
+
+def _stale_session(now: datetime) -> Q:
+    """Pending payments whose Checkout session is no longer payable.
+
+    Sessions created before expiry times were stored have none; Stripe
+    expires sessions after a day at most, so they are treated as stale.
+    """
+    return Q(status=Payment.StatusChoices.PENDING) & (
+        Q(session_expires_at__lte=now)
+        | Q(session_expires_at__isnull=True, session_id__isnull=False)
+    )
+
+
+def _request_checkout(
+    payment: Payment,
+    request: HttpRequest,
+    type_of_payment: str | None,
+    replaces: str = None,
+) -> None:
+    success_url = (
+        request.build_absolute_uri(reverse("payment:success"))
+        + "?session_id={CHECKOUT_SESSION_ID}"
+    )
+    cancel_url = (
+        request.build_absolute_uri(reverse("payment:cancel"))
+        + "?session_id={CHECKOUT_SESSION_ID}"
+    )
+    payload = {
+        "payment_id": payment.pk,
+        "type_of_payment": type_of_payment,
+        "success_url": success_url,
+        "cancel_url": cancel_url,
+    }
+    if replaces:
+        payload["replaces"] = replaces
+    publish_event(OutboxEvent.EventType.CHECKOUT_REQUESTED, payload)
 
 
 def create_checkout_session(
@@ -16,37 +79,109 @@ def create_checkout_session(
     request: HttpRequest,
     type_of_payment: str,
     amount_to_pay: Callable[[Borrow], decimal],
-) -> str:
+) -> Payment:
+    """Create a payment for the borrow in the "creating" state.
+
+    The Stripe Checkout session is created by the outbox relay once the
+    surrounding transaction commits, see fill_checkout_session.
+    """
+    payment = Payment.objects.create(
+        borrowing=instance,
+        status=Payment.StatusChoices.CREATING,
+        money_to_pay=amount_to_pay(instance),
+    )
+    _request_checkout(payment, request, type_of_payment)
+    return payment
+
+
+def renew_checkout_session(payment: Payment, request: HttpRequest) -> bool:
+    """Queue a new Checkout session for a payment whose session expired.
+
+    Expired sessions are only replaced when a client asks to pay. Of
+    concurrent requests, the conditional UPDATE lets one queue the new
+    session. Returns False when the payment has no expired session.
+    """
+    with transaction.atomic():
+        renewed = Payment.objects.filter(
+            Q(status=Payment.StatusChoices.EXPIRED) | _stale_session(timezone.now()),
+            pk=payment.pk,
+        ).update(
+            status=Payment.StatusChoices.CREATING,
+            session_url=None,
+            session_expires_at=None,
+        )
+        if renewed:
+            # The type is read from the replaced session by the relay.
+            _request_checkout(payment, request, None, replaces=payment.session_id)
+    return bool(renewed)
+
+
+def _line_item(payment: Payment, book: Book) -> dict:
+    """Charge whole days at the book's cached Stripe Price.
+
+    Amounts that are not a whole number of days at the daily fee (int()
+    rounds them down) are sent as inline price_data.
+    """
+    if book.daily_fee:
+        quantity = payment.money_to_pay / book.daily_fee
+        if quantity > 0 and quantity == quantity.to_integral_value():
+            return {"price": book_price_id(book), "quantity": int(quantity)}
+    return {
+        "price_data": {
+            "currency": "usd",
+            "product_data": {
+                "name": f"{book.title} by {book.author}",
+            },
+            "unit_amount": int(payment.money_to_pay * 100),
+        },
+        "quantity": 1,
+    }
 
-    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-    amount_to_pay = amount_to_pay(instance)
+
+def fill_checkout_session(
+    payment_id: int,
+    type_of_payment: str | None,
+    success_url: str,
+    cancel_url: str,
+    replaces: str = None,
+) -> None:
+    payment = Payment.objects.select_related("borrowing__book").get(pk=payment_id)
+    if payment.status != Payment.StatusChoices.CREATING:
+        return
+    book = payment.borrowing.book
+    if type_of_payment is None:
+        replaced = stripe.checkout.Session.retrieve(replaces)
+        type_of_payment = (replaced.metadata or {}).get("type_of_payment", "pending")
+    idempotency_key = f"payment-{payment.pk}-checkout"
+    if replaces:
+        idempotency_key += f"-{replaces}"
 
     checkout_session = stripe.checkout.Session.create(
-        line_items=[
-            {
-                "price_data": {
-                    "currency": "usd",
-                    "product_data": {
-                        "name": f"{instance.book.title} by {instance.book.author}",
-                    },
-                    "unit_amount": amount_to_pay * 100,
-                },
-                "quantity": 1,
-            }
-        ],
+        line_items=[_line_item(payment, book)],
         metadata={"type_of_payment": type_of_payment},
         mode="payment",
-        success_url=request.build_absolute_uri(reverse("payment:success"))
-        + "?session_id={CHECKOUT_SESSION_ID}",
-        cancel_url=request.build_absolute_uri(reverse("payment:cancel"))
-        + "?session_id={CHECKOUT_SESSION_ID}",
-    )
-
-    create_payment(
-        instance=instance, strip_session=checkout_session, amount_to_pay=amount_to_pay
+        success_url=success_url,
+        cancel_url=cancel_url,
+        # A retried task gets the same session instead of a second one.
+        idempotency_key=idempotency_key,
     )
 
-    return checkout_session.url
+    with transaction.atomic():
+        filled = Payment.objects.filter(
+            pk=payment.pk, status=Payment.StatusChoices.CREATING
+        ).update(
+            status=Payment.StatusChoices.PENDING,
+            session_url=checkout_session.url,
+            session_id=checkout_session.id,
+            session_expires_at=datetime.fromtimestamp(
+                checkout_session.expires_at, dt_timezone.utc
+            ),
+        )
+        if filled and replaces:
+            # A late payment on the replaced session still finds the payment.
+            ReplacedCheckoutSession.objects.get_or_create(
+                session_id=replaces, defaults={"payment": payment}
+            )
 
 
 def total_amount(instance: Borrow) -> int:
@@ -56,36 +191,243 @@ def total_amount(instance: Borrow) -> int:
     return int(sum_for_pay)
 
 
-def set_status_paid(session_id: str) -> None:
-    payment = Payment.objects.get(session_id=session_id)
-    payment.status = "paid"
-    payment.type = "payment"
-    payment.save()
+def _mark_paid(session_id: str, payment_type: str) -> bool:
+    """Move an unpaid payment to paid in one UPDATE on the session index.
 
+    Returns False when the payment was already paid, so repeated deliveries
+    of the same Stripe event queue the follow-up work only once. Concurrent
+    deliveries wait on the row lock and re-check the status, so exactly one
+    of them applies the transition.
+    """
+    with transaction.atomic():
+        updated = Payment.objects.filter(
+            session_id=session_id, status__in=UNPAID_STATUSES
+        ).update(status=Payment.StatusChoices.PAID, type=payment_type)
+        if not updated:
+            # The customer paid a session that a renewal has replaced.
+            updated = Payment.objects.filter(
+                replaced_sessions__session_id=session_id, status__in=UNPAID_STATUSES
+            ).update(status=Payment.StatusChoices.PAID, type=payment_type)
+        if updated:
+            publish_event(
+                OutboxEvent.EventType.PAYMENT_PAID, {"session_id": session_id}
+            )
+    return bool(updated)
 
-def create_payment(
-    instance: Borrow,
-    strip_session: stripe.checkout.Session,
-    amount_to_pay: Decimal,
-) -> None:
-    Payment.objects.create(
-        borrowing=instance,
-        session_url=strip_session.url,
-        session_id=strip_session.id,
-        money_to_pay=amount_to_pay,
+
+def payment_for_session(session_id: str) -> Payment | None:
+    """The payment holding the session, or holding it before a renewal."""
+    payments = Payment.objects.select_related("borrowing__book", "borrowing__user")
+    return (
+        payments.filter(session_id=session_id).first()
+        or payments.filter(replaced_sessions__session_id=session_id).first()
     )
 
 
+def set_status_paid(session_id: str) -> bool:
+    return _mark_paid(session_id, Payment.TypeChoices.PAYMENT)
+
+
 def calculate_fine_amount(instance: Borrow) -> int:
-    fine_multiplier = 2
     delta = instance.actual_return_date - instance.expected_return_date
     count_days = delta.days
-    sum_for_pay = instance.book.daily_fee * count_days * fine_multiplier
+    sum_for_pay = instance.book.daily_fee * count_days * FINE_MULTIPLIER
     return int(sum_for_pay)
 
 
-def set_type_fine(session_id: str) -> None:
-    payment = Payment.objects.get(session_id=session_id)
-    payment.status = "paid"
-    payment.type = "fine"
-    payment.save()
+def set_type_fine(session_id: str) -> bool:
+    return _mark_paid(session_id, Payment.TypeChoices.FINE)
+
+
+def set_status_expired(session_id: str) -> bool:
+    return bool(
+        Payment.objects.filter(
+            session_id=session_id, status=Payment.StatusChoices.PENDING
+        ).update(status=Payment.StatusChoices.EXPIRED, session_url=None)
+    )
+
+
+def expire_stale_sessions() -> int:
+    """Mark pending payments whose Checkout session has expired.
+
+    Stale payments are found on the partial index of pending expiry times
+    and updated PAYMENT_EXPIRE_CHUNK_SIZE at a time, one UPDATE and one
+    short transaction per chunk. The session URL is dropped; a new session
+    is created only when the client asks to pay, see renew_checkout_session.
+    """
+    now = timezone.now()
+    chunk_size = settings.PAYMENT_EXPIRE_CHUNK_SIZE
+    expired = 0
+    while True:
+        stale = Payment.objects.filter(_stale_session(now)).order_by(
+            "session_expires_at"
+        )[:chunk_size]
+        # The status is checked again, a webhook may have paid a stale row.
+        updated = Payment.objects.filter(
+            pk__in=Subquery(stale.values("pk")),
+            status=Payment.StatusChoices.PENDING,
+        ).update(status=Payment.StatusChoices.EXPIRED, session_url=None)
+        if not updated:
+            break
+        expired += updated
+    if expired:
+        logger.info("Expired %s stale checkout sessions", expired)
+    return expired
+
+
+CHECKOUT_PAID_EVENTS = (
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+)
+
+
+def handle_checkout_event(event: stripe.Event) -> bool:
+    """Apply a verified Stripe Checkout event to its payment.
+
+    Returns False when no payment has the session yet (the outbox relay may
+    not have stored it), so the webhook answers with an error and Stripe
+    redelivers the event later.
+    """
+    session = event["data"]["object"]
+    session_id = session["id"]
+    if event["type"] in CHECKOUT_PAID_EVENTS:
+        # A completed session with a delayed payment method is paid later,
+        # with checkout.session.async_payment_succeeded.
+        if session["payment_status"] != "paid":
+            return True
+        type_of_payment = (session.get("metadata") or {}).get("type_of_payment")
+        if type_of_payment == "fine":
+            updated = set_type_fine(session_id)
+        else:
+            updated = set_status_paid(session_id)
+    elif event["type"] == "checkout.session.expired":
+        updated = set_status_expired(session_id)
+    else:
+        return True
+    # Expiry of a replaced session leaves its payment as it is.
+    return (
+        updated
+        or Payment.objects.filter(session_id=session_id).exists()
+        or ReplacedCheckoutSession.objects.filter(session_id=session_id).exists()
+    )
+
+
+def _settled_status(session) -> tuple | None:
+    """The status and type a session settles its payment to, None if open."""
+    if session["status"] == "expired":
+        return Payment.StatusChoices.EXPIRED, None
+    if session["payment_status"] == "paid":
+        type_of_payment = (session.get("metadata") or {}).get("type_of_payment")
+        if type_of_payment == "fine":
+            return Payment.StatusChoices.PAID, Payment.TypeChoices.FINE
+        return Payment.StatusChoices.PAID, Payment.TypeChoices.PAYMENT
+    return None
+
+
+def _settle_payments(sessions: list) -> dict:
+    settled = {
+        session["id"]: status
+        for session in sessions
+        if (status := _settled_status(session)) is not None
+    }
+    counts = {Payment.StatusChoices.PAID: 0, Payment.StatusChoices.EXPIRED: 0}
+    if not settled:
+        return counts
+
+    paid = [
+        session_id
+        for session_id, (status, _) in settled.items()
+        if status == Payment.StatusChoices.PAID
+    ]
+    with transaction.atomic():
+        # Paid sessions that a renewal replaced settle their payment too.
+        replaced = dict(
+            ReplacedCheckoutSession.objects.filter(session_id__in=paid).values_list(
+                "payment_id", "session_id"
+            )
+        )
+        # A webhook for one of these sessions waits on the row lock and then
+        # finds the payment settled, so it is settled only once.
+        payments = Payment.objects.select_for_update().filter(
+            Q(session_id__in=settled) | Q(pk__in=replaced),
+            status__in=UNPAID_STATUSES,
+        )
+        changed, events = [], []
+        for payment in payments:
+            session_id = replaced.get(payment.pk, payment.session_id)
+            status, payment_type = settled[session_id]
+            if status == Payment.StatusChoices.EXPIRED:
+                if payment.status != Payment.StatusChoices.PENDING:
+                    continue
+                payment.session_url = None
+            else:
+                payment.type = payment_type
+                events.append(
+                    OutboxEvent(
+                        event_type=OutboxEvent.EventType.PAYMENT_PAID,
+                        payload={"session_id": session_id},
+                    )
+                )
+            payment.status = status
+            changed.append(payment)
+            counts[status] += 1
+        Payment.objects.bulk_update(changed, ["status", "type", "session_url"])
+        OutboxEvent.objects.bulk_create(events)
+    return counts
+
+
+def reconcile_checkout_sessions() -> dict:
+    """Settle pending payments whose sessions were paid or expired at Stripe.
+
+    Covers payments whose webhook never arrived. Sessions created within
+    STRIPE_RECONCILE_LOOKBACK are listed newest first with auto-pagination
+    and every page is applied with one bulk_update. The last session of an
+    applied page is checkpointed, so an interrupted run resumes after it.
+    """
+    checkpoint, _ = ReconciliationCheckpoint.objects.get_or_create(
+        name=RECONCILE_CHECKPOINT
+    )
+    report = {"sessions": 0, "paid": 0, "expired": 0}
+    if checkpoint.starting_after is None:
+        created_gte = timezone.now() - timedelta(
+            seconds=settings.STRIPE_RECONCILE_LOOKBACK
+        )
+        # Sessions expired by expire_stale_sessions may have been paid late.
+        if not Payment.objects.filter(
+            Q(status=Payment.StatusChoices.PENDING)
+            | Q(
+                status=Payment.StatusChoices.EXPIRED,
+                session_expires_at__gte=created_gte,
+            )
+        ).exists():
+            return report
+        checkpoint.created_gte = created_gte
+    else:
+        logger.info(
+            "Resuming Stripe reconciliation after session %s",
+            checkpoint.starting_after,
+        )
+
+    page_size = settings.STRIPE_RECONCILE_PAGE_SIZE
+    params = {"created": {"gte": int(checkpoint.created_gte.timestamp())}}
+    if checkpoint.starting_after:
+        params["starting_after"] = checkpoint.starting_after
+    sessions = stripe.checkout.Session.list(limit=page_size, **params)
+    sessions = sessions.auto_paging_iter()
+
+    while page := list(islice(sessions, page_size)):
+        for status, count in _settle_payments(page).items():
+            report[status] += count
+        report["sessions"] += len(page)
+        checkpoint.starting_after = page[-1]["id"]
+        checkpoint.save(update_fields=["created_gte", "starting_after"])
+
+    checkpoint.starting_after = None
+    checkpoint.finished_at = timezone.now()
+    checkpoint.save(update_fields=["starting_after", "finished_at"])
+    logger.info(
+        "Reconciled %(sessions)s Stripe sessions: %(paid)s paid, "
+        "%(expired)s expired",
+        report,
+    )
+    return report
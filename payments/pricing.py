@@ -0,0 +1,74 @@
+from datetime import date
+
+from django.db.models import (
+    Count,
+    DateField,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    Func,
+    IntegerField,
+    QuerySet,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce, Floor, Greatest
+
+FINE_MULTIPLIER = 2
+MONEY = DecimalField(max_digits=12, decimal_places=3)
+QUOTE_TOTALS = ("rental_total", "fine", "total")
+
+
+class DaysBetween(Func):
+    """Whole days from ``start`` to ``end``, date minus date in PostgreSQL."""
+
+    arg_joiner = " - "
+    template = "(%(expressions)s)"
+    output_field = IntegerField()
+
+    def __init__(self, end, start, **extra):
+        super().__init__(end, start, **extra)
+
+
+def annotate_prices(queryset: QuerySet, today: date = None) -> QuerySet:
+    """Price every borrow of the queryset in SQL.
+
+    Adds rental_days, overdue_days, rental_total, fine and total. Fines of
+    active borrows are projected as if they were returned ``today``.
+    Amounts are rounded down to whole units, like total_amount and
+    calculate_fine_amount charge them.
+    """
+    today = today or date.today()
+    daily_fee = F("book__daily_fee")
+    returned_on = Coalesce(F("actual_return_date"), Value(today, DateField()))
+    return queryset.annotate(
+        rental_days=DaysBetween(F("expected_return_date"), F("borrow_date")),
+        overdue_days=Greatest(
+            DaysBetween(returned_on, F("expected_return_date")), Value(0)
+        ),
+        rental_total=Floor(
+            ExpressionWrapper(daily_fee * F("rental_days"), output_field=MONEY)
+        ),
+        fine=Floor(
+            ExpressionWrapper(
+                daily_fee * F("overdue_days") * FINE_MULTIPLIER, output_field=MONEY
+            )
+        ),
+        total=ExpressionWrapper(F("rental_total") + F("fine"), output_field=MONEY),
+    )
+
+
+def quote_totals(queryset: QuerySet) -> dict:
+    """Sum the prices of a queryset from annotate_prices in one query."""
+    # An aggregate cannot reuse the alias of the annotation it sums.
+    sums = queryset.order_by().aggregate(
+        borrows=Count("id"),
+        **{
+            f"sum_{name}": Coalesce(Sum(name), Value(0), output_field=MONEY)
+            for name in QUOTE_TOTALS
+        },
+    )
+    return {
+        "borrows": sums["borrows"],
+        **{name: sums[f"sum_{name}"] for name in QUOTE_TOTALS},
+    }
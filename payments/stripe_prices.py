@@ -0,0 +1,108 @@
+import logging
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+
+import stripe
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from book.models import Book
+from payments.models import BookStripePrice
+
+logger = logging.getLogger(__name__)
+
+
+class _PriceCache:
+    """In-process LRU of Stripe Price ids keyed by book and daily fee.
+
+    A changed daily fee is a new key, so stale prices are never served and
+    simply age out.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prices = OrderedDict()
+
+    def get(self, key: tuple) -> str | None:
+        with self._lock:
+            price_id = self._prices.get(key)
+            if price_id is not None:
+                self._prices.move_to_end(key)
+            return price_id
+
+    def set(self, key: tuple, price_id: str) -> None:
+        with self._lock:
+            self._prices[key] = price_id
+            self._prices.move_to_end(key)
+            while len(self._prices) > settings.STRIPE_PRICE_CACHE_SIZE:
+                self._prices.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._prices.clear()
+
+
+price_cache = _PriceCache()
+
+
+def _create_price(book: Book, stored: BookStripePrice | None) -> str:
+    """Create the book's Stripe Price, and its Product on first use.
+
+    Idempotency keys make concurrent workers end up with the same objects,
+    and a worker that loses the race to store them reads them back.
+    """
+    if stored is not None:
+        product_id = stored.product_id
+    else:
+        product_id = stripe.Product.create(
+            name=f"{book.title} by {book.author}",
+            metadata={"book_id": book.pk},
+            idempotency_key=f"book-{book.pk}-product",
+        ).id
+    price = stripe.Price.create(
+        product=product_id,
+        currency="usd",
+        unit_amount_decimal=str(book.daily_fee * 100),
+        idempotency_key=f"book-{book.pk}-price-{book.daily_fee}",
+    )
+    try:
+        with transaction.atomic():
+            BookStripePrice.objects.update_or_create(
+                book_id=book.pk,
+                defaults={
+                    "daily_fee": book.daily_fee,
+                    "product_id": product_id,
+                    "price_id": price.id,
+                },
+            )
+    except IntegrityError:
+        # Another worker stored the first price of the book meanwhile; with
+        # the same idempotency keys it got the same Stripe objects.
+        stored = BookStripePrice.objects.get(book_id=book.pk)
+        if stored.daily_fee == book.daily_fee:
+            return stored.price_id
+    logger.info("Created Stripe price %s for book %s", price.id, book.pk)
+    return price.id
+
+
+def book_price_id(book: Book) -> str:
+    """The Stripe Price id of one day of the book at its current daily fee.
+
+    Looked up in the process LRU, then in BookStripePrice, and created at
+    Stripe only when the book has no price yet or its daily fee changed.
+    The stored fee is compared on every miss, so fee changes made with
+    bulk updates are picked up as well.
+    """
+    key = (book.pk, Decimal(book.daily_fee))
+    price_id = price_cache.get(key)
+    if price_id is not None:
+        return price_id
+
+    stored = BookStripePrice.objects.filter(book_id=book.pk).first()
+    if stored is not None and stored.daily_fee == book.daily_fee:
+        price_id = stored.price_id
+    else:
+        price_id = _create_price(book, stored)
+    price_cache.set(key, price_id)
+    return price_id
@@ -1,30 +1,817 @@
+import copy
+import datetime
+import hashlib
+import hmac
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 from unittest import mock
 
+from book.models import Book
+from borrow.models import Borrow
+from common.fake_providers import FakeProviders
+from notifications.models import OutboxEvent
+from notifications.outbox import relay_outbox
+from payments.models import (
+    BookStripePrice,
+    Payment,
+    ReconciliationCheckpoint,
+    ReplacedCheckoutSession,
+)
+from payments.payment_services import (
+    calculate_fine_amount,
+    expire_stale_sessions,
+    fill_checkout_session,
+    payment_for_session,
+    reconcile_checkout_sessions,
+    set_status_paid,
+    total_amount,
+)
+from payments.pricing import annotate_prices, quote_totals
+from payments.stripe_prices import book_price_id, price_cache
 
 SUCCESS_URL = reverse("payment:success")
 CANCEL_URL = reverse("payment:cancel")
+WEBHOOK_URL = reverse("payment:webhook")
+PAYMENT_URL = reverse("payment:payment-list")
+PAYMENT_EXPORT_URL = reverse("payment:payment-export")
+WEBHOOK_SECRET = "whsec_test"
+
+
+def fake_stripe_event(
+    event_type: str,
+    session_id: str,
+    type_of_payment: str = "pending",
+    payment_status: str = "paid",
+    secret: str = WEBHOOK_SECRET,
+) -> tuple[bytes, str]:
+    """Build a Checkout event body and its Stripe-Signature header."""
+    payload = json.dumps(
+        {
+            "id": f"evt_{session_id}_{event_type}",
+            "object": "event",
+            "type": event_type,
+            "data": {
+                "object": {
+                    "id": session_id,
+                    "object": "checkout.session",
+                    "payment_status": payment_status,
+                    "metadata": {"type_of_payment": type_of_payment},
+                }
+            },
+        }
+    ).encode()
+    timestamp = int(time.time())
+    signature = hmac.new(
+        secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256
+    ).hexdigest()
+    return payload, f"t={timestamp},v1={signature}"
+
+
+def create_pending_payment() -> Payment:
+    return Payment.objects.create(
+        borrowing=Borrow.objects.create(
+            borrow_date=datetime.date(2025, 12, 16),
+            expected_return_date=datetime.date(2025, 12, 18),
+            book=Book.objects.create(
+                title="Title_book_1",
+                author="Author_book_1",
+                cover="hard",
+                inventory=3,
+                daily_fee=10,
+            ),
+            user=get_user_model().objects.create_user(
+                email="user_1@user.com",
+                password="password",
+            ),
+        ),
+        session_id="cs_test_1",
+        money_to_pay=20,
+    )
 
 
 class PaymentTest(APITestCase):
     def setUp(self):
         self.client = APIClient()
+        self.payment = create_pending_payment()
 
     @mock.patch("payments.views.stripe.checkout.Session.retrieve")
-    def test_payment_success_return_200(self, mock_retrieve):
-        session = mock.MagicMock()
-        session.customer = "cus_123"
-        session.__getitem__.return_value = {"metadata": {"type_of_payment": None}}
-        mock_retrieve.return_value = session
-        response = self.client.get(SUCCESS_URL, {"session_id": "test_session_id"})
+    def test_payment_success_renders_from_db_return_200(self, mock_retrieve):
+        Payment.objects.update(status=Payment.StatusChoices.PAID)
+        response = self.client.get(SUCCESS_URL, {"session_id": "cs_test_1"})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, "Payment of 20.000 is received")
+        mock_retrieve.assert_not_called()
 
     @mock.patch("payments.views.stripe.checkout.Session.retrieve")
     def test_payment_cancel_return_200(self, mock_retrieve):
-        session = mock.MagicMock()
-        session.customer = "cus_123"
-        mock_retrieve.return_value = session
-        response = self.client.get(CANCEL_URL, {"session_id": "test_session_id"})
+        response = self.client.get(CANCEL_URL, {"session_id": "cs_test_1"})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_retrieve.assert_not_called()
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.payment = create_pending_payment()
+
+    def post_event(self, payload: bytes, signature: str):
+        return self.client.post(
+            WEBHOOK_URL,
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=signature,
+        )
+
+    def test_completed_event_marks_payment_paid_once(self):
+        payload, signature = fake_stripe_event(
+            "checkout.session.completed", "cs_test_1"
+        )
+
+        with self.assertNumQueries(4):
+            res = self.post_event(payload, signature)
+        again = self.post_event(payload, signature)
+        self.payment.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PAID)
+        self.assertEqual(self.payment.type, Payment.TypeChoices.PAYMENT)
+        self.assertEqual(
+            OutboxEvent.objects.filter(
+                event_type=OutboxEvent.EventType.PAYMENT_PAID
+            ).count(),
+            1,
+        )
+
+    def test_completed_fine_event_sets_fine_type(self):
+        self.post_event(
+            *fake_stripe_event("checkout.session.completed", "cs_test_1", "fine")
+        )
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.type, Payment.TypeChoices.FINE)
+
+    def test_completed_event_with_unpaid_session_keeps_pending(self):
+        self.post_event(
+            *fake_stripe_event(
+                "checkout.session.completed", "cs_test_1", payment_status="unpaid"
+            )
+        )
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PENDING)
+
+    def test_expired_event_marks_payment_expired(self):
+        res = self.post_event(
+            *fake_stripe_event("checkout.session.expired", "cs_test_1")
+        )
+        self.payment.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.payment.status, Payment.StatusChoices.EXPIRED)
+
+    def test_late_completed_event_pays_expired_payment(self):
+        Payment.objects.update(status=Payment.StatusChoices.EXPIRED)
+        res = self.post_event(
+            *fake_stripe_event("checkout.session.completed", "cs_test_1")
+        )
+        self.payment.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PAID)
+
+    def test_unknown_session_returns_404_for_redelivery(self):
+        res = self.post_event(
+            *fake_stripe_event("checkout.session.completed", "cs_test_unknown")
+        )
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_signature_returns_400(self):
+        payload, _ = fake_stripe_event("checkout.session.completed", "cs_test_1")
+        _, signature = fake_stripe_event(
+            "checkout.session.completed", "cs_test_1", secret="whsec_other"
+        )
+        res = self.post_event(payload, signature)
+        self.payment.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PENDING)
+
+
+class PaymentListTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.book = Book.objects.create(
+            title="Title_book_1",
+            author="Author_book_1",
+            cover="hard",
+            inventory=3,
+            daily_fee=10,
+        )
+        self.user = get_user_model().objects.create_user(
+            email="user_1@user.com",
+            password="password",
+        )
+        self.other_user = get_user_model().objects.create_user(
+            email="user_2@user.com",
+            password="password",
+        )
+        self.payments = [
+            Payment.objects.create(
+                borrowing=Borrow.objects.create(
+                    borrow_date=datetime.date(2025, 12, 16),
+                    expected_return_date=datetime.date(2025, 12, 18),
+                    book=self.book,
+                    user=user,
+                ),
+                session_id=f"cs_test_{number}",
+                money_to_pay=20,
+            )
+            for number, user in enumerate(
+                (self.user, self.user, self.user, self.other_user)
+            )
+        ]
+        self.client.force_authenticate(user=self.user)
+
+    def test_user_sees_only_own_payments_by_pages_returns_200(self):
+        res = self.client.get(PAYMENT_URL, {"page_size": 2})
+        next_res = self.client.get(res.data["next"])
+
+        ids = [payment["id"] for payment in res.data["results"]]
+        ids += [payment["id"] for payment in next_res.data["results"]]
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(ids, [payment.id for payment in self.payments[2::-1]])
+        self.assertIsNone(next_res.data["next"])
+
+    def test_user_cannot_retrieve_other_user_payment_returns_404(self):
+        url = reverse("payment:payment-detail", args=[self.payments[3].id])
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_user_exports_only_own_payments_returns_200(self):
+        res = self.client.get(PAYMENT_EXPORT_URL)
+        rows = [
+            json.loads(line) for line in b"".join(res.streaming_content).splitlines()
+        ]
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["id"] for row in rows], [payment.id for payment in self.payments[:3]]
+        )
+        self.assertEqual(rows[0]["money_to_pay"], "20.000")
+
+
+class FillCheckoutSessionTest(APITestCase):
+    def setUp(self):
+        book = Book.objects.create(
+            title="Title_book_1",
+            author="Author_book_1",
+            cover="hard",
+            inventory=3,
+            daily_fee=10,
+        )
+        user = get_user_model().objects.create_user(
+            email="user_1@user.com",
+            password="password",
+        )
+        self.payment = Payment.objects.create(
+            borrowing=Borrow.objects.create(
+                borrow_date=datetime.date(2025, 12, 16),
+                expected_return_date=datetime.date(2025, 12, 18),
+                book=book,
+                user=user,
+            ),
+            status=Payment.StatusChoices.CREATING,
+            money_to_pay=20,
+        )
+
+    @mock.patch("payments.payment_services.book_price_id", return_value="price_1")
+    @mock.patch("payments.payment_services.stripe.checkout.Session.create")
+    def test_fill_checkout_session_sets_session_and_pending(
+        self, mock_create, mock_price_id
+    ):
+        mock_create.return_value = mock.Mock(
+            id="cs_test_1",
+            url="https://checkout.stripe.com/c/cs_test_1",
+            expires_at=1766102400,
+        )
+        fill_checkout_session(
+            self.payment.pk, "pending", "http://testserver/s", "http://testserver/c"
+        )
+        fill_checkout_session(
+            self.payment.pk, "pending", "http://testserver/s", "http://testserver/c"
+        )
+        self.payment.refresh_from_db()
+
+        mock_create.assert_called_once()
+        self.assertEqual(
+            mock_create.call_args.kwargs["line_items"],
+            [{"price": "price_1", "quantity": 2}],
+        )
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PENDING)
+        self.assertEqual(self.payment.session_id, "cs_test_1")
+        self.assertEqual(
+            self.payment.session_expires_at,
+            datetime.datetime(2025, 12, 19, tzinfo=datetime.timezone.utc),
+        )
+
+    @mock.patch("payments.payment_services.book_price_id")
+    @mock.patch("payments.payment_services.stripe.checkout.Session.create")
+    def test_partial_days_are_sent_as_price_data(self, mock_create, mock_price_id):
+        mock_create.return_value = mock.Mock(
+            id="cs_test_1", url="https://checkout.stripe.com/c/cs_test_1"
+        )
+        mock_create.return_value.expires_at = 1766102400
+        Payment.objects.update(money_to_pay=25)
+
+        fill_checkout_session(
+            self.payment.pk, "pending", "http://testserver/s", "http://testserver/c"
+        )
+
+        mock_price_id.assert_not_called()
+        line_item = mock_create.call_args.kwargs["line_items"][0]
+        self.assertEqual(line_item["price_data"]["unit_amount"], 2500)
+        self.assertEqual(line_item["quantity"], 1)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class BookStripePriceTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        price_cache.clear()
+        self.providers = FakeProviders()
+        self.providers.start()
+        self.addCleanup(self.providers.stop)
+        self.enterContext(mock.patch("stripe.api_base", self.providers.url))
+        self.enterContext(mock.patch("stripe.api_key", "sk_test"))
+        self.book = Book.objects.create(
+            title="Title_book_2",
+            author="Author_book_2",
+            cover="hard",
+            inventory=3,
+            daily_fee="1.255",
+        )
+
+    def test_price_is_created_once_and_cached(self):
+        price_id = book_price_id(self.book)
+
+        with self.assertNumQueries(0):
+            cached = book_price_id(self.book)
+        price_cache.clear()
+        with self.assertNumQueries(1):
+            stored = book_price_id(self.book)
+
+        self.assertEqual(cached, price_id)
+        self.assertEqual(stored, price_id)
+        self.assertEqual(self.providers.stats["stripe.prices.create 200"], 1)
+        self.assertEqual(self.providers.stats["stripe.products.create 200"], 1)
+        self.assertEqual(
+            self.providers.prices[price_id]["unit_amount_decimal"], "125.500"
+        )
+
+    def test_concurrent_first_price_is_read_back(self):
+        create_price = stripe.Price.create
+
+        def create_price_while_another_worker_stores_it(**params):
+            price = create_price(**params)
+            BookStripePrice.objects.create(
+                book=self.book,
+                daily_fee=self.book.daily_fee,
+                product_id=params["product"],
+                price_id=price.id,
+            )
+            return price
+
+        def create_after_missed_lookup(book_id, defaults):
+            return BookStripePrice.objects.create(book_id=book_id, **defaults)
+
+        with mock.patch.object(
+            stripe.Price, "create", create_price_while_another_worker_stores_it
+        ), mock.patch.object(
+            BookStripePrice.objects,
+            "update_or_create",
+            side_effect=create_after_missed_lookup,
+        ):
+            price_id = book_price_id(self.book)
+
+        self.assertEqual(BookStripePrice.objects.get().price_id, price_id)
+        self.assertEqual(self.providers.stats["stripe.prices.create 200"], 1)
+
+    def test_changed_daily_fee_gets_new_price_of_same_product(self):
+        price_id = book_price_id(self.book)
+        # Bulk updates bypass signals, the stored fee is compared instead.
+        Book.objects.filter(pk=self.book.pk).update(daily_fee=2)
+        self.book.refresh_from_db()
+
+        new_price_id = book_price_id(self.book)
+
+        self.assertNotEqual(new_price_id, price_id)
+        self.assertEqual(
+            self.providers.prices[new_price_id]["product"],
+            self.providers.prices[price_id]["product"],
+        )
+        stored = BookStripePrice.objects.get()
+        self.assertEqual((stored.price_id, stored.daily_fee), (new_price_id, 2))
+
+    def test_checkout_session_charges_days_at_book_price(self):
+        payment = create_pending_payment()
+        Payment.objects.update(status=Payment.StatusChoices.CREATING, session_id=None)
+
+        fill_checkout_session(
+            payment.pk, "pending", "http://testserver/s", "http://testserver/c"
+        )
+        payment.refresh_from_db()
+
+        session = self.providers.sessions[payment.session_id]
+        self.assertEqual(session["amount_total"], 2000)
+        self.assertEqual(BookStripePrice.objects.get().book, payment.borrowing.book)
+
+
+class ExpireStaleSessionsTest(APITestCase):
+    def setUp(self):
+        payment = create_pending_payment()
+        now = timezone.now()
+        Payment.objects.update(session_expires_at=now + datetime.timedelta(hours=1))
+        Payment.objects.bulk_create(
+            Payment(
+                borrowing=payment.borrowing,
+                session_id=f"cs_test_stale_{number}",
+                session_url=f"https://checkout.stripe.com/c/{number}",
+                session_expires_at=now - datetime.timedelta(hours=number - 2),
+                money_to_pay=20,
+            )
+            for number in range(5)
+        )
+
+    @override_settings(PAYMENT_EXPIRE_CHUNK_SIZE=2)
+    def test_stale_pending_sessions_expire_in_chunks(self):
+        Payment.objects.filter(session_id="cs_test_stale_4").update(
+            status=Payment.StatusChoices.PAID
+        )
+
+        with self.assertNumQueries(2):
+            expired = expire_stale_sessions()
+
+        self.assertEqual(expired, 2)
+        self.assertEqual(
+            dict(
+                Payment.objects.filter(
+                    status=Payment.StatusChoices.EXPIRED, session_url__isnull=True
+                ).values_list("session_id", "status")
+            ),
+            {"cs_test_stale_2": "expired", "cs_test_stale_3": "expired"},
+        )
+        self.assertEqual(
+            Payment.objects.filter(status=Payment.StatusChoices.PENDING).count(), 3
+        )
+
+    def test_pending_session_without_expiry_expires(self):
+        Payment.objects.filter(session_id="cs_test_1").update(session_expires_at=None)
+        Payment.objects.create(
+            borrowing=Payment.objects.first().borrowing,
+            status=Payment.StatusChoices.CREATING,
+            money_to_pay=20,
+        )
+
+        expire_stale_sessions()
+
+        self.assertEqual(
+            Payment.objects.get(session_id="cs_test_1").status,
+            Payment.StatusChoices.EXPIRED,
+        )
+        self.assertEqual(
+            Payment.objects.filter(status=Payment.StatusChoices.CREATING).count(), 1
+        )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class PayActionTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        price_cache.clear()
+        self.providers = FakeProviders()
+        self.providers.start()
+        self.addCleanup(self.providers.stop)
+        self.enterContext(mock.patch("stripe.api_base", self.providers.url))
+        self.enterContext(mock.patch("stripe.api_key", "sk_test"))
+
+        session = stripe.checkout.Session.create(
+            mode="payment", metadata={"type_of_payment": "fine"}
+        )
+        self.payment = create_pending_payment()
+        Payment.objects.update(
+            session_id=session.id,
+            session_url=session.url,
+            session_expires_at=timezone.now() + datetime.timedelta(hours=1),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.payment.borrowing.user)
+        self.url = reverse("payment:payment-pay", args=[self.payment.pk])
+
+    def test_live_session_is_returned_returns_200(self):
+        res = self.client.post(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["session_url"], Payment.objects.get().session_url)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_expired_session_is_renewed_once_returns_202(self):
+        old_session_id = Payment.objects.get().session_id
+        Payment.objects.update(session_expires_at=timezone.now())
+        expire_stale_sessions()
+
+        res = self.client.post(self.url)
+        again = self.client.post(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data["status"], Payment.StatusChoices.CREATING)
+        self.assertIsNone(res.data["session_url"])
+        self.assertEqual(again.status_code, status.HTTP_202_ACCEPTED)
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.payload["replaces"], old_session_id)
+
+        relay_outbox()
+        self.payment.refresh_from_db()
+        new_session = self.providers.sessions[self.payment.session_id]
+
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PENDING)
+        self.assertNotEqual(self.payment.session_id, old_session_id)
+        self.assertEqual(new_session["metadata"], {"type_of_payment": "fine"})
+        self.assertEqual(self.client.post(self.url).status_code, status.HTTP_200_OK)
+
+    @override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+    def test_late_payment_on_replaced_session_marks_paid(self):
+        old_session_id = Payment.objects.get().session_id
+        Payment.objects.update(session_expires_at=timezone.now())
+        self.client.post(self.url)
+        relay_outbox()
+
+        responses = [
+            self.client.post(
+                WEBHOOK_URL,
+                payload,
+                content_type="application/json",
+                HTTP_STRIPE_SIGNATURE=signature,
+            )
+            for payload, signature in (
+                fake_stripe_event("checkout.session.expired", old_session_id),
+                fake_stripe_event("checkout.session.completed", old_session_id, "fine"),
+            )
+        ]
+        self.payment.refresh_from_db()
+
+        self.assertEqual(
+            [res.status_code for res in responses],
+            [status.HTTP_200_OK, status.HTTP_200_OK],
+        )
+        self.assertNotEqual(self.payment.session_id, old_session_id)
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PAID)
+        self.assertEqual(self.payment.type, Payment.TypeChoices.FINE)
+        self.assertEqual(payment_for_session(old_session_id), self.payment)
+        self.assertEqual(
+            OutboxEvent.objects.get(
+                event_type=OutboxEvent.EventType.PAYMENT_PAID
+            ).payload,
+            {"session_id": old_session_id},
+        )
+
+    def test_session_without_expiry_is_renewed_returns_202(self):
+        Payment.objects.update(session_expires_at=None)
+
+        res = self.client.post(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertIsNone(res.data["session_url"])
+        self.assertTrue(OutboxEvent.objects.exists())
+
+    def test_paid_payment_returns_400(self):
+        Payment.objects.update(status=Payment.StatusChoices.PAID)
+
+        res = self.client.post(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_payment_returns_404(self):
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="user_2@user.com", password="password"
+            )
+        )
+
+        res = self.client.post(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PricingEngineTest(APITestCase):
+    def test_prices_match_per_instance_functions(self):
+        book = Book.objects.create(
+            title="Title_book_1",
+            author="Author_book_1",
+            cover="hard",
+            inventory=3,
+            daily_fee="1.255",
+        )
+        user = get_user_model().objects.create_user(
+            email="user_1@user.com", password="password"
+        )
+        today = datetime.date(2025, 12, 31)
+        expected = datetime.date(2025, 12, 20)
+        for borrow_days, returned_days in ((3, 7), (5, -2), (11, None), (1, 0)):
+            Borrow.objects.create(
+                borrow_date=expected - datetime.timedelta(days=borrow_days),
+                expected_return_date=expected,
+                actual_return_date=(
+                    None
+                    if returned_days is None
+                    else expected + datetime.timedelta(days=returned_days)
+                ),
+                book=book,
+                user=user,
+                is_active=returned_days is None,
+            )
+
+        quotes = annotate_prices(Borrow.objects.select_related("book"), today)
+        for borrow in quotes:
+            returned = copy.copy(borrow)
+            returned.actual_return_date = borrow.actual_return_date or today
+            fine = max(calculate_fine_amount(returned), 0)
+            self.assertEqual(borrow.rental_total, total_amount(borrow))
+            self.assertEqual(borrow.fine, fine)
+            self.assertEqual(borrow.total, total_amount(borrow) + fine)
+
+        self.assertEqual(
+            quote_totals(quotes),
+            {
+                "borrows": 4,
+                "rental_total": 23,
+                "fine": 44,
+                "total": 67,
+            },
+        )
+
+
+class PaymentTransitionConcurrencyTest(TransactionTestCase):
+    workers = 8
+
+    def setUp(self):
+        self.payment = create_pending_payment()
+
+    def test_concurrent_paid_deliveries_apply_once(self):
+        barrier = threading.Barrier(self.workers)
+
+        def deliver(_):
+            barrier.wait()
+            try:
+                return set_status_paid("cs_test_1")
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            applied = list(executor.map(deliver, range(self.workers)))
+        self.payment.refresh_from_db()
+
+        self.assertEqual(applied.count(True), 1)
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PAID)
+        self.assertEqual(
+            OutboxEvent.objects.filter(
+                event_type=OutboxEvent.EventType.PAYMENT_PAID
+            ).count(),
+            1,
+        )
+
+    def test_session_id_is_unique(self):
+        with self.assertRaises(IntegrityError):
+            Payment.objects.create(
+                borrowing=self.payment.borrowing,
+                session_id="cs_test_1",
+                money_to_pay=20,
+            )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    STRIPE_RECONCILE_PAGE_SIZE=2,
+)
+class ReconcileCheckoutSessionsTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        price_cache.clear()
+        self.providers = FakeProviders()
+        self.providers.start()
+        self.addCleanup(self.providers.stop)
+        self.enterContext(mock.patch("stripe.api_base", self.providers.url))
+        self.enterContext(mock.patch("stripe.api_key", "sk_test"))
+
+        borrowing = create_pending_payment().borrowing
+        Payment.objects.all().delete()
+        self.payments = []
+        for number in range(5):
+            session = stripe.checkout.Session.create(
+                mode="payment",
+                metadata={"type_of_payment": "fine" if number == 1 else "pending"},
+            )
+            self.payments.append(
+                Payment.objects.create(
+                    borrowing=borrowing, session_id=session.id, money_to_pay=20
+                )
+            )
+        self.settle(0, status="complete", payment_status="paid")
+        self.settle(1, status="complete", payment_status="paid")
+        self.settle(3, status="expired")
+
+    def settle(self, number: int, **fields):
+        self.providers.sessions[self.payments[number].session_id].update(fields)
+
+    def statuses(self) -> list:
+        return [
+            (payment.status, payment.type) for payment in Payment.objects.order_by("pk")
+        ]
+
+    def test_paid_and_expired_sessions_are_applied_in_bulk(self):
+        with self.assertNumQueries(25):
+            report = reconcile_checkout_sessions()
+
+        self.assertEqual(report, {"sessions": 5, "paid": 2, "expired": 1})
+        self.assertEqual(
+            self.statuses(),
+            [
+                (Payment.StatusChoices.PAID, Payment.TypeChoices.PAYMENT),
+                (Payment.StatusChoices.PAID, Payment.TypeChoices.FINE),
+                (Payment.StatusChoices.PENDING, None),
+                (Payment.StatusChoices.EXPIRED, None),
+                (Payment.StatusChoices.PENDING, None),
+            ],
+        )
+        self.assertEqual(
+            OutboxEvent.objects.filter(
+                event_type=OutboxEvent.EventType.PAYMENT_PAID
+            ).count(),
+            2,
+        )
+        self.assertEqual(self.providers.stats["stripe.checkout.sessions.list 200"], 3)
+        checkpoint = ReconciliationCheckpoint.objects.get()
+        self.assertIsNone(checkpoint.starting_after)
+        self.assertIsNotNone(checkpoint.finished_at)
+
+    def test_interrupted_run_resumes_after_checkpoint(self):
+        with mock.patch(
+            "payments.payment_services._settle_payments",
+            side_effect=[{"paid": 0, "expired": 1}, RuntimeError("worker killed")],
+        ):
+            with self.assertRaises(RuntimeError):
+                reconcile_checkout_sessions()
+        # Newest first: the first page held the two latest sessions.
+        self.assertEqual(
+            ReconciliationCheckpoint.objects.get().starting_after,
+            self.payments[3].session_id,
+        )
+
+        report = reconcile_checkout_sessions()
+
+        self.assertEqual(report, {"sessions": 3, "paid": 2, "expired": 0})
+        self.assertEqual(
+            [status for status, _ in self.statuses()][:3],
+            [Payment.StatusChoices.PAID, Payment.StatusChoices.PAID, "pending"],
+        )
+        self.assertIsNone(ReconciliationCheckpoint.objects.get().starting_after)
+
+    def test_paid_replaced_session_settles_its_payment(self):
+        renewed = self.payments[0]
+        ReplacedCheckoutSession.objects.create(
+            payment=renewed, session_id=renewed.session_id
+        )
+        Payment.objects.filter(pk=renewed.pk).update(session_id="cs_test_renewed")
+
+        report = reconcile_checkout_sessions()
+
+        self.assertEqual(report, {"sessions": 5, "paid": 2, "expired": 1})
+        self.assertEqual(
+            self.statuses()[0],
+            (Payment.StatusChoices.PAID, Payment.TypeChoices.PAYMENT),
+        )
+        self.assertTrue(
+            OutboxEvent.objects.filter(
+                payload={"session_id": renewed.session_id}
+            ).exists()
+        )
+
+    def test_nothing_pending_skips_stripe(self):
+        Payment.objects.update(status=Payment.StatusChoices.PAID)
+
+        report = reconcile_checkout_sessions()
+
+        self.assertEqual(report, {"sessions": 0, "paid": 0, "expired": 0})
+        self.assertNotIn("stripe.checkout.sessions.list 200", self.providers.stats)
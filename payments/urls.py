@@ -1,9 +1,16 @@
-from payments.views import success, cancel
-from django.urls import path
+from django.urls import path, include
+from rest_framework import routers
+
+from payments.views import PaymentViewSet, success, cancel, webhook
 
 app_name = "payment"
 
+router = routers.DefaultRouter()
+router.register("payments", PaymentViewSet, basename="payment")
+
 urlpatterns = [
+    path("", include(router.urls)),
     path("success/", success, name="success"),
     path("cancel/", cancel, name="cancel"),
+    path("webhook/", webhook, name="webhook"),
 ]
@@ -1,13 +1,26 @@
 import stripe
+from django.conf import settings
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render
 from drf_spectacular.utils import extend_schema
-from rest_framework import mixins
-from rest_framework.decorators import api_view
-from rest_framework.permissions import IsAuthenticated
+from rest_framework import mixins, status
+from rest_framework.decorators import (
+    action,
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
+from common.export import ExportMixin
 from payments.models import Payment
-from payments.payment_services import set_status_paid, set_type_fine
+from payments.payment_services import (
+    handle_checkout_event,
+    payment_for_session,
+    renew_checkout_session,
+)
 from payments.serializers import (
     PaymentListSerializer,
     PaymentRetrieveSerializer,
@@ -15,6 +28,7 @@ from payments.serializers import (
 
 
 class PaymentViewSet(
+    ExportMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     GenericViewSet,
@@ -23,11 +37,20 @@ class PaymentViewSet(
     serializer_class = PaymentListSerializer
     queryset = Payment.objects.all()
     permission_classes = (IsAuthenticated,)
+    export_filename = "payments"
+    export_fields = {
+        "id": "id",
+        "status": "status",
+        "type": "type",
+        "borrowing_id": "borrowing_id",
+        "session_id": "session_id",
+        "money_to_pay": "money_to_pay",
+    }
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        if self.action == "list" and not self.request.user.is_staff:
-            queryset = Payment.objects.filter(borrowing__user=self.request.user)
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(borrowing__user=self.request.user)
         return queryset
 
     def get_serializer_class(self):
@@ -35,23 +58,50 @@ class PaymentViewSet(
             return PaymentListSerializer
         return PaymentRetrieveSerializer
 
+    @extend_schema(
+        description=(
+            "Returns the payment with its Checkout session_url. An expired "
+            "session is replaced: the payment is answered with 202 in the "
+            "creating state until the new session_url is set."
+        ),
+        request=None,
+        responses={200: PaymentRetrieveSerializer, 202: PaymentRetrieveSerializer},
+    )
+    @action(
+        methods=[
+            "POST",
+        ],
+        detail=True,
+        url_path="pay",
+    )
+    def pay(self, request, pk=None):
+        payment = self.get_object()
+        if payment.status == Payment.StatusChoices.PAID:
+            raise ValidationError({"This payment": "Is already paid"})
+        if renew_checkout_session(payment, request):
+            payment.refresh_from_db()
+        if payment.status == Payment.StatusChoices.PENDING:
+            response_status = status.HTTP_200_OK
+        else:
+            response_status = status.HTTP_202_ACCEPTED
+        return Response(self.get_serializer(payment).data, status=response_status)
+
+
+def _payment_for_session(session_id: str | None) -> Payment | None:
+    if not session_id:
+        return None
+    return payment_for_session(session_id)
+
 
 @extend_schema(
     summary="Stripe success redirect",
-    description="Success page Stripe payment",
+    description="Success page Stripe payment, the status comes from the webhook",
     responses={200: None},
 )
 @api_view(["GET"])
 def success(request: HttpRequest) -> HttpResponse:
-    session_id = request.GET.get("session_id")
-    session = stripe.checkout.Session.retrieve(session_id)
-    customer = session.customer
-    type_of_payment = session["metadata"].get("type_of_payment")
-    if type_of_payment == "pending":
-        set_status_paid(session_id)
-    elif type_of_payment == "fine":
-        set_type_fine(session_id)
-    return render(request, "success.html", {"customer": customer})
+    payment = _payment_for_session(request.GET.get("session_id"))
+    return render(request, "success.html", {"payment": payment})
 
 
 @extend_schema(
@@ -61,7 +111,29 @@ def success(request: HttpRequest) -> HttpResponse:
 )
 @api_view(["GET"])
 def cancel(request: HttpRequest) -> HttpResponse:
-    session_id = request.GET.get("session_id")
-    session = stripe.checkout.Session.retrieve(session_id)
-    customer = session.customer
-    return render(request, "cancel.html", {"customer": customer})
+    payment = _payment_for_session(request.GET.get("session_id"))
+    return render(request, "cancel.html", {"payment": payment})
+
+
+@extend_schema(
+    summary="Stripe webhook",
+    description="Receives signed checkout.session.* events from Stripe",
+    request=None,
+    responses={200: None, 400: None, 404: None},
+)
+@api_view(["POST"])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def webhook(request: HttpRequest) -> Response:
+    try:
+        event = stripe.Webhook.construct_event(
+            request.body,
+            request.headers.get("Stripe-Signature", ""),
+            settings.STRIPE_WEBHOOK_SECRET,
+        )
+    except (ValueError, stripe.SignatureVerificationError):
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+
+    if not handle_checkout_event(event):
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    return Response(status=status.HTTP_200_OK)